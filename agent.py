@@ -1,6 +1,10 @@
 import json
+import time
+import uuid
 from typing import Dict, List, Optional, Any
 
+from langchain.memory import ConversationBufferMemory
+
 from chains import (
     greeting_chain, 
     extraction_chain, 
@@ -8,10 +12,9 @@ from chains import (
     knowledge_analysis_chain,
     question_preference_chain,
     select_question_chain,
-    evaluate_answer_chain,
-    memory
+    evaluate_answer_chain
 )
-from utils import retrieve_content, retrieve_questions, parse_json_safely
+from utils import retrieve_content, retrieve_questions, parse_json_safely, parse_bool
 from logger import (
     logger, 
     log_state_change, 
@@ -20,11 +23,17 @@ from logger import (
     log_json_result,
     log_error
 )
+from config import LEARNER_MODEL_ENABLED
+from learner_events import load_event_log
+from learner_model import LearnerModel
+from metrics import LEARNER_DECISIONS
+from seen_questions import load_seen_questions
+from tracing import span
 
 class EducationAgent:
     """Education Agent class that orchestrates the learning flow."""
     
-    def __init__(self):
+    def __init__(self, session_id: Optional[str] = None, learner_id: Optional[str] = None):
         self.state = "greeting"
         self.grade = None
         self.subject = None
@@ -37,13 +46,105 @@ class EducationAgent:
         self.current_answer = None
         self.knowledge_level = None
         self.asked_questions_this_topic = []
-        logger.info("EducationAgent initialized")
+        self.learner_model: Optional[LearnerModel] = None
+        self.current_question_id = None
+        self.question_asked_at = None
+        # This session's conversation; never shared with other sessions
+        self.memory = ConversationBufferMemory(return_messages=True)
+        self.session_id = session_id or uuid.uuid4().hex
+        self.learner_id = learner_id or self.session_id
+        # Questions asked in earlier sessions of the same learner are not asked again
+        self.seen = load_seen_questions(self.learner_id)
+        self.events = load_event_log()
+        if learner_id and self.events is not None:
+            self._resume(self.events.load_snapshot(learner_id))
+        logger.info("EducationAgent initialized with session %s", self.session_id)
+        
+    def _snapshot(self) -> Dict[str, Any]:
+        """The state a returning learner resumes from."""
+        return {
+            "state": self.state, "grade": self.grade, "subject": self.subject, "topic": self.topic,
+            "learning_path": self.learning_path, "next_topic": self.next_topic, "difficulty": self.difficulty,
+            "knowledge_level": self.knowledge_level, "current_question": self.current_question,
+            "current_answer": self.current_answer, "current_question_id": self.current_question_id,
+            "asked_questions_this_topic": self.asked_questions_this_topic,
+            "learner_model": self.learner_model.to_dict() if self.learner_model is not None else None,
+        }
+        
+    def _resume(self, snapshot: Optional[Dict[str, Any]]) -> None:
+        """Restore the state saved by a previous session of this learner."""
+        if not snapshot:
+            return
+        for field in ("state", "grade", "subject", "topic", "learning_path", "next_topic", "difficulty",
+                      "knowledge_level", "current_question", "current_answer", "current_question_id",
+                      "asked_questions_this_topic"):
+            setattr(self, field, snapshot.get(field, getattr(self, field)))
+        if snapshot.get("learner_model"):
+            self.learner_model = LearnerModel.from_dict(self.learning_path, snapshot["learner_model"])
+        logger.info("Resumed learner %s in state %s on topic %s", self.learner_id, self.state, self.topic)
+        
+    @staticmethod
+    def _prompt_questions(questions: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Questions as shown to the selection chain, without their store IDs."""
+        return [{key: value for key, value in q.items() if key != "id"} for q in questions]
+        
+    def _record_seen(self, questions: List[Dict[str, str]]) -> None:
+        """Log the question just asked and add it, if it came from the store, to the learner's seen set."""
+        ids = [q["id"] for q in questions if q.get("id") and q.get("question") == self.current_question]
+        self.current_question_id = ids[0] if ids else None
+        self.question_asked_at = time.time()
+        if self.events is not None:
+            self.events.record(self.learner_id, "question", session_id=self.session_id, topic=self.topic,
+                               difficulty=self.difficulty, question_id=self.current_question_id,
+                               question=self.current_question)
+        if self.seen is None:
+            return
+        try:
+            self.seen.add(ids)
+        except OSError as e:
+            log_error("Could not record seen question", e)
+        
+    def _next_practice(self, is_correct: bool) -> Dict[str, Any]:
+        """Knowledge level, next topic and difficulty after an answer."""
+        if LEARNER_MODEL_ENABLED:
+            if self.learner_model is None or self.learner_model.learning_path is not self.learning_path:
+                self.learner_model = LearnerModel(self.learning_path, self.topic, self.difficulty)
+            decision = self.learner_model.observe(is_correct, self.difficulty)
+            if not decision.consult_llm:
+                LEARNER_DECISIONS.labels(source="model").inc()
+                logger.debug("Learner model kept %s at %s: %s", decision.next_topic, decision.difficulty, decision.reason)
+                return {"knowledge_level": decision.knowledge_level, "next_topic": decision.next_topic,
+                        "difficulty": decision.difficulty}
+            logger.info("Asking for a knowledge analysis, learner model proposes %s at %s: %s",
+                        decision.next_topic, decision.difficulty, decision.reason)
+        
+        # Analyze knowledge again with updated chat history
+        LEARNER_DECISIONS.labels(source="llm").inc()
+        logger.debug("Re-analyzing user knowledge after answer")
+        analysis_result = knowledge_analysis_chain.run(
+            learning_path=json.dumps(self.learning_path),
+            chat_history=str(self.memory.chat_memory.messages)
+        )
+        log_json_result("Updated knowledge analysis", analysis_result)
+        analysis = parse_json_safely(analysis_result)
+        if self.learner_model is not None:
+            self.learner_model.align(analysis.get("next_topic"), analysis.get("difficulty"))
+        return analysis
         
     def process(self, user_input: str) -> str:
         """Process user input based on current state and return response."""
+        with span("agent.process", session_id=self.session_id, state=self.state) as turn:
+            response = self._process(user_input)
+            turn.set_attribute("next_state", self.state)
+            if self.events is not None:
+                self.events.save_snapshot(self.learner_id, self._snapshot())
+            return response
+        
+    def _process(self, user_input: str) -> str:
+        """Handle one turn for the current state; traced by process()."""
         
         log_user_input(user_input)
-        logger.debug(f"Current state: {self.state}")
+        logger.debug("Current state: %s", self.state)
         
         if self.state == "greeting":
             # Initial greeting or extracting grade/subject/topic
@@ -51,6 +152,7 @@ class EducationAgent:
                 # First interaction, just greet
                 logger.debug("First interaction, sending greeting")
                 response = greeting_chain.run(chat_history="")
+                self.memory.chat_memory.add_ai_message(response)
                 old_state = self.state
                 self.state = "extract_info"
                 log_state_change(old_state, self.state)
@@ -69,13 +171,13 @@ class EducationAgent:
                     self.topic = extracted_info.get("topic")
                     self.asked_questions_this_topic = []
                     
-                    logger.debug(f"Extracted info - Grade: {self.grade}, Subject: {self.subject}, Topic: {self.topic}")
+                    logger.debug("Extracted info - Grade: %s, Subject: %s, Topic: %s", self.grade, self.subject, self.topic)
                     
                     if self.grade and self.subject and self.topic:
                         # Retrieve content
                         logger.debug("Retrieving content from knowledge base")
                         self.content = retrieve_content(self.grade, self.subject, self.topic)
-                        logger.debug(f"Retrieved content: {self.content[:100]}...")
+                        logger.debug("Retrieved content: %s...", self.content[:100])
                         
                         # Plan learning path
                         logger.debug("Planning learning path")
@@ -88,7 +190,7 @@ class EducationAgent:
                             logger.debug("Analyzing user knowledge")
                             analysis_result = knowledge_analysis_chain.run(
                                 learning_path=json.dumps(self.learning_path),
-                                chat_history=str(memory.chat_memory.messages)
+                                chat_history=str(self.memory.chat_memory.messages)
                             )
                             log_json_result("Knowledge analysis", analysis_result)
                             
@@ -96,17 +198,17 @@ class EducationAgent:
                             self.knowledge_level = analysis.get("knowledge_level")
                             self.next_topic = analysis.get("next_topic")
                             if self.next_topic and self.topic and self.next_topic.lower() != self.topic.lower():
-                                logger.info(f"Topic changing from {self.topic} to {self.next_topic}. Resetting asked questions.")
+                                logger.info("Topic changing from %s to %s. Resetting asked questions.", self.topic, self.next_topic)
                                 self.asked_questions_this_topic = []
                                 self.topic = self.next_topic
                             self.difficulty = analysis.get("difficulty")
                             
-                            logger.debug(f"Knowledge level: {self.knowledge_level}, Next topic: {self.next_topic}, Difficulty: {self.difficulty}")
+                            logger.debug("Knowledge level: %s, Next topic: %s, Difficulty: %s", self.knowledge_level, self.next_topic, self.difficulty)
                             
                             # Directly retrieve and select authoritative question
                             logger.debug("Directly retrieving authoritative questions from database")
-                            questions = retrieve_questions(self.next_topic, self.difficulty)
-                            logger.debug(f"Retrieved {len(questions)} questions")
+                            questions = retrieve_questions(self.next_topic, self.difficulty, self.subject, self.grade, seen=self.seen)
+                            logger.debug("Retrieved %s questions", len(questions))
                             
                             if not questions:
                                 log_error("Failed to retrieve or generate any questions.", None)
@@ -118,7 +220,7 @@ class EducationAgent:
                             # Select the most appropriate question
                             logger.debug("Selecting the most appropriate question")
                             select_result = select_question_chain.run(
-                                questions=json.dumps(questions),
+                                questions=json.dumps(self._prompt_questions(questions)),
                                 user_level=self.knowledge_level,
                                 topic=self.next_topic,
                                 asked_questions=json.dumps(self.asked_questions_this_topic)
@@ -149,7 +251,9 @@ class EducationAgent:
                                 if self.current_question not in self.asked_questions_this_topic:
                                     self.asked_questions_this_topic.append(self.current_question)
                                 
-                                logger.debug(f"Selected question: {self.current_question}")
+                                self._record_seen(questions)
+                                
+                                logger.debug("Selected question: %s", self.current_question)
                                 
                                 # Present the question to the user
                                 old_state = self.state
@@ -168,6 +272,7 @@ class EducationAgent:
                                 if self.current_question not in self.asked_questions_this_topic and self.current_question != "Error: No question available.":
                                     self.asked_questions_this_topic.append(self.current_question)
                                 self.current_answer = fallback_question["answer"]
+                                self._record_seen(questions)
                                 
                                 old_state = self.state
                                 self.state = "await_answer"
@@ -204,13 +309,13 @@ class EducationAgent:
                 self.topic = extracted_info.get("topic")
                 self.asked_questions_this_topic = []
                 
-                logger.debug(f"Extracted info - Grade: {self.grade}, Subject: {self.subject}, Topic: {self.topic}")
+                logger.debug("Extracted info - Grade: %s, Subject: %s, Topic: %s", self.grade, self.subject, self.topic)
                 
                 if self.grade and self.subject and self.topic:
                     # Retrieve content
                     logger.debug("Retrieving content from knowledge base")
                     self.content = retrieve_content(self.grade, self.subject, self.topic)
-                    logger.debug(f"Retrieved content: {self.content[:100]}...")
+                    logger.debug("Retrieved content: %s...", self.content[:100])
                     
                     # Plan learning path
                     logger.debug("Planning learning path")
@@ -223,7 +328,7 @@ class EducationAgent:
                         logger.debug("Analyzing user knowledge")
                         analysis_result = knowledge_analysis_chain.run(
                             learning_path=json.dumps(self.learning_path),
-                            chat_history=str(memory.chat_memory.messages)
+                            chat_history=str(self.memory.chat_memory.messages)
                         )
                         log_json_result("Knowledge analysis", analysis_result)
                         
@@ -231,17 +336,17 @@ class EducationAgent:
                         self.knowledge_level = analysis.get("knowledge_level")
                         self.next_topic = analysis.get("next_topic")
                         if self.next_topic and self.topic and self.next_topic.lower() != self.topic.lower():
-                            logger.info(f"Topic changing from {self.topic} to {self.next_topic}. Resetting asked questions.")
+                            logger.info("Topic changing from %s to %s. Resetting asked questions.", self.topic, self.next_topic)
                             self.asked_questions_this_topic = []
                             self.topic = self.next_topic
                         self.difficulty = analysis.get("difficulty")
                         
-                        logger.debug(f"Knowledge level: {self.knowledge_level}, Next topic: {self.next_topic}, Difficulty: {self.difficulty}")
+                        logger.debug("Knowledge level: %s, Next topic: %s, Difficulty: %s", self.knowledge_level, self.next_topic, self.difficulty)
                         
                         # Directly retrieve and select authoritative question
                         logger.debug("Directly retrieving authoritative questions from database")
-                        questions = retrieve_questions(self.next_topic, self.difficulty)
-                        logger.debug(f"Retrieved {len(questions)} questions")
+                        questions = retrieve_questions(self.next_topic, self.difficulty, self.subject, self.grade, seen=self.seen)
+                        logger.debug("Retrieved %s questions", len(questions))
                         
                         if not questions:
                             log_error("Failed to retrieve or generate any questions.", None)
@@ -253,7 +358,7 @@ class EducationAgent:
                         # Select the most appropriate question
                         logger.debug("Selecting the most appropriate question")
                         select_result = select_question_chain.run(
-                            questions=json.dumps(questions),
+                            questions=json.dumps(self._prompt_questions(questions)),
                             user_level=self.knowledge_level,
                             topic=self.next_topic,
                             asked_questions=json.dumps(self.asked_questions_this_topic)
@@ -284,7 +389,9 @@ class EducationAgent:
                             if self.current_question not in self.asked_questions_this_topic:
                                 self.asked_questions_this_topic.append(self.current_question)
                             
-                            logger.debug(f"Selected question: {self.current_question}")
+                            self._record_seen(questions)
+                            
+                            logger.debug("Selected question: %s", self.current_question)
                             
                             # Present the question to the user
                             old_state = self.state
@@ -303,6 +410,7 @@ class EducationAgent:
                             if self.current_question not in self.asked_questions_this_topic and self.current_question != "Error: No question available.":
                                 self.asked_questions_this_topic.append(self.current_question)
                             self.current_answer = fallback_question["answer"]
+                            self._record_seen(questions)
                             
                             old_state = self.state
                             self.state = "await_answer"
@@ -328,9 +436,10 @@ class EducationAgent:
                 
         elif self.state == "await_answer":
             # Evaluate the user's answer
-            logger.debug(f"Evaluating user's answer to: {self.current_question}")
+            logger.debug("Evaluating user's answer to: %s", self.current_question)
             user_answer = user_input
             
+            evaluation_started = time.time()
             evaluation_result = evaluate_answer_chain.run(
                 question=self.current_question,
                 correct_answer=self.current_answer,
@@ -340,8 +449,15 @@ class EducationAgent:
             
             try:
                 evaluation = parse_json_safely(evaluation_result)
-                is_correct = evaluation.get('is_correct', False)
-                logger.debug(f"Evaluation result - Correct: {is_correct}")
+                is_correct = parse_bool(evaluation.get('is_correct', False))
+                logger.debug("Evaluation result - Correct: %s", is_correct)
+                if self.events is not None:
+                    self.events.record(
+                        self.learner_id, "answer", session_id=self.session_id, topic=self.topic,
+                        difficulty=self.difficulty, question_id=self.current_question_id, is_correct=is_correct,
+                        response_ms=(time.time() - self.question_asked_at) * 1000 if self.question_asked_at else None,
+                        evaluation_ms=(time.time() - evaluation_started) * 1000, answer=user_answer
+                    )
                 
                 # Provide feedback
                 feedback = f"""Evaluation result:
@@ -360,30 +476,23 @@ Improvement tips: {evaluation.get('tips_for_improvement')}
                 self.state = "determine_next"
                 log_state_change(old_state, self.state)
                 
-                # Analyze knowledge again with updated chat history
-                logger.debug("Re-analyzing user knowledge after answer")
-                analysis_result = knowledge_analysis_chain.run(
-                    learning_path=json.dumps(self.learning_path),
-                    chat_history=str(memory.chat_memory.messages)
-                )
-                log_json_result("Updated knowledge analysis", analysis_result)
-                
                 try:
-                    analysis = parse_json_safely(analysis_result)
+                    # The learner model decides locally; the LLM is asked only on step transitions or when unsure
+                    analysis = self._next_practice(is_correct)
                     self.knowledge_level = analysis.get("knowledge_level")
                     self.next_topic = analysis.get("next_topic")
                     if self.next_topic and self.topic and self.next_topic.lower() != self.topic.lower():
-                        logger.info(f"Topic changing from {self.topic} to {self.next_topic}. Resetting asked questions.")
+                        logger.info("Topic changing from %s to %s. Resetting asked questions.", self.topic, self.next_topic)
                         self.asked_questions_this_topic = []
                         self.topic = self.next_topic
                     self.difficulty = analysis.get("difficulty")
                     
-                    logger.debug(f"Updated knowledge level: {self.knowledge_level}, Next topic: {self.next_topic}, Difficulty: {self.difficulty}")
+                    logger.debug("Updated knowledge level: %s, Next topic: %s, Difficulty: %s", self.knowledge_level, self.next_topic, self.difficulty)
                     
                     # Directly retrieve and select the next authoritative question
                     logger.debug("Directly retrieving next authoritative question")
-                    questions = retrieve_questions(self.next_topic, self.difficulty)
-                    logger.debug(f"Retrieved {len(questions)} questions for next round")
+                    questions = retrieve_questions(self.next_topic, self.difficulty, self.subject, self.grade, seen=self.seen)
+                    logger.debug("Retrieved %s questions for next round", len(questions))
 
                     if not questions:
                         log_error("Failed to retrieve or generate any questions for the next round.", None)
@@ -395,7 +504,7 @@ Improvement tips: {evaluation.get('tips_for_improvement')}
                     # Select the most appropriate question
                     logger.debug("Selecting the most appropriate next question")
                     select_result = select_question_chain.run(
-                        questions=json.dumps(questions),
+                        questions=json.dumps(self._prompt_questions(questions)),
                         user_level=self.knowledge_level,
                         topic=self.next_topic,
                         asked_questions=json.dumps(self.asked_questions_this_topic)
@@ -426,7 +535,8 @@ Improvement tips: {evaluation.get('tips_for_improvement')}
                         if self.current_question not in self.asked_questions_this_topic:
                             self.asked_questions_this_topic.append(self.current_question)
                         
-                        logger.debug(f"Selected next question: {self.current_question}")
+                        self._record_seen(questions)
+                        logger.debug("Selected next question: %s", self.current_question)
                         
                         # Present the next question to the user
                         old_state = self.state # Should be 'determine_next' before this block
@@ -445,6 +555,7 @@ Improvement tips: {evaluation.get('tips_for_improvement')}
                         if self.current_question not in self.asked_questions_this_topic and self.current_question != "Error: No question available.":
                             self.asked_questions_this_topic.append(self.current_question)
                         self.current_answer = fallback_question["answer"]
+                        self._record_seen(questions)
                         
                         old_state = self.state # Should be 'determine_next'
                         self.state = "await_answer"
@@ -482,7 +593,7 @@ Improvement tips: {evaluation.get('tips_for_improvement')}
         
         else:
             # Fallback
-            logger.warning(f"Unknown state encountered: {self.state}")
+            logger.warning("Unknown state encountered: %s", self.state)
             old_state = self.state
             self.state = "greeting"
             log_state_change(old_state, self.state)
@@ -1,10 +1,56 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, g, render_template, request, jsonify, Response
 from agent import EducationAgent
 from logger import logger
+from metrics import ACTIVE_SESSIONS, QUEUE_DEPTH, render_metrics
+from prometheus_client import CONTENT_TYPE_LATEST
+from config import SESSION_IDLE_TIMEOUT, WARMUP_ON_START
+import index_versions
+import warmup
 import os
+import threading
+import time
+import uuid
 
 app = Flask(__name__)
-agent = EducationAgent()
+
+# The learner_id cookie outlives sessions so seen questions follow the learner
+LEARNER_COOKIE_MAX_AGE = 365 * 24 * 3600
+
+# One agent per learner session, keyed by the session_id cookie
+agents = {}
+agents_last_seen = {}
+agents_lock = threading.Lock()
+
+def get_agent(session_id, learner_id=None):
+    """Return the agent for a session, creating it and evicting idle sessions as needed."""
+    now = time.time()
+    with agents_lock:
+        for sid, last_seen in list(agents_last_seen.items()):
+            if now - last_seen > SESSION_IDLE_TIMEOUT:
+                agents.pop(sid, None)
+                agents_last_seen.pop(sid, None)
+                ACTIVE_SESSIONS.dec()
+                logger.info("Evicted idle session %s", sid)
+        agent = agents.get(session_id)
+        if agent is None:
+            agent = EducationAgent(session_id=session_id, learner_id=learner_id)
+            agents[session_id] = agent
+            ACTIVE_SESSIONS.inc()
+        agents_last_seen[session_id] = now
+        return agent
+
+@app.before_request
+def swap_index():
+    """Switch to a rebuilt index between requests once the watcher has opened it."""
+    index_versions.apply_pending()
+    g.index_generation = index_versions.begin_request()
+
+@app.teardown_request
+def release_index(exc):
+    """Let a replaced index close once no request that started on it is left."""
+    generation = g.pop('index_generation', None)
+    if generation is not None:
+        index_versions.end_request(generation)
 
 @app.route('/')
 def index():
@@ -20,17 +66,44 @@ def chat():
     if not user_message:
         return jsonify({'error': 'No message provided'}), 400
     
-    logger.info(f"Received message: {user_message}")
-    try:
-        # Process the message using the agent
-        response = agent.process(user_message)
-        return jsonify({'response': response})
-    except Exception as e:
-        logger.error(f"Error processing message: {str(e)}", exc_info=True)
-        return jsonify({'error': str(e)}), 500
+    session_id = request.cookies.get('session_id') or uuid.uuid4().hex
+    learner_id = request.cookies.get('learner_id') or uuid.uuid4().hex
+    logger.info("Received message: %s", user_message)
+    with QUEUE_DEPTH.track_inprogress():
+        try:
+            # Process the message using the session's agent
+            response = jsonify({'response': get_agent(session_id, learner_id).process(user_message)})
+        except Exception as e:
+            logger.error("Error processing message: %s", e, exc_info=True)
+            return jsonify({'error': str(e)}), 500
+    response.set_cookie('session_id', session_id, httponly=True, samesite='Lax')
+    response.set_cookie('learner_id', learner_id, max_age=LEARNER_COOKIE_MAX_AGE, httponly=True, samesite='Lax')
+    return response
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: the worker is up and serving requests."""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: warm-up has loaded the models and vector store (always ready when warm-up is off)."""
+    state = warmup.status()
+    state['index'] = index_versions.status()
+    if warmup.is_ready() or not WARMUP_ON_START:
+        return jsonify(state)
+    return jsonify(state), 503
+
+@app.route('/metrics')
+def metrics():
+    """Expose Prometheus metrics."""
+    return Response(render_metrics(), content_type=CONTENT_TYPE_LATEST)
 
 if __name__ == '__main__':
     logger.info("Starting Education Assistant Web App")
     # Use environment variable for port if available (useful for deployment)
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=True) 
\ No newline at end of file
+    if WARMUP_ON_START:
+        warmup.start_warm_up()
+    index_versions.start_watcher()
+    app.run(host='0.0.0.0', port=port, debug=True) 
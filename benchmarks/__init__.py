@@ -0,0 +1 @@
+"""Performance benchmarks. Run each one from the repository root, e.g. `python -m benchmarks.logging_overhead`."""
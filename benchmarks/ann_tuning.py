@@ -0,0 +1,98 @@
+"""
+Recall/latency harness for HNSW index parameters.
+
+Builds a Chroma collection per (M, construction_ef) pair on a synthetic
+question bank, then sweeps search_ef and reports recall@k against exact
+brute-force ground truth together with query latency. Use it to pick an
+operating point for VECTOR_INDEX_DEFAULTS / VECTOR_INDEX_PARAMS as the bank
+grows past what exact search can serve.
+
+    python -m benchmarks.ann_tuning --docs 200000 --m 8 16 32 --construction-ef 100 200 \\
+        --search-ef 10 32 64 128 --csv ann_tuning.csv
+"""
+
+import argparse
+import csv
+import tempfile
+
+from chromadb.api.client import SharedSystemClient
+
+from benchmarks.common import (Timer, brute_force_topk, dir_size_mb, percentile_ms, recall_at_k,
+                               synthetic_corpus, synthetic_queries)
+from vector_backends import ChromaBackend
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--space", default="cosine", choices=["cosine", "l2", "ip"])
+    parser.add_argument("--m", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--construction-ef", type=int, nargs="+", default=[100, 200])
+    parser.add_argument("--search-ef", type=int, nargs="+", default=[10, 32, 64, 128, 256])
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--csv", help="Also write the results to this CSV file")
+    args = parser.parse_args()
+
+    ids, texts, metadatas, vectors = synthetic_corpus(args.docs, args.dim)
+    queries = synthetic_queries(vectors, args.queries)
+    with Timer() as exact:
+        truth_rows = brute_force_topk(vectors, queries, args.k)
+    truth = [[ids[row] for row in rows] for rows in truth_rows]
+    print(f"{args.docs} docs x {args.dim} dims, {args.queries} queries, k={args.k}, space={args.space}")
+    print(f"Exact NumPy search: {exact.seconds / args.queries * 1000:.3f} ms/query\n")
+    print(f"{'M':>4} {'c_ef':>5} {'s_ef':>5} {'build_s':>8} {'disk_mb':>8} {'recall':>7} {'p50_ms':>8} {'p95_ms':>8}")
+
+    rows = []
+    for m in args.m:
+        for construction_ef in args.construction_ef:
+            with tempfile.TemporaryDirectory() as tmp:
+                backend = ChromaBackend(tmp, "ann_tuning", {
+                    "hnsw:space": args.space,
+                    "hnsw:M": m,
+                    "hnsw:construction_ef": construction_ef,
+                    "hnsw:search_ef": args.search_ef[0],
+                })
+                with Timer() as build:
+                    for start in range(0, args.docs, args.batch_size):
+                        end = start + args.batch_size
+                        backend.add(ids[start:end], texts[start:end], metadatas[start:end],
+                                    vectors[start:end].tolist())
+                disk_mb = dir_size_mb(tmp)
+                for search_ef in args.search_ef:
+                    backend.set_search_ef(search_ef)
+                    # Reopen so the loaded HNSW index picks up the new search_ef
+                    del backend
+                    SharedSystemClient.clear_system_cache()
+                    backend = ChromaBackend(tmp, "ann_tuning")
+                    latencies, found = [], []
+                    for query in queries:
+                        with Timer() as t:
+                            hits = backend.query([query.tolist()], k=args.k)[0]
+                        latencies.append(t.seconds)
+                        found.append([hit[0] for hit in hits])
+                    row = {
+                        "M": m, "construction_ef": construction_ef, "search_ef": search_ef,
+                        "build_seconds": round(build.seconds, 2), "disk_mb": round(disk_mb, 1),
+                        "recall_at_k": round(recall_at_k(found, truth), 4),
+                        "p50_ms": round(percentile_ms(latencies, 50), 3),
+                        "p95_ms": round(percentile_ms(latencies, 95), 3),
+                    }
+                    rows.append(row)
+                    print(f"{m:>4} {construction_ef:>5} {search_ef:>5} {row['build_seconds']:>8} {row['disk_mb']:>8} "
+                          f"{row['recall_at_k']:>7} {row['p50_ms']:>8} {row['p95_ms']:>8}")
+                del backend
+                SharedSystemClient.clear_system_cache()
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"\nWrote {len(rows)} rows to {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
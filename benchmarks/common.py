@@ -0,0 +1,97 @@
+"""Shared helpers for the benchmark scripts."""
+
+import os
+import resource
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+DIFFICULTIES = ["easy", "medium", "hard"]
+
+
+def synthetic_corpus(n: int, dim: int = 384, topics: int = 200, spread: float = 0.8, seed: int = 0
+                     ) -> Tuple[List[str], List[str], List[Dict[str, str]], np.ndarray]:
+    """
+    Build a clustered synthetic question bank.
+
+    Each topic is a random unit-vector centre and its questions are noisy copies,
+    which is closer to real sentence embeddings than uniform random vectors.
+
+    Returns:
+        (ids, texts, metadatas, unit-normalized float32 vectors)
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((topics, dim)).astype(np.float32)
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    topic_of = rng.integers(0, topics, size=n)
+    vectors = centres[topic_of] + spread * rng.standard_normal((n, dim)).astype(np.float32) / np.sqrt(dim)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    difficulty_of = rng.integers(0, len(DIFFICULTIES), size=n)
+    ids = [f"q{i}" for i in range(n)]
+    texts = [f"Synthetic question {i} about topic {topic_of[i]}" for i in range(n)]
+    # "answer" is unique per document, like real answers and chunk parent IDs
+    metadatas = [{"type": "question", "topic": f"topic_{topic_of[i]}", "difficulty": DIFFICULTIES[difficulty_of[i]],
+                  "answer": f"Synthetic answer {i}"} for i in range(n)]
+    return ids, texts, metadatas, vectors.astype(np.float32)
+
+
+def synthetic_queries(vectors: np.ndarray, count: int, seed: int = 1) -> np.ndarray:
+    """Queries near existing vectors (a perturbed sample of the corpus)."""
+    rng = np.random.default_rng(seed)
+    picks = vectors[rng.integers(0, len(vectors), size=count)]
+    queries = picks + 0.05 * rng.standard_normal(picks.shape).astype(np.float32)
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+
+def brute_force_topk(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Exact top-k row indices by cosine similarity (vectors must be unit-normalized)."""
+    scores = queries @ vectors.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1)
+
+
+def recall_at_k(found: List[List[str]], truth: List[List[str]]) -> float:
+    """Mean fraction of the true top-k IDs present in each result list."""
+    hits = [len(set(f) & set(t)) / max(1, len(t)) for f, t in zip(found, truth)]
+    return float(np.mean(hits)) if hits else 0.0
+
+
+def percentile_ms(seconds: List[float], pct: float) -> float:
+    return float(np.percentile(np.asarray(seconds) * 1000.0, pct))
+
+
+def rss_mb() -> float:
+    """Current resident set size in MB (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB (Linux reports KB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def dir_size_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total / 1024 / 1024
+
+
+class Timer:
+    """Context manager recording elapsed seconds in `.seconds`."""
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._start
+        return False
@@ -0,0 +1,87 @@
+"""
+Query embedding throughput vs. concurrent sessions, with and without batching.
+
+Each simulated session is a thread embedding its own stream of distinct
+queries (so no cache is involved), either by calling the model directly or
+through EmbeddingBatcher. Reports queries per second, per-query latency and
+the mean batch size the batcher achieved.
+
+    python -m benchmarks.embedding_batching --sessions 1 4 16 32 --queries 50
+"""
+
+import argparse
+import threading
+
+from langchain_community.embeddings import HuggingFaceEmbeddings
+
+from benchmarks.common import Timer, percentile_ms
+from config import EMBEDDING_BATCH_MAX_SIZE, EMBEDDING_BATCH_MAX_WAIT_MS, EMBEDDING_MODEL
+from embedding_batcher import EmbeddingBatcher
+
+TOPICS = ["algebra", "geometry", "genetics", "photosynthesis", "mechanics", "poetry", "fractions",
+          "periodic table", "cell division", "grammar", "limits", "probability"]
+
+
+def run(embedder, sessions, queries_per_session):
+    latencies = [[] for _ in range(sessions)]
+
+    def session(index):
+        for i in range(queries_per_session):
+            text = f"{TOPICS[(index + i) % len(TOPICS)]} practice question {index}-{i}"
+            with Timer() as t:
+                embedder.embed_query(text)
+            latencies[index].append(t.seconds)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    with Timer() as total:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    flat = [seconds for per_session in latencies for seconds in per_session]
+    return len(flat) / total.seconds, flat
+
+
+class CountingEmbeddings:
+    """Pass-through recording how many texts each model call embedded."""
+
+    def __init__(self, base):
+        self.base = base
+        self.batch_sizes = []
+
+    def embed_documents(self, texts):
+        self.batch_sizes.append(len(texts))
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text):
+        self.batch_sizes.append(1)
+        return self.base.embed_query(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--queries", type=int, default=50, help="queries per session")
+    parser.add_argument("--max-batch-size", type=int, default=EMBEDDING_BATCH_MAX_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=EMBEDDING_BATCH_MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    model = HuggingFaceEmbeddings(model_name=args.model)
+    model.embed_documents(["warm up"])
+    print(f"{args.model}, {args.queries} queries per session, batches of up to {args.max_batch_size} "
+          f"or {args.max_wait_ms}ms\n")
+    print(f"{'sessions':>8} {'mode':<8} {'queries/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'mean batch':>10}")
+    for sessions in args.sessions:
+        for mode in ("direct", "batched"):
+            counting = CountingEmbeddings(model)
+            embedder = counting if mode == "direct" else EmbeddingBatcher(
+                counting, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+            throughput, latencies = run(embedder, sessions, args.queries)
+            mean_batch = sum(counting.batch_sizes) / max(1, len(counting.batch_sizes))
+            print(f"{sessions:>8} {mode:<8} {throughput:10.1f} {percentile_ms(latencies, 50):8.2f} "
+                  f"{percentile_ms(latencies, 95):8.2f} {mean_batch:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
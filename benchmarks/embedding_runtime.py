@@ -0,0 +1,94 @@
+"""
+Embedding runtimes compared: HuggingFaceEmbeddings (PyTorch) vs. ONNX Runtime.
+
+Every runtime is measured in a fresh interpreter so imports and model loading
+count towards cold start: time to import and load the model, time to the
+first vector, per-query latency, batched throughput and peak RSS. The ONNX
+runtimes need a model exported with export_onnx_model.py.
+
+    python -m benchmarks.embedding_runtime --queries 200 --threads 2
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+RUNTIMES = ["huggingface", "onnx", "onnx-int8"]
+
+QUERIES = ["algebra", "quadratic equations", "photosynthesis in plants", "Newton's laws of motion",
+           "What is the Pythagorean theorem?", "cell division and mitosis", "periodic table trends",
+           "Shakespeare's sonnets", "adding fractions with like denominators", "limits and continuity"]
+
+
+def measure(runtime: str, queries: int, threads: int, model: str, onnx_dir: str) -> dict:
+    """Run inside the child interpreter and return the measurements."""
+    import time
+    start = time.perf_counter()
+
+    if runtime == "huggingface":
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        embedder = HuggingFaceEmbeddings(model_name=model)
+    else:
+        from onnx_embeddings import OnnxEmbeddings
+        embedder = OnnxEmbeddings(onnx_dir, quantized=runtime == "onnx-int8", threads=threads)
+    loaded = time.perf_counter()
+    embedder.embed_query("warm up")
+    first = time.perf_counter()
+
+    from benchmarks.common import peak_rss_mb, percentile_ms
+    latencies = []
+    for i in range(queries):
+        query_start = time.perf_counter()
+        embedder.embed_query(f"{QUERIES[i % len(QUERIES)]} {i}")
+        latencies.append(time.perf_counter() - query_start)
+    batch = [f"{QUERIES[i % len(QUERIES)]} {i}" for i in range(64)]
+    batch_start = time.perf_counter()
+    embedder.embed_documents(batch)
+    batch_seconds = time.perf_counter() - batch_start
+    return {
+        "load_s": loaded - start,
+        "first_vector_s": first - start,
+        "p50_ms": percentile_ms(latencies, 50),
+        "p95_ms": percentile_ms(latencies, 95),
+        "batch_per_s": len(batch) / batch_seconds,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main():
+    from config import EMBEDDING_MODEL, EMBEDDING_ONNX_DIR, EMBEDDING_THREADS
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runtimes", nargs="+", default=RUNTIMES, choices=RUNTIMES)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=EMBEDDING_THREADS, help="onnxruntime intra-op threads")
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--onnx-dir", default=EMBEDDING_ONNX_DIR)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.queries, args.threads, args.model, args.onnx_dir)))
+        return 0
+
+    print(f"{args.model}, {args.queries} single queries, batch of 64, onnx threads={args.threads or 'auto'}\n")
+    print(f"{'runtime':<12} {'load s':>7} {'first s':>8} {'p50 ms':>8} {'p95 ms':>8} {'batch/s':>8} {'peak MB':>8}")
+    for runtime in args.runtimes:
+        child = subprocess.run(
+            [sys.executable, "-m", "benchmarks.embedding_runtime", "--child", runtime,
+             "--queries", str(args.queries), "--threads", str(args.threads),
+             "--model", args.model, "--onnx-dir", args.onnx_dir],
+            capture_output=True, text=True)
+        if child.returncode != 0:
+            print(f"{runtime:<12} failed: {child.stderr.strip().splitlines()[-1] if child.stderr.strip() else child.returncode}")
+            continue
+        # Log lines may share stdout with the result
+        result = json.loads(next(line for line in child.stdout.splitlines() if line.startswith("{")))
+        print(f"{runtime:<12} {result['load_s']:7.2f} {result['first_vector_s']:8.2f} {result['p50_ms']:8.2f} "
+              f"{result['p95_ms']:8.2f} {result['batch_per_s']:8.1f} {result['peak_rss_mb']:8.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Vector vs. BM25 vs. hybrid question retrieval on a small labeled query set.
+
+Every query is labeled with the topic its questions should come from. Each
+retrieval mode is run over the question bank loaded by data.py, reporting
+latency, precision@k (share of returned questions from the labeled topic),
+MRR and, for hybrid mode, how many queries skipped the embedding model.
+The query embedding cache is cleared before every query unless --warm is given.
+
+    python -m benchmarks.hybrid_retrieval --k 3
+"""
+
+import argparse
+
+from benchmarks.common import Timer, percentile_ms
+from data import initialize_vector_store
+from vector_store import embeddings, vector_store
+
+# (query, topic the retrieved questions should belong to)
+LABELED_QUERIES = [
+    ("geometry", "geometry"),
+    ("triangle angles", "geometry"),
+    ("area of a rectangle", "geometry"),
+    ("parallelogram diagonals", "geometry"),
+    ("right angle degrees", "geometry"),
+    ("shapes and polygons", "geometry"),
+    ("algebra", "algebra"),
+    ("quadratic equation", "algebra"),
+    ("solve for x", "algebra"),
+    ("factor the expression", "algebra"),
+    ("system of equations", "algebra"),
+    ("domain of a function", "algebra"),
+    ("genetics", "genetics"),
+    ("DNA bases", "genetics"),
+    ("genotype", "genetics"),
+    ("blood type inheritance", "genetics"),
+    ("dominant and recessive traits", "genetics"),
+    ("heredity", "genetics"),
+    ("addition", "addition"),
+    ("sum of two numbers", "addition"),
+    ("adding fractions", "addition"),
+    ("how many apples in total", "addition"),
+    ("counting toys sold", "addition"),
+    ("plus", "addition"),
+]
+
+MODES = ("vector", "lexical", "hybrid")
+
+
+def evaluate(mode, k, warm):
+    latencies, precisions, reciprocal_ranks = [], [], []
+    embedded = 0
+    for query, topic in LABELED_QUERIES:
+        if not warm:
+            embeddings.clear()
+        before = embeddings.stats()
+        with Timer() as t:
+            documents = vector_store.search_hybrid_many([query], k=k, wheres=[{"type": "question"}], mode=mode)[0]
+        latencies.append(t.seconds)
+        after = embeddings.stats()
+        embedded += (after["hits"] + after["misses"]) > (before["hits"] + before["misses"])
+        relevant = [doc.metadata.get("topic") == topic for doc in documents]
+        precisions.append(sum(relevant) / k)
+        reciprocal_ranks.append(next((1.0 / rank for rank, hit in enumerate(relevant, start=1) if hit), 0.0))
+    return {
+        "p50": percentile_ms(latencies, 50),
+        "p95": percentile_ms(latencies, 95),
+        "precision": sum(precisions) / len(precisions),
+        "mrr": sum(reciprocal_ranks) / len(reciprocal_ranks),
+        "lexical_share": 1 - embedded / len(LABELED_QUERIES) if mode == "hybrid" else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--warm", action="store_true", help="keep cached query embeddings between queries")
+    args = parser.parse_args()
+
+    initialize_vector_store()
+    print(f"{len(LABELED_QUERIES)} labeled queries, k={args.k}, "
+          f"{'warm' if args.warm else 'cold'} embedding cache\n")
+    for mode in MODES:
+        result = evaluate(mode, args.k, args.warm)
+        line = (f"{mode:<8} p50 {result['p50']:8.3f}ms  p95 {result['p95']:8.3f}ms  "
+                f"precision@{args.k} {result['precision']:.3f}  MRR {result['mrr']:.3f}")
+        if result["lexical_share"] is not None:
+            line += f"  answered lexically {result['lexical_share']:.0%}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Latency, cost and JSON parse failures of each chain on each model.
+
+Every chain in chains.ALL_CHAINS is run --calls times per model with a fixed
+sample input, against the local LLM stand-in (llm_standin.py, started
+in-process unless --base-url points elsewhere). For each chain and model the
+benchmark reports:
+- p50 and p95 latency
+- tokens per call
+- cost per 1000 calls from the returned usage and PRICES
+- the share of outputs that are not the JSON the chain must return
+
+With --escalate-to, each model is also run with escalation. Outputs that fail
+validation are rerun on the stronger model, and their latency and cost are
+counted. This shows whether a cheap model plus escalation beats the strong
+model alone.
+
+    python -m benchmarks.llm_routing --models gpt-4o-mini gpt-3.5-turbo gpt-4o --escalate-to gpt-4o
+    python -m benchmarks.llm_routing --chains extraction evaluate_answer --calls 50 --speed 0.2
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from langchain.chains import LLMChain
+from langchain_community.callbacks import get_openai_callback
+
+from benchmarks.common import percentile_ms
+from chains import ALL_CHAINS, create_llm, is_valid_output
+from llm_standin import StandIn, serve
+
+# USD per million (input, output) tokens; override or extend with --prices
+PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4": (30.00, 60.00),
+}
+
+LEARNING_PATH = {"learning_path": [
+    {"step": 1, "topic": "angles", "description": "Types of angles and how to measure them"},
+    {"step": 2, "topic": "triangles", "description": "Angle sums and classifying triangles"},
+]}
+SAMPLE_INPUTS = {
+    "greeting": {"chat_history": ""},
+    "extraction": {"user_input": "I want to learn middle school math geometry"},
+    "learning_path": {"content": "Middle school geometry covers angles, triangles, polygons, area and volume. "
+                                 "Students learn to measure angles, use the triangle angle sum and compute areas."},
+    "knowledge_analysis": {"learning_path": json.dumps(LEARNING_PATH),
+                           "chat_history": "AI: What is the sum of the interior angles of a triangle? Human: 180 degrees"},
+    "question_preference": {"next_topic": "triangles", "difficulty": "easy"},
+    "generate_questions": {"topic": "triangles", "difficulty": "medium"},
+    "select_question": {
+        "questions": json.dumps([
+            {"question": "What is the sum of the interior angles of a triangle?", "answer": "180 degrees"},
+            {"question": "How many degrees are in a right angle?", "answer": "90 degrees"},
+        ]),
+        "user_level": "beginner", "topic": "angles", "asked_questions": "[]",
+    },
+    "evaluate_answer": {"question": "How many degrees are in a right angle?", "correct_answer": "90 degrees",
+                        "user_answer": "It is 90 degrees"},
+}
+
+
+def cost(model, prompt_tokens, completion_tokens, prices):
+    input_price, output_price = prices.get(model, (0.0, 0.0))
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1e6
+
+
+def call(chain, inputs):
+    """One chain call: (seconds, output, prompt tokens, completion tokens)."""
+    with get_openai_callback() as usage:
+        start = time.perf_counter()
+        output = chain.run(**inputs)
+        seconds = time.perf_counter() - start
+    return seconds, output, usage.prompt_tokens, usage.completion_tokens
+
+
+def run(traced, model, escalate_to, calls, base_url, max_tokens, prices):
+    chain = LLMChain(llm=create_llm(model, max_tokens=max_tokens, api_base=base_url), prompt=traced.prompt)
+    stronger = (LLMChain(llm=create_llm(escalate_to, max_tokens=max_tokens, api_base=base_url), prompt=traced.prompt)
+                if escalate_to else None)
+    inputs = SAMPLE_INPUTS[traced.name]
+    latencies, total_cost, tokens, failures, escalations = [], 0.0, 0, 0, 0
+    for _ in range(calls):
+        seconds, output, prompt_tokens, completion_tokens = call(chain, inputs)
+        total_cost += cost(model, prompt_tokens, completion_tokens, prices)
+        tokens += prompt_tokens + completion_tokens
+        if traced.required_keys is not None and not is_valid_output(output, traced.required_keys):
+            if stronger is not None:
+                escalations += 1
+                more_seconds, output, prompt_tokens, completion_tokens = call(stronger, inputs)
+                seconds += more_seconds
+                total_cost += cost(escalate_to, prompt_tokens, completion_tokens, prices)
+                tokens += prompt_tokens + completion_tokens
+            if not is_valid_output(output, traced.required_keys):
+                failures += 1
+        latencies.append(seconds)
+    return {"p50_ms": percentile_ms(latencies, 50), "p95_ms": percentile_ms(latencies, 95),
+            "tokens": tokens / calls, "cost_per_1k": total_cost / calls * 1000,
+            "failure_rate": failures / calls, "escalation_rate": escalations / calls}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="+", default=["gpt-4o-mini", "gpt-3.5-turbo", "gpt-4o"])
+    parser.add_argument("--chains", nargs="+", default=[chain.name for chain in ALL_CHAINS],
+                        choices=[chain.name for chain in ALL_CHAINS])
+    parser.add_argument("--calls", type=int, default=20, help="calls per chain and model")
+    parser.add_argument("--escalate-to", help="also run each model with escalation to this model")
+    parser.add_argument("--max-tokens", type=int, help="completion token cap for every call")
+    parser.add_argument("--base-url", help="OpenAI-compatible endpoint; default: an in-process stand-in")
+    parser.add_argument("--speed", type=float, default=1.0, help="stand-in latency multiplier")
+    parser.add_argument("--prices", type=json.loads, default={},
+                        help='USD per million tokens as JSON, e.g. \'{"my-model": [0.2, 0.8]}\'')
+    args = parser.parse_args()
+
+    base_url = args.base_url
+    if not base_url:
+        server = serve(StandIn(speed=args.speed))
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    prices = dict(PRICES, **{model: tuple(price) for model, price in args.prices.items()})
+    chains = [chain for chain in ALL_CHAINS if chain.name in args.chains]
+    variants = [(model, None) for model in args.models]
+    if args.escalate_to:
+        variants += [(model, args.escalate_to) for model in args.models if model != args.escalate_to]
+
+    print(f"{args.calls} calls per chain and model against {base_url}")
+    print(f"{'chain':<20} {'model':<28} {'p50 ms':>8} {'p95 ms':>8} {'tokens':>7} {'$/1k calls':>11} "
+          f"{'invalid':>8} {'escalated':>9}")
+    for chain in chains:
+        for model, escalate_to in variants:
+            if escalate_to and chain.required_keys is None:
+                continue
+            result = run(chain, model, escalate_to, args.calls, base_url, args.max_tokens, prices)
+            label = f"{model} -> {escalate_to}" if escalate_to else model
+            print(f"{chain.name:<20} {label:<28} {result['p50_ms']:8.0f} {result['p95_ms']:8.0f} "
+                  f"{result['tokens']:7.0f} {result['cost_per_1k']:11.4f} {result['failure_rate']:8.1%} "
+                  f"{result['escalation_rate']:9.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+Interactive latency and batch throughput against a rate-limited provider, with and without the LLM scheduler.
+
+The local LLM stand-in (llm_standin.py) is started in-process with --rpm and
+--tpm limits per model. For --duration seconds two kinds of traffic share it:
+- interactive: --sessions learners, each answering a question every --think
+  seconds (one evaluate_answer call per answer)
+- batch: --batch-workers threads generating questions back to back (one
+  generate_questions call each time), like a question bank prefill
+
+Each workload is run twice:
+- direct: every call goes straight to the provider. The OpenAI client retries
+  429s itself, as the chains did before llm_client.py.
+- scheduled: calls go through an LLMScheduler with the same limits.
+  Interactive calls run in the interactive class and batch calls in the batch
+  class.
+
+Reports interactive p50/p95/p99 latency and failures, batch calls per
+second, and the number of 429s the stand-in returned.
+
+    python -m benchmarks.llm_scheduler
+    python -m benchmarks.llm_scheduler --rpm 60 --tpm 20000 --sessions 10 --duration 60
+"""
+
+import argparse
+import random
+import sys
+import threading
+import time
+
+from langchain.chains import LLMChain
+
+from benchmarks.common import percentile_ms
+from benchmarks.llm_routing import SAMPLE_INPUTS
+from chains import evaluate_answer_chain, generate_questions_chain
+from llm_client import LLMScheduler, pooled_clients
+from llm_standin import StandIn, serve
+
+
+def build_llm(model, base_url, scheduled):
+    from langchain.chat_models import ChatOpenAI
+    extra = dict(pooled_clients(base_url), max_retries=0) if scheduled else {}
+    return ChatOpenAI(model=model, temperature=0.0, openai_api_base=base_url, **extra)
+
+
+def run(model, base_url, standin, scheduler, args):
+    llm = build_llm(model, base_url, scheduler is not None)
+    interactive = LLMChain(llm=llm, prompt=evaluate_answer_chain.prompt)
+    batch = LLMChain(llm=llm, prompt=generate_questions_chain.prompt)
+    interactive_inputs, batch_inputs = SAMPLE_INPUTS["evaluate_answer"], SAMPLE_INPUTS["generate_questions"]
+    interactive_tokens = evaluate_answer_chain.estimate_tokens(interactive_inputs)
+    batch_tokens = generate_questions_chain.estimate_tokens(batch_inputs)
+    latencies, failures, batch_done = [], [0], [0]
+    lock = threading.Lock()
+    rate_limited = standin.rate_limited
+    end = time.monotonic() + args.duration
+
+    def call(chain, inputs, tokens, priority):
+        if scheduler is None:
+            return chain.run(**inputs)
+        return scheduler.call(model, tokens, lambda: chain.run(**inputs), priority)
+
+    def session(index):
+        rng = random.Random(index)
+        # Learners do not all start at once
+        time.sleep(rng.uniform(0, args.think))
+        while time.monotonic() < end:
+            start = time.perf_counter()
+            try:
+                call(interactive, interactive_inputs, interactive_tokens, "interactive")
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+            except Exception:
+                with lock:
+                    failures[0] += 1
+            time.sleep(rng.uniform(0.5, 1.5) * args.think)
+
+    def batch_worker():
+        while time.monotonic() < end:
+            try:
+                call(batch, batch_inputs, batch_tokens, "batch")
+                with lock:
+                    batch_done[0] += 1
+            except Exception:
+                time.sleep(0.1)
+
+    threads = ([threading.Thread(target=session, args=(i,)) for i in range(args.sessions)]
+               + [threading.Thread(target=batch_worker) for _ in range(args.batch_workers)])
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    return {"calls": len(latencies), "failures": failures[0],
+            "p50_ms": percentile_ms(latencies, 50) if latencies else float("nan"),
+            "p95_ms": percentile_ms(latencies, 95) if latencies else float("nan"),
+            "p99_ms": percentile_ms(latencies, 99) if latencies else float("nan"),
+            "batch_per_s": batch_done[0] / elapsed, "rate_limited": standin.rate_limited - rate_limited}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--rpm", type=float, default=120, help="stand-in requests per minute")
+    parser.add_argument("--tpm", type=float, default=60000, help="stand-in tokens per minute")
+    parser.add_argument("--sessions", type=int, default=6, help="interactive learners")
+    parser.add_argument("--think", type=float, default=5.0, help="mean seconds between a learner's answers")
+    parser.add_argument("--batch-workers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per mode")
+    parser.add_argument("--speed", type=float, default=0.2, help="stand-in latency multiplier")
+    parser.add_argument("--modes", nargs="+", default=["direct", "scheduled"], choices=["direct", "scheduled"])
+    args = parser.parse_args()
+
+    print(f"{args.sessions} learners (one answer per ~{args.think:.0f}s) and {args.batch_workers} batch workers "
+          f"for {args.duration:.0f}s per mode; limits {args.rpm:.0f} RPM, {args.tpm:.0f} TPM")
+    print(f"{'mode':<10} {'answers':>8} {'failed':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'batch/s':>8} {'429s':>6}")
+    for mode in args.modes:
+        # A fresh stand-in and scheduler per mode, so both start with full allowances
+        standin = StandIn(speed=args.speed, rpm=args.rpm, tpm=args.tpm)
+        server = serve(standin)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+        scheduler = LLMScheduler(args.rpm, args.tpm, limits={}) if mode == "scheduled" else None
+        result = run(args.model, base_url, standin, scheduler, args)
+        server.shutdown()
+        print(f"{mode:<10} {result['calls']:>8} {result['failures']:>7} {result['p50_ms']:8.0f} "
+              f"{result['p95_ms']:8.0f} {result['p99_ms']:8.0f} {result['batch_per_s']:8.2f} "
+              f"{result['rate_limited']:>6}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
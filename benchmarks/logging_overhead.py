@@ -0,0 +1,148 @@
+"""
+Per-turn logging overhead: the old synchronous pipeline versus the queue-based one.
+
+"before" reproduces the original setup: logger at DEBUG, a synchronous
+FileHandler plus console handler, and eagerly built f-strings.
+"after" uses the current logger.py pipeline: INFO level, lazy %-style
+arguments, a queue handler with a background writer and sampled JSON results.
+
+Only the time spent on the calling (request) thread is reported per turn; the
+time the background writer needs to drain the queue is reported separately.
+
+    python -m benchmarks.logging_overhead --turns 2000
+"""
+
+import argparse
+import logging
+import os
+import queue
+import tempfile
+import time
+from logging.handlers import QueueListener, RotatingFileHandler
+
+from config import LOG_FORMAT
+from logger import DeferredFormatQueueHandler, SamplingFilter
+
+# Representative payloads for one await_answer turn
+QUESTION = "In triangle ABC, angle C=90°, AB=5, AC=3, find the length of BC."
+EVALUATION_JSON = '{"is_correct": true, "feedback": "' + "Well reasoned. " * 40 + '"}'
+ANALYSIS_JSON = '{"knowledge_level": "intermediate", "next_topic": "geometry", "difficulty": "medium", "reasoning": "' + "x" * 800 + '"}'
+SELECTION_JSON = '{"selected_question": "' + QUESTION + '", "answer": "4", "reasoning": "' + "y" * 300 + '"}'
+RESPONSE = "Evaluation result:\n\n✓ Correct!\n\nFeedback: " + "Nice work. " * 30
+
+
+def eager_turn(log):
+    """The logging calls of one turn, written the way the code used to be."""
+    log.info(f"User input: {'BC is 4'}")
+    log.debug(f"Current state: {'await_answer'}")
+    log.debug(f"Evaluating user's answer to: {QUESTION}")
+    log.debug(f"Answer evaluation result: {EVALUATION_JSON[:500]}...")
+    log.debug(f"Evaluation result - Correct: {True}")
+    log.info(f"State transition: {'await_answer'} -> {'determine_next'}")
+    log.debug("Re-analyzing user knowledge after answer")
+    log.debug(f"Updated knowledge analysis result: {ANALYSIS_JSON[:500]}...")
+    log.debug(f"Updated knowledge level: {'intermediate'}, Next topic: {'geometry'}, Difficulty: {'medium'}")
+    log.debug(f"Retrieving questions for topic='{'geometry'}', difficulty='{'medium'}'")
+    log.info(f"Attempting to retrieve questions from vector store for topic='{'geometry'}', difficulty='{'medium'}'")
+    log.debug(f"Searching vector store for: {'geometry'}")
+    log.info(f"Found {3} potential questions in vector store")
+    log.debug(f"Final selected questions count: {3}")
+    log.debug(f"Next question selection result: {SELECTION_JSON}")
+    log.debug(f"Selected next question: {QUESTION}")
+    log.info(f"State transition: {'determine_next'} -> {'await_answer'}")
+    log.info(f"Agent response: {RESPONSE[:100]}...")
+
+
+def lazy_turn(log):
+    """The same calls in the current lazy style, with sampled JSON results."""
+    sampled = {"sampled": True}
+    log.info("User input: %s", "BC is 4")
+    log.debug("Current state: %s", "await_answer")
+    log.debug("Evaluating user's answer to: %s", QUESTION)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("%s result: %s...", "Answer evaluation", EVALUATION_JSON[:500], extra=sampled)
+    log.debug("Evaluation result - Correct: %s", True)
+    log.info("State transition: %s -> %s", "await_answer", "determine_next")
+    log.debug("Re-analyzing user knowledge after answer")
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("%s result: %s...", "Updated knowledge analysis", ANALYSIS_JSON[:500], extra=sampled)
+    log.debug("Updated knowledge level: %s, Next topic: %s, Difficulty: %s", "intermediate", "geometry", "medium")
+    log.debug("Retrieving questions for topic='%s', difficulty='%s'", "geometry", "medium")
+    log.info("Attempting to retrieve questions from vector store for topic='%s', difficulty='%s'", "geometry", "medium")
+    log.debug("Searching vector store for: %s", "geometry")
+    log.info("Found %s potential questions in vector store", 3)
+    log.debug("Final selected questions count: %s", 3)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("%s result: %s", "Next question selection", SELECTION_JSON, extra=sampled)
+    log.debug("Selected next question: %s", QUESTION)
+    log.info("State transition: %s -> %s", "determine_next", "await_answer")
+    log.info("Agent response: %s...", RESPONSE[:100])
+
+
+def build_before(log_dir):
+    log = logging.getLogger("bench.before")
+    log.setLevel(logging.DEBUG)
+    log.propagate = False
+    formatter = logging.Formatter(LOG_FORMAT)
+    console = logging.StreamHandler(open(os.devnull, "w"))
+    console.setLevel(logging.INFO)
+    file_handler = logging.FileHandler(os.path.join(log_dir, "before.log"), encoding="utf-8")
+    file_handler.setLevel(logging.DEBUG)
+    for handler in (console, file_handler):
+        handler.setFormatter(formatter)
+        log.addHandler(handler)
+    return log, None
+
+
+def build_after(log_dir, level, sample_rate):
+    log = logging.getLogger(f"bench.after.{logging.getLevelName(level).lower()}")
+    log.setLevel(level)
+    log.propagate = False
+    formatter = logging.Formatter(LOG_FORMAT)
+    console = logging.StreamHandler(open(os.devnull, "w"))
+    console.setLevel(logging.INFO)
+    file_handler = RotatingFileHandler(os.path.join(log_dir, "after.log"), maxBytes=10 * 1024 * 1024,
+                                       backupCount=2, encoding="utf-8")
+    file_handler.setLevel(level)
+    for handler in (console, file_handler):
+        handler.setFormatter(formatter)
+    log_queue = queue.Queue(maxsize=100000)
+    queue_handler = DeferredFormatQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+    log.addHandler(queue_handler)
+    listener = QueueListener(log_queue, console, file_handler, respect_handler_level=True)
+    listener.start()
+    return log, listener
+
+
+def run(label, log, listener, turn, turns):
+    start = time.perf_counter()
+    for _ in range(turns):
+        turn(log)
+    caller_seconds = time.perf_counter() - start
+    drain_start = time.perf_counter()
+    if listener is not None:
+        listener.stop()
+    drain_seconds = time.perf_counter() - drain_start
+    print(f"{label:<28} {caller_seconds / turns * 1e6:>10.1f} us/turn on request thread"
+          f"   (background drain {drain_seconds * 1000:.1f} ms total)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--sample-rate", type=float, default=0.1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        print(f"Simulating {args.turns} turns of logging\n")
+        log, listener = build_before(log_dir)
+        run("before (sync, DEBUG, eager)", log, listener, eager_turn, args.turns)
+        log, listener = build_after(log_dir, logging.INFO, args.sample_rate)
+        run("after (queue, INFO, lazy)", log, listener, lazy_turn, args.turns)
+        log, listener = build_after(log_dir, logging.DEBUG, args.sample_rate)
+        run("after (queue, DEBUG, lazy)", log, listener, lazy_turn, args.turns)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Quantized NumPy vector storage vs. the float32 baseline.
+
+Loads the same synthetic question bank into a NumpyBackend for every storage
+variant (float32, and int8 with and without exact float32 rescoring) and
+reports on-disk size, resident memory after querying, query latency and
+recall@k against exact brute-force search.
+
+    python -m benchmarks.quantization --docs 200000 --queries 300 --k 10
+"""
+
+import argparse
+import gc
+import tempfile
+
+from benchmarks.common import (Timer, brute_force_topk, dir_size_mb, percentile_ms, recall_at_k, rss_mb,
+                               synthetic_corpus, synthetic_queries)
+from vector_backends import NumpyBackend
+
+VARIANTS = [
+    ("float32", "none", True),
+    ("int8+rescore", "int8", True),
+    ("int8", "int8", False),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    ids, texts, metadatas, vectors = synthetic_corpus(args.docs, args.dim)
+    queries = synthetic_queries(vectors, args.queries)
+    truth = [[ids[i] for i in row] for row in brute_force_topk(vectors, queries, args.k)]
+
+    print(f"{args.docs} docs x {args.dim} dims, {args.queries} queries, k={args.k}, "
+          f"rescore factor {args.rescore_factor}\n")
+    print(f"{'variant':<16} {'disk MB':>8} {'RSS +MB':>8} {'p50 ms':>8} {'p95 ms':>8} {'recall':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, quantization, rescore in VARIANTS:
+            directory = f"{tmp}/{name}"
+            writer = NumpyBackend(directory, quantization=quantization, rescore=rescore)
+            for start in range(0, args.docs, args.batch_size):
+                end = start + args.batch_size
+                writer.add(ids[start:end], texts[start:end], metadatas[start:end], vectors[start:end])
+            writer.persist()
+            del writer
+            gc.collect()
+
+            # Measure a fresh read-only mapping, as a serving worker would see it
+            rss_before = rss_mb()
+            backend = NumpyBackend(directory, read_only=True, rescore_factor=args.rescore_factor)
+            latencies, found = [], []
+            for query in queries:
+                with Timer() as t:
+                    hits = backend.query([query.tolist()], k=args.k)[0]
+                latencies.append(t.seconds)
+                found.append([hit[0] for hit in hits])
+            print(f"{name:<16} {dir_size_mb(directory):8.1f} {rss_mb() - rss_before:8.1f} "
+                  f"{percentile_ms(latencies, 50):8.3f} {percentile_ms(latencies, 95):8.3f} "
+                  f"{recall_at_k(found, truth):7.3f}")
+            del backend
+            gc.collect()
+
+
+if __name__ == "__main__":
+    main()
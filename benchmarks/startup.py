@@ -0,0 +1,109 @@
+"""
+Worker cold start: import time, time to ready, and the first learner request.
+
+Every mode runs in a fresh interpreter (with -X importtime) against the
+configured vector store:
+
+  lazy  import the app, then time the first retrieval, which pays for loading
+        the embedding model and opening the vector store itself
+  warm  import the app, run warmup.warm_up(), then time the first retrieval
+
+"import s" is how long a worker needs before it can answer /healthz; "ready s"
+is when /readyz turns 200. The slowest imports are listed for the last mode.
+No LLM calls are made (a placeholder OPENAI_API_KEY is set if none exists).
+
+    python -m benchmarks.startup --modes lazy warm
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+MODES = ["lazy", "warm"]
+
+
+def measure(mode: str) -> dict:
+    """Run inside the child interpreter and return the measurements."""
+    import time
+    start = time.perf_counter()
+    import app
+    # Answering /healthz is what "import s" stands for, so it is part of the timing
+    if app.app.test_client().get("/healthz").status_code != 200:
+        raise RuntimeError("/healthz failed after import")
+    imported = time.perf_counter()
+
+    ready = None
+    if mode == "warm":
+        import warmup
+        if not warmup.warm_up():
+            raise RuntimeError(f"warm-up failed: {warmup.status()['error']}")
+        ready = time.perf_counter() - start
+
+    from utils import retrieve_content, retrieve_questions
+    first_start = time.perf_counter()
+    retrieve_questions("algebra", "easy", subject="math", grade="high_school")
+    retrieve_content("high_school", "math", "algebra")
+    first_request = time.perf_counter() - first_start
+
+    from benchmarks.common import peak_rss_mb
+    return {"import_s": imported - start, "ready_s": ready, "first_request_s": first_request,
+            "peak_rss_mb": peak_rss_mb()}
+
+
+def slowest_imports(importtime_log: str, count: int):
+    """Third-party packages by cumulative import time, from -X importtime output."""
+    local = {name[:-3] for name in os.listdir(".") if name.endswith(".py")} | {"benchmarks"}
+    totals = {}
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        package = name.strip().split(".")[0]
+        if package not in local:
+            # A package's first (outermost) import includes all of its submodules
+            totals[package] = max(totals.get(package, 0), int(cumulative) / 1e6)
+    return sorted(totals.items(), key=lambda item: -item[1])[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    parser.add_argument("--top-imports", type=int, default=8, help="slowest imports to list")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child)))
+        return 0
+
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "sk-benchmark-placeholder")
+    print(f"{'mode':<6} {'import s':>9} {'ready s':>8} {'first request s':>16} {'peak MB':>8}")
+    importtime_log = ""
+    for mode in args.modes:
+        child = subprocess.run([sys.executable, "-X", "importtime", "-m", "benchmarks.startup", "--child", mode],
+                               capture_output=True, text=True, env=env)
+        lines = [line for line in child.stderr.splitlines() if not line.startswith("import time:")]
+        if child.returncode != 0:
+            print(f"{mode:<6} failed: {lines[-1] if lines else child.returncode}")
+            continue
+        importtime_log = child.stderr
+        # Log lines may share stdout with the result
+        result = json.loads(next(line for line in child.stdout.splitlines() if line.startswith("{")))
+        ready = f"{result['ready_s']:8.2f}" if result["ready_s"] is not None else f"{'-':>8}"
+        print(f"{mode:<6} {result['import_s']:9.2f} {ready} {result['first_request_s']:16.3f} "
+              f"{result['peak_rss_mb']:8.1f}")
+
+    if importtime_log and args.top_imports:
+        print("\nslowest imports (cumulative s):")
+        for package, seconds in slowest_imports(importtime_log, args.top_imports):
+            print(f"  {package:<28} {seconds:6.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
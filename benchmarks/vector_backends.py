@@ -0,0 +1,98 @@
+"""
+Chroma vs. in-process NumPy backend on identical data and queries.
+
+Both backends are loaded with the same synthetic question bank and asked the
+same filtered queries (type=question plus a difficulty). Reports build time,
+single-query and batched latency, RSS growth and result parity (overlap of the
+top-k IDs with the Chroma results and with exact brute-force search).
+
+    python -m benchmarks.vector_backends --docs 50000 --queries 500
+"""
+
+import argparse
+import tempfile
+
+import numpy as np
+
+from benchmarks.common import (DIFFICULTIES, Timer, brute_force_topk, percentile_ms, recall_at_k,
+                               rss_mb, synthetic_corpus, synthetic_queries)
+from vector_backends import ChromaBackend, NumpyBackend
+
+
+def load(backend, ids, texts, metadatas, vectors, batch_size=5000):
+    with Timer() as t:
+        for start in range(0, len(ids), batch_size):
+            end = start + batch_size
+            backend.add(ids[start:end], texts[start:end], metadatas[start:end], vectors[start:end].tolist())
+        backend.persist()
+    return t.seconds
+
+
+def run_queries(backend, queries, wheres, k):
+    latencies, results = [], []
+    for query, where in zip(queries, wheres):
+        with Timer() as t:
+            hits = backend.query([query.tolist()], k=k, where=where)[0]
+        latencies.append(t.seconds)
+        results.append([hit[0] for hit in hits])
+    return latencies, results
+
+
+def run_batched(backend, queries, wheres, k, batch_size):
+    """Queries grouped by filter and sent batch_size at a time; returns seconds per query."""
+    total = 0.0
+    for difficulty in DIFFICULTIES:
+        selected = [q.tolist() for q, w in zip(queries, wheres) if w["difficulty"] == difficulty]
+        for start in range(0, len(selected), batch_size):
+            with Timer() as t:
+                backend.query(selected[start:start + batch_size], k=k,
+                              where={"type": "question", "difficulty": difficulty})
+            total += t.seconds
+    return total / max(1, len(queries))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    ids, texts, metadatas, vectors = synthetic_corpus(args.docs, args.dim)
+    queries = synthetic_queries(vectors, args.queries)
+    rng = np.random.default_rng(2)
+    wheres = [{"type": "question", "difficulty": DIFFICULTIES[i]} for i in rng.integers(0, 3, size=args.queries)]
+
+    # Exact ground truth for the filtered queries
+    truth = []
+    difficulty_rows = {d: np.array([i for i, m in enumerate(metadatas) if m["difficulty"] == d]) for d in DIFFICULTIES}
+    for query, where in zip(queries, wheres):
+        rows = difficulty_rows[where["difficulty"]]
+        top = brute_force_topk(vectors[rows], query[None, :], args.k)[0]
+        truth.append([ids[rows[j]] for j in top])
+
+    print(f"{args.docs} docs x {args.dim} dims, {args.queries} filtered queries, k={args.k}\n")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, factory in (
+            ("chroma", lambda: ChromaBackend(tmp + "/chroma", "bench", {"hnsw:space": "cosine"})),
+            ("numpy", lambda: NumpyBackend(tmp + "/numpy")),
+        ):
+            rss_before = rss_mb()
+            backend = factory()
+            build_seconds = load(backend, ids, texts, metadatas, vectors)
+            latencies, found = run_queries(backend, queries, wheres, args.k)
+            batched = run_batched(backend, queries, wheres, args.k, args.batch_size)
+            results[name] = found
+            print(f"{name:<7} build {build_seconds:7.2f}s  p50 {percentile_ms(latencies, 50):7.3f}ms  "
+                  f"p95 {percentile_ms(latencies, 95):7.3f}ms  batched {batched * 1000:7.3f}ms/query  "
+                  f"RSS +{rss_mb() - rss_before:7.1f}MB  recall@{args.k} {recall_at_k(found, truth):.3f}")
+            del backend
+
+    print(f"\nTop-{args.k} overlap numpy vs chroma: {recall_at_k(results['numpy'], results['chroma']):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
+import json
 import os
+import re
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+
 from langchain.chains import LLMChain
-from langchain.chat_models import ChatOpenAI
-from langchain.memory import ConversationBufferMemory
+from langchain.prompts import PromptTemplate
 
 from prompts import (
     greeting_prompt,
@@ -13,8 +17,16 @@ from prompts import (
     select_question_prompt,
     evaluate_answer_prompt
 )
-from config import LLM_TEMPERATURE, LLM_MODEL, OPENAI_API_KEY
+from config import (
+    LLM_API_BASE, LLM_CHAIN_CONFIG, LLM_COMPLETION_TOKENS_ESTIMATE, LLM_ESCALATION_MODEL, LLM_MAX_TOKENS, LLM_MODEL,
+    LLM_SCHEDULER_ENABLED, LLM_TEMPERATURE, LLM_TIMEOUT, OPENAI_API_KEY
+)
+from chunking import count_tokens
+from lazy import Lazy
+from llm_client import pooled_clients, scheduler
 from logger import logger
+from metrics import LLM_ESCALATIONS
+from tracing import span
 
 # Set API key if provided in config
 if OPENAI_API_KEY:
@@ -23,20 +35,110 @@ if OPENAI_API_KEY:
 else:
     logger.warning("OpenAI API key not provided in config, expecting it to be set in environment variables")
 
-# Initialize the LLM
-logger.info(f"Initializing LLM with model={LLM_MODEL}, temperature={LLM_TEMPERATURE}")
-llm = ChatOpenAI(temperature=LLM_TEMPERATURE, model=LLM_MODEL)
-memory = ConversationBufferMemory(return_messages=True)
-logger.debug("Conversation memory initialized")
-
-# Initialize chains
-logger.debug("Initializing LangChain chains")
-greeting_chain = LLMChain(llm=llm, prompt=greeting_prompt, memory=memory)
-extraction_chain = LLMChain(llm=llm, prompt=extraction_prompt)
-learning_path_chain = LLMChain(llm=llm, prompt=learning_path_prompt)
-knowledge_analysis_chain = LLMChain(llm=llm, prompt=knowledge_analysis_prompt)
-question_preference_chain = LLMChain(llm=llm, prompt=question_preference_prompt)
-generate_questions_chain = LLMChain(llm=llm, prompt=generate_questions_prompt)
-select_question_chain = LLMChain(llm=llm, prompt=select_question_prompt)
-evaluate_answer_chain = LLMChain(llm=llm, prompt=evaluate_answer_prompt)
-logger.info("All LangChain chains initialized successfully") 
\ No newline at end of file
+# The LLM clients and chains are built on first use (or by warmup.warm_up), not at import
+def create_llm(model: str = LLM_MODEL, temperature: float = LLM_TEMPERATURE, max_tokens: Optional[int] = None,
+               timeout: float = LLM_TIMEOUT, api_base: str = LLM_API_BASE):
+    # Importing the chat model pulls in openai and transformers (seconds), so it happens here too
+    from langchain.chat_models import ChatOpenAI
+    logger.info("Initializing LLM with model=%s, temperature=%s, max_tokens=%s", model, temperature, max_tokens)
+    extra = {"openai_api_base": api_base} if api_base else {}
+    if LLM_SCHEDULER_ENABLED:
+        # Retries go through the scheduler so they respect the rate limits; connections come from one shared pool
+        extra.update(pooled_clients(api_base, timeout), max_retries=0)
+    return ChatOpenAI(temperature=temperature, model=model, max_tokens=max_tokens, request_timeout=timeout, **extra)
+
+_llms: Dict[Tuple, Any] = {}
+_llms_lock = threading.Lock()
+
+def get_llm(model: str, temperature: float, max_tokens: Optional[int], timeout: float):
+    """One client per distinct model setting, shared by every chain that uses it."""
+    key = (model, temperature, max_tokens, timeout)
+    with _llms_lock:
+        if key not in _llms:
+            _llms[key] = create_llm(model, temperature, max_tokens, timeout)
+        return _llms[key]
+
+def chain_settings(name: str) -> Dict[str, Any]:
+    """Model settings of a chain: the defaults, overridden by its LLM_CHAIN_CONFIG entry."""
+    settings = {"model": LLM_MODEL, "temperature": LLM_TEMPERATURE, "max_tokens": LLM_MAX_TOKENS or None,
+                "timeout": LLM_TIMEOUT, "escalate_to": LLM_ESCALATION_MODEL or None}
+    settings.update(LLM_CHAIN_CONFIG.get(name, {}))
+    return settings
+
+def is_valid_output(output: str, required_keys: Iterable[str]) -> bool:
+    """Whether output holds a JSON object with the required keys (as parse_json_safely would find it)."""
+    match = re.search(r'\{[\s\S]*\}', output or "")
+    try:
+        parsed = json.loads(match.group(0)) if match else None
+    except ValueError:
+        return False
+    return isinstance(parsed, dict) and all(key in parsed for key in required_keys)
+
+class TracedChain:
+    """
+    Wrap a lazily built LLMChain so every run() is recorded as a span named after the chain.
+    
+    Each chain runs on its own model settings (chain_settings). A chain with required_keys
+    returns JSON; if its output does not parse or lacks a key and an escalation model is
+    configured, the call is repeated once on that model. Calls go through the process-wide
+    llm_client.scheduler, which queues them by priority within the model's rate limits.
+    """
+
+    def __init__(self, name: str, prompt: PromptTemplate,
+                 required_keys: Optional[Tuple[str, ...]] = None):
+        self.name = name
+        self.prompt = prompt
+        self.required_keys = required_keys
+        self.settings = chain_settings(name)
+        self.chain = Lazy(lambda: self._build(self.settings["model"]), f"chain.{name}")
+        escalate_to = self.settings.get("escalate_to")
+        self.escalation = (Lazy(lambda: self._build(escalate_to), f"chain.{name}.escalation")
+                           if escalate_to and required_keys is not None and escalate_to != self.settings["model"]
+                           else None)
+
+    def _build(self, model: str) -> LLMChain:
+        llm = get_llm(model, self.settings["temperature"], self.settings["max_tokens"], self.settings["timeout"])
+        # Chains are shared by every session, so conversation memory lives on each EducationAgent
+        return LLMChain(llm=llm, prompt=self.prompt)
+
+    def estimate_tokens(self, kwargs: Dict[str, Any]) -> int:
+        """Prompt plus completion tokens reserved against the model's tokens-per-minute limit."""
+        try:
+            prompt = self.prompt.format(**{name: kwargs.get(name, "") for name in self.prompt.input_variables})
+        except (KeyError, ValueError):
+            prompt = " ".join(str(value) for value in kwargs.values())
+        return count_tokens(prompt) + (self.settings["max_tokens"] or LLM_COMPLETION_TOKENS_ESTIMATE)
+
+    def _call(self, chain: Lazy, model: str, args, kwargs):
+        if not LLM_SCHEDULER_ENABLED:
+            return chain.run(*args, **kwargs)
+        return scheduler.call(model, self.estimate_tokens(kwargs), lambda: chain.run(*args, **kwargs))
+
+    def run(self, *args, **kwargs):
+        with span(f"chain.{self.name}", chain=self.name, model=self.settings["model"]) as current:
+            output = self._call(self.chain, self.settings["model"], args, kwargs)
+            if self.escalation is not None and not is_valid_output(output, self.required_keys):
+                escalate_to = self.settings["escalate_to"]
+                logger.warning("Output of %s from %s is not the expected JSON, retrying on %s",
+                               self.name, self.settings["model"], escalate_to)
+                LLM_ESCALATIONS.labels(chain=self.name).inc()
+                current.set_attribute("escalated_to", escalate_to)
+                output = self._call(self.escalation, escalate_to, args, kwargs)
+            return output
+
+    def __getattr__(self, attr):
+        return getattr(self.chain, attr)
+
+greeting_chain = TracedChain("greeting", greeting_prompt)
+extraction_chain = TracedChain("extraction", extraction_prompt, required_keys=("grade", "subject", "topic"))
+learning_path_chain = TracedChain("learning_path", learning_path_prompt, required_keys=("learning_path",))
+knowledge_analysis_chain = TracedChain("knowledge_analysis", knowledge_analysis_prompt,
+                                       required_keys=("knowledge_level", "next_topic", "difficulty"))
+question_preference_chain = TracedChain("question_preference", question_preference_prompt)
+generate_questions_chain = TracedChain("generate_questions", generate_questions_prompt, required_keys=("questions",))
+select_question_chain = TracedChain("select_question", select_question_prompt,
+                                    required_keys=("selected_question", "answer"))
+evaluate_answer_chain = TracedChain("evaluate_answer", evaluate_answer_prompt, required_keys=("is_correct",))
+
+ALL_CHAINS = [greeting_chain, extraction_chain, learning_path_chain, knowledge_analysis_chain,
+              question_preference_chain, generate_questions_chain, select_question_chain, evaluate_answer_chain]
@@ -0,0 +1,182 @@
+"""
+Structure-aware chunking of long content and token-budgeted context assembly.
+
+Long sources (textbook chapters, articles) are split at markdown headings,
+then paragraphs, then sentences, and only as a last resort inside a
+sentence. The pieces are packed into chunks of at most `max_tokens`, and each
+chunk repeats up to `overlap_tokens` from the end of the previous chunk in
+the same section, so an idea cut at a boundary is still whole in one of them.
+Every chunk carries its parent document's metadata plus parent_id,
+chunk_index, chunk_count and the section heading, and the heading is
+repeated at the top of the chunk text so the chunk embeds with its context.
+
+At retrieval time, assemble_context() fits the best chunks into a token
+budget, so prompt size does not grow with the length of the sources.
+"""
+
+import re
+from typing import List, Optional
+
+from langchain.schema.document import Document
+
+from config import CONTENT_CHUNK_OVERLAP_TOKENS, CONTENT_CHUNK_TOKENS, LLM_MODEL
+
+HEADING = re.compile(r"^#{1,6}\s+\S.*$", re.MULTILINE)
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+# Words and individual punctuation marks; within ~25% of BPE token counts for English prose
+TOKEN_ESTIMATE = re.compile(r"\w+|[^\w\s]")
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Tokens in text for LLM_MODEL, using tiktoken when it is installed and an estimate otherwise."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.encoding_for_model(LLM_MODEL)
+        except (ImportError, KeyError):
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return len(TOKEN_ESTIMATE.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text at the last whole word that keeps it within max_tokens."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    words = text.split()
+    low, high = 0, len(words)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(" ".join(words[:middle])) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return " ".join(words[:low])
+
+
+def _sections(text: str) -> List[tuple]:
+    """(heading or None, body) pairs, split at markdown headings."""
+    sections = []
+    starts = [match.start() for match in HEADING.finditer(text)]
+    if not starts or starts[0] > 0:
+        sections.append((None, text[:starts[0]] if starts else text))
+    for index, start in enumerate(starts):
+        end = starts[index + 1] if index + 1 < len(starts) else len(text)
+        heading, _, body = text[start:end].partition("\n")
+        sections.append((heading.lstrip("#").strip(), body))
+    return [(heading, body.strip()) for heading, body in sections if body.strip() or heading]
+
+
+def _pieces(body: str, max_tokens: int) -> List[str]:
+    """Paragraphs, falling back to sentences and then word windows for anything over max_tokens."""
+    pieces = []
+    for paragraph in PARAGRAPH_BREAK.split(body):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        if count_tokens(paragraph) <= max_tokens:
+            pieces.append(paragraph)
+            continue
+        for sentence in SENTENCE_END.split(paragraph):
+            while count_tokens(sentence) > max_tokens:
+                head = truncate_to_tokens(sentence, max_tokens)
+                if not head:
+                    # A single word longer than the limit
+                    head = sentence.split()[0]
+                pieces.append(head)
+                sentence = sentence[len(head):].strip()
+            if sentence:
+                pieces.append(sentence)
+    return pieces
+
+
+def split_text(text: str, max_tokens: int = CONTENT_CHUNK_TOKENS,
+               overlap_tokens: int = CONTENT_CHUNK_OVERLAP_TOKENS) -> List[tuple]:
+    """
+    Split text into overlapping chunks along its structure.
+
+    Returns:
+        (section heading or None, chunk body) pairs in reading order
+    """
+    chunks = []
+    for heading, body in _sections(text):
+        budget = max_tokens - (count_tokens(heading) + 1 if heading else 0)
+        current: List[str] = []
+        current_tokens = 0
+        for piece in _pieces(body, max(1, budget)):
+            tokens = count_tokens(piece)
+            if current and current_tokens + tokens > budget:
+                chunks.append((heading, " ".join(current)))
+                # Carry the tail of the finished chunk into the next one
+                overlap: List[str] = []
+                overlap_size = 0
+                for previous in reversed(current):
+                    previous_tokens = count_tokens(previous)
+                    if overlap_size + previous_tokens > overlap_tokens or overlap_size + previous_tokens + tokens > budget:
+                        break
+                    overlap.insert(0, previous)
+                    overlap_size += previous_tokens
+                current, current_tokens = overlap, overlap_size
+            current.append(piece)
+            current_tokens += tokens
+        if current or heading:
+            chunks.append((heading, " ".join(current)))
+    return chunks
+
+
+def chunk_document(document: Document, max_tokens: int = CONTENT_CHUNK_TOKENS,
+                   overlap_tokens: int = CONTENT_CHUNK_OVERLAP_TOKENS) -> List[Document]:
+    """
+    Split a long document into chunk documents; documents that already fit are returned unchanged.
+
+    Chunks keep the parent's metadata and add parent_id (the parent's content-hash ID),
+    chunk_index, chunk_count and section (when the chunk is under a heading).
+    """
+    from vector_store import document_id
+
+    if count_tokens(document.page_content) <= max_tokens:
+        return [document]
+    parts = split_text(document.page_content, max_tokens, overlap_tokens)
+    parent_id = document_id(document)
+    chunks = []
+    for index, (heading, body) in enumerate(parts):
+        metadata = {**document.metadata, "parent_id": parent_id, "chunk_index": index, "chunk_count": len(parts)}
+        if heading:
+            metadata["section"] = heading
+        text = f"{heading}\n{body}" if heading and body else (heading or body)
+        chunks.append(Document(page_content=text, metadata=metadata))
+    return chunks
+
+
+def assemble_context(documents: List[Document], token_budget: int, separator: str = "\n") -> str:
+    """
+    Join the best documents or chunks into at most token_budget tokens.
+
+    Documents are taken in the given (relevance) order while they fit; one that does
+    not fit is skipped in favour of shorter ones after it, and if not even the first
+    fits it is truncated. The chosen chunks of each parent are then put back in
+    reading order, with parents in order of their best chunk.
+    """
+    selected: List[Document] = []
+    used = count_tokens(separator) * -1
+    for doc in documents:
+        tokens = count_tokens(doc.page_content) + count_tokens(separator)
+        if used + tokens <= token_budget:
+            selected.append(doc)
+            used += tokens
+    if not selected and documents:
+        return truncate_to_tokens(documents[0].page_content, token_budget)
+
+    def parent_of(doc: Document) -> Optional[str]:
+        return doc.metadata.get("parent_id") or id(doc)
+
+    first_seen = {}
+    for position, doc in enumerate(selected):
+        first_seen.setdefault(parent_of(doc), position)
+    selected.sort(key=lambda doc: (first_seen[parent_of(doc)], doc.metadata.get("chunk_index", 0)))
+    return separator.join(doc.page_content for doc in selected)
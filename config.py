@@ -1,4 +1,5 @@
 import os
+import json
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -13,6 +14,32 @@ OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
 # LLM Configuration
 LLM_TEMPERATURE = 0.0  # Higher values make the output more random
 LLM_MODEL = "gpt-3.5-turbo"  # Model to use
+LLM_API_BASE = os.environ.get("OPENAI_API_BASE", "")  # OpenAI-compatible endpoint, e.g. llm_standin.py at http://localhost:8090/v1
+LLM_MAX_TOKENS = int(os.environ.get("LLM_MAX_TOKENS", "0"))  # Completion token cap per call; 0 = the provider's default
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "60"))  # Seconds per call
+# Per-chain overrides of model, temperature, max_tokens, timeout and escalate_to, e.g.
+# '{"extraction": {"model": "gpt-4o-mini", "max_tokens": 150}, "evaluate_answer": {"model": "gpt-4o"}}'
+LLM_CHAIN_CONFIG = json.loads(os.environ.get("LLM_CHAIN_CONFIG", "{}"))
+# Rerun a JSON chain once on this model when its output is not the expected JSON ("" disables)
+LLM_ESCALATION_MODEL = os.environ.get("LLM_ESCALATION_MODEL", "")
+
+# LLM Rate Limits (see llm_client.py); limits are per process, so divide the provider's by the worker count
+LLM_SCHEDULER_ENABLED = os.environ.get("LLM_SCHEDULER_ENABLED", "true").lower() == "true"
+LLM_RPM_LIMIT = float(os.environ.get("LLM_RPM_LIMIT", "0"))  # Requests per minute per model; 0 = unlimited
+LLM_TPM_LIMIT = float(os.environ.get("LLM_TPM_LIMIT", "0"))  # Prompt plus completion tokens per minute per model; 0 = unlimited
+# Per-model overrides, e.g. '{"gpt-4o": {"rpm": 500, "tpm": 30000}}'
+LLM_RATE_LIMITS = json.loads(os.environ.get("LLM_RATE_LIMITS", "{}"))
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "16"))  # Calls in flight, and size of the shared connection pool
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "2"))  # Retries after a 429 or 5xx, within the call's deadline
+# Share of each model's RPM and TPM that prefetch and batch calls leave unused, so interactive calls rarely wait
+LLM_INTERACTIVE_RESERVE = float(os.environ.get("LLM_INTERACTIVE_RESERVE", "0.1"))
+LLM_COMPLETION_TOKENS_ESTIMATE = int(os.environ.get("LLM_COMPLETION_TOKENS_ESTIMATE", "300"))  # Reserved when max_tokens is unset
+# Seconds a call may queue for a slot before failing, by priority class
+LLM_DEADLINES = {
+    "interactive": float(os.environ.get("LLM_INTERACTIVE_DEADLINE", "20")),
+    "prefetch": float(os.environ.get("LLM_PREFETCH_DEADLINE", "60")),
+    "batch": float(os.environ.get("LLM_BATCH_DEADLINE", "600")),
+}
 
 # Agent Configuration
 DEFAULT_DIFFICULTY_LEVELS = ["easy", "medium", "hard"]
@@ -25,10 +52,108 @@ MAX_QUESTIONS = 3
 USE_VECTOR_STORE = os.environ.get("USE_VECTOR_STORE", "true").lower() == "true"
 VECTOR_STORE_DIR = os.environ.get("VECTOR_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "chroma_db"))
 EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "all-MiniLM-L6-v2")  # HuggingFace embedding model to use
+EMBEDDING_RUNTIME = os.environ.get("EMBEDDING_RUNTIME", "huggingface")  # "huggingface" (PyTorch) or "onnx"
+# Directory written by export_onnx_model.py for the onnx runtime
+EMBEDDING_ONNX_DIR = os.environ.get("EMBEDDING_ONNX_DIR", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "models", EMBEDDING_MODEL.replace("/", "--")))
+EMBEDDING_ONNX_QUANTIZED = os.environ.get("EMBEDDING_ONNX_QUANTIZED", "false").lower() == "true"  # int8 model
+EMBEDDING_THREADS = int(os.environ.get("EMBEDDING_THREADS", "0"))  # onnxruntime intra-op threads; 0 = automatic
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "chroma")  # "chroma" or "numpy" (in-process, memory-mapped)
+# HNSW index parameters for Chroma collections (defaults match Chroma's own)
+VECTOR_INDEX_DEFAULTS = {
+    "space": os.environ.get("HNSW_SPACE", "l2"),  # "l2", "cosine" or "ip"
+    "M": int(os.environ.get("HNSW_M", "16")),  # Graph degree: higher = better recall, more memory
+    "construction_ef": int(os.environ.get("HNSW_CONSTRUCTION_EF", "100")),  # Build-time candidate list size
+    "search_ef": int(os.environ.get("HNSW_SEARCH_EF", "10")),  # Query-time candidate list size
+}
+# Per-collection overrides as JSON, e.g. '{"education__question": {"M": 32, "search_ef": 64}}'
+VECTOR_INDEX_PARAMS = json.loads(os.environ.get("VECTOR_INDEX_PARAMS", "{}"))
+# NumPy backend vector storage: "none" (float32) or "int8" (per-dimension scale)
+VECTOR_QUANTIZATION = os.environ.get("VECTOR_QUANTIZATION", "none")
+# Keep float32 vectors next to quantized ones and rescore the best VECTOR_RESCORE_FACTOR * k candidates exactly
+VECTOR_RESCORE = os.environ.get("VECTOR_RESCORE", "true").lower() == "true"
+VECTOR_RESCORE_FACTOR = int(os.environ.get("VECTOR_RESCORE_FACTOR", "4"))
+# Documents are stored in one collection per type; list metadata fields here (comma-separated,
+# e.g. "subject" or "grade") to partition each type further
+VECTOR_PARTITION_FIELDS = [f.strip() for f in os.environ.get("VECTOR_PARTITION_FIELDS", "").split(",") if f.strip()]
+# Question search: "hybrid" (BM25 keyword fast path, fused with vector results when ambiguous), "vector" or "lexical"
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "hybrid")
+LEXICAL_MIN_COVERAGE = float(os.environ.get("LEXICAL_MIN_COVERAGE", "1.0"))  # Share of query terms a keyword hit needs to skip vector search
+RRF_K = int(os.environ.get("RRF_K", "60"))  # Reciprocal rank fusion damping constant
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "4096"))  # Query embeddings kept in the LRU cache
+# Coalesce query embeddings from concurrent requests into one model call
+EMBEDDING_BATCHING = os.environ.get("EMBEDDING_BATCHING", "true").lower() == "true"
+EMBEDDING_BATCH_MAX_SIZE = int(os.environ.get("EMBEDDING_BATCH_MAX_SIZE", "32"))  # Flush once this many queries are queued
+EMBEDDING_BATCH_MAX_WAIT_MS = float(os.environ.get("EMBEDDING_BATCH_MAX_WAIT_MS", "2"))  # ...or this long after the oldest arrived
+# Serve a prebuilt index snapshot (snapshot.py build) read-only instead of VECTOR_STORE_DIR.
+# Either a snapshot directory or the directory snapshots are built into (its CURRENT one is used).
+VECTOR_SNAPSHOT_DIR = os.environ.get("VECTOR_SNAPSHOT_DIR", "")
+VECTOR_SNAPSHOT_VERSION = os.environ.get("VECTOR_SNAPSHOT_VERSION", "")  # Refuse to serve any other version
+VECTOR_SNAPSHOT_VERIFY_CHECKSUMS = os.environ.get("VECTOR_SNAPSHOT_VERIFY_CHECKSUMS", "false").lower() == "true"  # Hash every file on load
+# Seconds between checks of the CURRENT pointer of the store or snapshot directory; workers reopen the
+# index between requests when it moves (see index_versions.py). 0 disables hot reload.
+VECTOR_RELOAD_INTERVAL = float(os.environ.get("VECTOR_RELOAD_INTERVAL", "5"))
+VECTOR_KEEP_VERSIONS = int(os.environ.get("VECTOR_KEEP_VERSIONS", "2"))  # Rebuilds and snapshots kept, including the current one
+# Content longer than CONTENT_CHUNK_TOKENS is indexed as overlapping chunks split at headings, paragraphs and sentences
+CONTENT_CHUNK_TOKENS = int(os.environ.get("CONTENT_CHUNK_TOKENS", "300"))
+CONTENT_CHUNK_OVERLAP_TOKENS = int(os.environ.get("CONTENT_CHUNK_OVERLAP_TOKENS", "50"))  # Repeated from the end of the previous chunk
+CONTENT_TOKEN_BUDGET = int(os.environ.get("CONTENT_TOKEN_BUDGET", "800"))  # Most content tokens put into a learning path prompt
+CONTENT_CANDIDATE_CHUNKS = int(os.environ.get("CONTENT_CANDIDATE_CHUNKS", "8"))  # Chunks retrieved to fill the budget from
+# Drop near-duplicate questions at ingestion, within (topic, difficulty) buckets (see dedup.py)
+DEDUP_ENABLED = os.environ.get("DEDUP_ENABLED", "true").lower() == "true"
+DEDUP_JACCARD_THRESHOLD = float(os.environ.get("DEDUP_JACCARD_THRESHOLD", "0.8"))  # MinHash estimate over character shingles
+DEDUP_EMBEDDING_THRESHOLD = float(os.environ.get("DEDUP_EMBEDDING_THRESHOLD", "0.95"))  # Cosine similarity of paraphrases
+DEDUP_MINHASH_PERMUTATIONS = int(os.environ.get("DEDUP_MINHASH_PERMUTATIONS", "64"))  # Signature length; LSH bands are derived from it
 
 # Logging Configuration
-LOG_LEVEL = os.environ.get("LOG_LEVEL", "DEBUG")  # DEBUG, INFO, WARNING, ERROR, CRITICAL
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")  # DEBUG, INFO, WARNING, ERROR, CRITICAL
 CONSOLE_LOG_LEVEL = os.environ.get("CONSOLE_LOG_LEVEL", "INFO")
-FILE_LOG_LEVEL = os.environ.get("FILE_LOG_LEVEL", "DEBUG")
+FILE_LOG_LEVEL = os.environ.get("FILE_LOG_LEVEL", "INFO")
 LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s'
-LOG_DIR = "logs" 
\ No newline at end of file
+LOG_DIR = "logs"
+LOG_FILE_NAME = os.environ.get("LOG_FILE_NAME", "education_agent.log")
+LOG_ROTATION = os.environ.get("LOG_ROTATION", "size")  # "size" or "time"
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", str(10 * 1024 * 1024)))  # Used with size rotation
+LOG_ROTATION_WHEN = os.environ.get("LOG_ROTATION_WHEN", "midnight")  # Used with time rotation
+LOG_BACKUP_COUNT = int(os.environ.get("LOG_BACKUP_COUNT", "5"))
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))  # Records beyond this are dropped rather than blocking
+LOG_JSON_SAMPLE_RATE = float(os.environ.get("LOG_JSON_SAMPLE_RATE", "0.1"))  # Fraction of DEBUG JSON results written
+
+# Tracing Configuration
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "false").lower() == "true"
+TRACE_EXPORT_FILE = os.environ.get("TRACE_EXPORT_FILE", os.path.join(LOG_DIR, "traces.jsonl"))  # Empty string disables the file exporter
+OTLP_TRACES_ENDPOINT = os.environ.get("OTLP_TRACES_ENDPOINT", "")  # e.g. http://localhost:4318/v1/traces
+TRACE_SERVICE_NAME = os.environ.get("TRACE_SERVICE_NAME", "education-assistant")
+
+# Web Session Configuration
+SESSION_IDLE_TIMEOUT = int(os.environ.get("SESSION_IDLE_TIMEOUT", "3600"))  # Seconds before an idle learner session is dropped
+
+# Learner Data Configuration
+LEARNER_DATA_DIR = os.environ.get("LEARNER_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "learner_data"))
+# Skip questions a learner has already been asked, inside retrieval (see seen_questions.py)
+SEEN_QUESTIONS_ENABLED = os.environ.get("SEEN_QUESTIONS_ENABLED", "true").lower() == "true"
+SEEN_QUESTIONS_CAPACITY = int(os.environ.get("SEEN_QUESTIONS_CAPACITY", "5000"))  # Questions per Bloom filter generation
+SEEN_QUESTIONS_ERROR_RATE = float(os.environ.get("SEEN_QUESTIONS_ERROR_RATE", "0.01"))  # Unseen questions wrongly skipped
+SEEN_OVERFETCH_FACTOR = int(os.environ.get("SEEN_OVERFETCH_FACTOR", "4"))  # Growth of each repeated vector search for unseen questions
+SEEN_MAX_CANDIDATES = int(os.environ.get("SEEN_MAX_CANDIDATES", "320"))  # Largest vector search made for one lookup
+# Append questions, answers and timings to an event log and keep a resume snapshot per learner (see learner_events.py)
+LEARNER_EVENTS_ENABLED = os.environ.get("LEARNER_EVENTS_ENABLED", "true").lower() == "true"
+LEARNER_EVENTS_DB = os.environ.get("LEARNER_EVENTS_DB", os.path.join(LEARNER_DATA_DIR, "events.db"))  # SQLite, WAL mode
+LEARNER_EVENTS_FLUSH_MS = float(os.environ.get("LEARNER_EVENTS_FLUSH_MS", "200"))  # Longest an event waits for its group commit
+LEARNER_EVENTS_BATCH_SIZE = int(os.environ.get("LEARNER_EVENTS_BATCH_SIZE", "256"))  # ...or commit once this many are queued
+LEARNER_EVENTS_QUEUE_SIZE = int(os.environ.get("LEARNER_EVENTS_QUEUE_SIZE", "10000"))  # Events beyond this are dropped rather than blocking
+# Choose the next topic and difficulty with a local knowledge-tracing model after each answer and only ask
+# knowledge_analysis_chain on step transitions or when the learner is stuck (see learner_model.py)
+LEARNER_MODEL_ENABLED = os.environ.get("LEARNER_MODEL_ENABLED", "true").lower() == "true"
+LEARNER_P_INIT = float(os.environ.get("LEARNER_P_INIT", "0.3"))  # Prior mastery of a new topic
+LEARNER_P_LEARN = float(os.environ.get("LEARNER_P_LEARN", "0.15"))  # Chance of learning the topic with each answer
+LEARNER_P_SLIP = float(os.environ.get("LEARNER_P_SLIP", "0.1"))  # Chance of a wrong answer despite mastery
+LEARNER_MASTERY_THRESHOLD = float(os.environ.get("LEARNER_MASTERY_THRESHOLD", "0.9"))  # Mastery needed to move on a step
+LEARNER_MIN_ATTEMPTS = int(os.environ.get("LEARNER_MIN_ATTEMPTS", "3"))  # Answers on a step before moving on
+LEARNER_MAX_ATTEMPTS = int(os.environ.get("LEARNER_MAX_ATTEMPTS", "8"))  # Answers without mastery before asking the LLM
+
+# Startup Configuration
+# Load the embedding model, vector store and chains in a background thread as each worker starts;
+# /readyz reports 503 until that finishes. When off, everything loads on the first request.
+WARMUP_ON_START = os.environ.get("WARMUP_ON_START", "true").lower() == "true"
+WARMUP_QUERY = os.environ.get("WARMUP_QUERY", "warm up the embedding model")  # Embedded once, bypassing the cache
@@ -2,6 +2,8 @@ from langchain.schema.document import Document
 from logger import logger
 import os
 from config import USE_VECTOR_STORE
+from lazy import Lazy
+from chunking import chunk_document
 
 # Mock knowledge base - in a real implementation, this would come from files
 mock_knowledge_base = {
@@ -121,15 +123,59 @@ mock_question_db = {
     }
 }
 
-def initialize_vector_store():
+# Grade prefixes used in mock data keys; some span two underscore-separated words
+KNOWN_GRADES = ["middle_school", "high_school", "elementary", "college"]
+
+def split_topic_key(key):
+    """
+    Split a "<grade>_<subject>_<topic>" key into its parts.
+    
+    Returns:
+        (grade, subject, topic), or None if the key has too few parts
+    """
+    for grade in KNOWN_GRADES:
+        if key.startswith(grade + "_"):
+            rest = key[len(grade) + 1:].split('_')
+            if len(rest) >= 2:
+                return grade, rest[0], '_'.join(rest[1:])
+            return None
+    parts = key.split('_')
+    if len(parts) >= 3:
+        return parts[0], parts[1], '_'.join(parts[2:])  # In case topic has underscores
+    return None
+
+def known_query_texts(documents):
+    """
+    Query strings the retrieval code is expected to embed for these documents:
+    each topic (retrieve_questions), each "grade subject topic" string
+    (retrieve_content fallback) and the fixed queries used by search_by_metadata.
+    """
+    texts = ["", "education content"]
+    for doc in documents:
+        metadata = doc.metadata
+        topic = metadata.get("topic")
+        if not topic:
+            continue
+        texts.append(topic)
+        if metadata.get("grade") and metadata.get("subject"):
+            texts.append(f"{metadata['grade']} {metadata['subject']} {topic}")
+    return texts
+
+# Metadata "source" values of the documents built from the mock data
+MOCK_SOURCES = ["mock_data", "mock_questions"]
+
+def initialize_vector_store(dry_run: bool = False, store=None):
     """
     Initialize the vector store with documents from the mock knowledge base
     AND the mock question database.
-    This operation converts the mock data to Document objects
-    and adds them to the Chroma vector store.
+    This operation converts the mock data to Document objects and syncs them
+    into the vector store by content-hash ID: only new or edited documents are
+    embedded, and documents no longer in the mock data are deleted.
+    With dry_run, the diff is only logged. `store` defaults to the served store.
     """
     try:
-        from vector_store import vector_store
+        from vector_store import vector_store as served_store
+        vector_store = served_store if store is None else store
         from langchain.schema.document import Document
         
         documents = []
@@ -137,11 +183,9 @@ def initialize_vector_store():
         content_count = 0
         for key, content in mock_knowledge_base.items():
             # Parse the key to extract grade, subject, and topic
-            parts = key.split('_')
-            if len(parts) >= 3:
-                grade = parts[0]
-                subject = parts[1]
-                topic = '_'.join(parts[2:])  # In case topic has underscores
+            parts = split_topic_key(key)
+            if parts:
+                grade, subject, topic = parts
                 
                 doc = Document(
                     page_content=content,
@@ -153,24 +197,20 @@ def initialize_vector_store():
                         "type": "content" # Mark as content type
                     }
                 )
-                documents.append(doc)
+                documents.extend(chunk_document(doc))
                 content_count += 1
-                logger.debug(f"Created content document for {key} with metadata: {doc.metadata}")
+                logger.debug("Created content document for %s with metadata: %s", key, doc.metadata)
             else:
-                logger.warning(f"Skipping invalid key format for content: {key}")
-        logger.info(f"Created {content_count} content documents")
+                logger.warning("Skipping invalid key format for content: %s", key)
+        logger.info("Created %s content documents", content_count)
 
         # Convert mock question database to Document objects
         logger.info("Processing mock question database for vector store")
         question_count = 0
         for topic_key, difficulties in mock_question_db.items():
             # Try to parse grade/subject from topic_key for questions too
-            topic_parts = topic_key.split('_')
-            q_grade, q_subject, q_topic = None, None, topic_key # Defaults
-            if len(topic_parts) >= 3:
-                q_grade = topic_parts[0]
-                q_subject = topic_parts[1]
-                q_topic = '_'.join(topic_parts[2:])
+            topic_parts = split_topic_key(topic_key)
+            q_grade, q_subject, q_topic = topic_parts or (None, None, topic_key) # Defaults
             
             for difficulty, questions in difficulties.items():
                 for question_data in questions:
@@ -199,52 +239,38 @@ def initialize_vector_store():
                         # Limit logging verbosity for questions
                         # logger.debug(f"Created question document for {topic_key}/{difficulty} with metadata: {doc.metadata}")
                     else:
-                        logger.warning(f"Skipping question due to missing text or answer in {topic_key}/{difficulty}")
-        logger.info(f"Created {question_count} question documents")
+                        logger.warning("Skipping question due to missing text or answer in %s/%s", topic_key, difficulty)
+        logger.info("Created %s question documents", question_count)
 
-        # Check if the total number of documents matches existing count to avoid re-adding
-        # This simple check might not be robust if only partial updates are desired
-        stats = vector_store.get_collection_stats()
-        if stats.get("document_count", 0) == len(documents):
-            logger.info(f"Vector store already contains {stats['document_count']} documents. Skipping initialization.")
-            return True
-        elif stats.get("document_count", 0) > 0:
-             logger.warning(f"Vector store contains {stats['document_count']} documents, but expected {len(documents)}. Consider running reinitialize script to clear first.")
-             # Decide whether to proceed or stop. For now, let's proceed to add.
-             pass # Or return False if strict matching is required
+        # A read-only index snapshot ships its own query vectors and can only be checked, not synced
+        dry_run = dry_run or vector_store.read_only
 
-        # Add documents to vector store
-        if documents:
-            try:
-                # We should clear the store before adding if the counts don't match
-                # or if re-initialization is explicitly desired. 
-                # The reinitialize_vector_store.py script handles clearing.
-                logger.info(f"Adding {len(documents)} total documents (content & questions) to vector store")
-                vector_store.add_documents(documents)
-                logger.info(f"Successfully added/updated documents in vector store")
-                
-                # Verify documents were added
-                new_stats = vector_store.get_collection_stats()
-                logger.info(f"Vector store now contains {new_stats.get('document_count', 0)} documents")
-            except Exception as e:
-                logger.error(f"Error adding documents to vector store: {str(e)}")
-                return False
-        else:
+        # Precompute query vectors for every known topic so repeat queries skip the model
+        if not dry_run:
+            vector_store.precompute_query_embeddings(known_query_texts(documents))
+
+        # Upsert new or edited documents and delete removed ones; unchanged ones are not re-embedded
+        if not documents:
             logger.warning("No documents created for vector store")
+        try:
+            diff = vector_store.sync_documents(documents, sources=MOCK_SOURCES, dry_run=dry_run)
+            if vector_store.read_only and (diff["added"] or diff["removed"]):
+                logger.error("Index snapshot does not match the mock data (%s); rebuild it with snapshot.py build", diff)
+        except Exception as e:
+            logger.error("Error syncing documents to vector store: %s", e)
+            return False
             
         return True
     except Exception as e:
-        logger.error(f"Error initializing vector store: {str(e)}")
+        logger.error("Error initializing vector store: %s", e)
         return False
 
-# Initialize the vector store when this module is imported
-# This will only happen if the vector_store module is available
-# Note: Re-running the app might not re-trigger this if store already exists.
-# Use reinitialize_vector_store.py for a clean update.
-if USE_VECTOR_STORE:
-    try:
-        # Attempt to initialize the vector store
-        logger.info("Attempting to initialize vector store with data")
-        initialize_vector_store()
-    except ImportError:
-        logger.warning("Vector store module not available, using mock data only") 
\ No newline at end of file
+# Synced into the vector store once per process, on first retrieval or at warm-up rather
+# than at import. Use reinitialize_vector_store.py to rebuild the store from scratch.
+_vector_store_data = Lazy(initialize_vector_store, "vector_store_data")
+
+def ensure_vector_store_initialized() -> bool:
+    """Initialize the vector store with the mock data if this process has not yet done so."""
+    if not USE_VECTOR_STORE:
+        return False
+    return _vector_store_data.get()
@@ -0,0 +1,331 @@
+"""
+Near-duplicate question detection for ingestion.
+
+Two stages, both within (topic, difficulty) buckets and both keeping the
+first question seen (questions already in the store come first):
+
+1. MinHash/LSH over character shingles of the normalized text catches
+   copies that differ in case, punctuation, whitespace or a few words. It runs
+   before embedding, so these rows cost no model time. LSH limits the
+   comparisons to questions that share a band, and candidates are confirmed
+   with the estimated Jaccard similarity.
+2. Embedding similarity catches paraphrases. Each new question is compared
+   against the kept questions of its bucket, and one whose cosine similarity
+   to any of them reaches the threshold joins that question's cluster.
+
+Questions that differ in any number ("What is 12 x 7?" and "What is 13 x 7?")
+are never duplicates, however similar the rest of the text is: question banks
+are full of such templated variants, and both measures score them highly.
+
+Questions already in the store are loaded one bucket at a time, with a
+filtered backend get, the first time an incoming question falls into that
+bucket. Signatures and normalized vectors are held for every kept question of
+the buckets the input touches, so memory grows with the size of those buckets
+(not with the rest of the corpus), and each new question is compared with all
+the kept questions of its bucket. Stored questions are matched by their exact
+topic spelling: one stored as "Algebra" is only loaded if some incoming row
+spells its topic that way too.
+"""
+
+import re
+import unicodedata
+import zlib
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain.schema.document import Document
+
+from config import DEDUP_EMBEDDING_THRESHOLD, DEDUP_JACCARD_THRESHOLD, DEDUP_MINHASH_PERMUTATIONS
+from logger import logger
+
+SHINGLE_SIZE = 5
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+NON_WORD = re.compile(r"[\W_]+")
+NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip accents and punctuation, and collapse whitespace."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return NON_WORD.sub(" ", text.lower()).strip()
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """32-bit hashes of the character shingles of normalized text."""
+    text = normalize(text)
+    if len(text) <= size:
+        grams = {text}
+    else:
+        grams = {text[i:i + size] for i in range(len(text) - size + 1)}
+    return np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype=np.uint64, count=len(grams))
+
+
+def lsh_shape(permutations: int, threshold: float) -> Tuple[int, int]:
+    """(bands, rows) whose LSH S-curve midpoint (1/bands)^(1/rows) is closest to threshold."""
+    shapes = [(permutations // rows, rows) for rows in range(1, permutations + 1) if permutations % rows == 0]
+    return min(shapes, key=lambda shape: abs((1 / shape[0]) ** (1 / shape[1]) - threshold))
+
+
+class MinHasher:
+    """Fixed family of universal hash functions, so signatures are comparable across runs."""
+
+    def __init__(self, permutations: int = DEDUP_MINHASH_PERMUTATIONS, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        # a * x stays below 2**63 for 32-bit shingle hashes
+        self.a = rng.randint(1, 1 << 31, size=permutations).astype(np.uint64)
+        self.b = rng.randint(0, 1 << 31, size=permutations).astype(np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = shingles(text)
+        values = (np.outer(hashes, self.a) + self.b) % _PRIME & _MAX_HASH
+        return values.min(axis=0).astype(np.uint32)
+
+
+def bucket_key(metadata: Dict) -> Tuple:
+    return (str(metadata.get("topic", "")).lower(), str(metadata.get("difficulty", "")).lower())
+
+
+def numbers(text: str) -> Tuple[str, ...]:
+    return tuple(sorted(NUMBER.findall(text)))
+
+
+def _normalize_rows(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class _Bucket:
+    """Kept questions of one (topic, difficulty) bucket."""
+
+    def __init__(self, bands: int):
+        self.ids: List[str] = []
+        self.signatures: List[np.ndarray] = []
+        self.tables: List[Dict[bytes, int]] = [{} for _ in range(bands)]
+        # Normalized vectors in appended blocks, with the kept ID and number code of each row
+        self.vector_blocks: List[np.ndarray] = []
+        self.vector_code_blocks: List[np.ndarray] = []
+        self.vector_ids: List[str] = []
+        # Small integer per distinct set of numbers, so comparisons can be masked in numpy
+        self.codes: Dict[Tuple[str, ...], int] = {}
+        # (topic, difficulty) spellings whose stored questions have been loaded
+        self.seeded: Set[Tuple[str, str]] = set()
+
+    def code(self, text: str) -> int:
+        return self.codes.setdefault(numbers(text), len(self.codes))
+
+
+class NearDuplicateFilter:
+    """
+    Drops questions that are near-duplicates of one kept earlier.
+
+    Content documents pass through untouched: their chunks overlap on purpose.
+    """
+
+    def __init__(self, jaccard_threshold: float = DEDUP_JACCARD_THRESHOLD,
+                 embedding_threshold: float = DEDUP_EMBEDDING_THRESHOLD,
+                 permutations: int = DEDUP_MINHASH_PERMUTATIONS):
+        self.jaccard_threshold = jaccard_threshold
+        self.embedding_threshold = embedding_threshold
+        self.hasher = MinHasher(permutations)
+        self.bands, self.rows = lsh_shape(permutations, jaccard_threshold)
+        self.buckets: Dict[Tuple, _Bucket] = {}
+        self.removed: Dict[str, str] = {}
+        self.stats = {"minhash": 0, "embedding": 0, "seeded": 0}
+        self.store = None
+        self.page_size = 5000
+
+    def _bucket(self, key: Tuple) -> _Bucket:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = _Bucket(self.bands)
+        return bucket
+
+    def _seeded_bucket(self, document: Document) -> _Bucket:
+        """The document's bucket, after loading its stored questions if this spelling is new."""
+        key = bucket_key(document.metadata)
+        bucket = self._bucket(key)
+        if self.store is None:
+            return bucket
+        metadata = document.metadata
+        spelling = (str(metadata.get("topic", "")), str(metadata.get("difficulty", "")))
+        if spelling in bucket.seeded:
+            return bucket
+        bucket.seeded.add(spelling)
+        where = {"type": "question"}
+        where.update((field, metadata[field]) for field in ("topic", "difficulty") if metadata.get(field) is not None)
+        seeded = 0
+        for name in self.store.router.route(where):
+            backend, offset = self.store.partitions[name], 0
+            while True:
+                page = backend.get(where=where, limit=self.page_size, offset=offset, include_embeddings=True)
+                if not page["ids"]:
+                    break
+                offset += len(page["ids"])
+                rows = [position for position, stored in enumerate(page["metadatas"])
+                        if bucket_key(stored) == key]
+                self._keep_stored(bucket, [page["ids"][position] for position in rows],
+                                  [page["documents"][position] for position in rows],
+                                  np.asarray(page["embeddings"])[rows])
+                seeded += len(rows)
+        self.stats["seeded"] += seeded
+        logger.debug("Near-duplicate filter loaded %s stored questions for %s", seeded, spelling)
+        return bucket
+
+    def _keep_stored(self, bucket: _Bucket, ids: List[str], texts: List[str], vectors: np.ndarray) -> None:
+        """Register stored questions of one bucket as kept, without checking them."""
+        if not ids:
+            return
+        codes = []
+        for doc_id, text in zip(ids, texts):
+            signature = self.hasher.signature(text)
+            codes.append(bucket.code(text))
+            self._keep_signature(bucket, doc_id, signature, self._band_keys(signature, codes[-1]))
+        bucket.vector_blocks.append(_normalize_rows(vectors))
+        bucket.vector_code_blocks.append(np.asarray(codes))
+        bucket.vector_ids.extend(ids)
+
+    def _band_keys(self, signature: np.ndarray, code: int) -> List[bytes]:
+        # Only questions with the same numbers share LSH buckets
+        prefix = code.to_bytes(4, "little")
+        return [prefix + signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def _keep_signature(self, bucket: _Bucket, doc_id: str, signature: np.ndarray,
+                        band_keys: List[bytes]) -> None:
+        index = len(bucket.ids)
+        bucket.ids.append(doc_id)
+        bucket.signatures.append(signature)
+        for table, key in zip(bucket.tables, band_keys):
+            table.setdefault(key, index)
+
+    def _representative(self, doc_id: str) -> str:
+        # A kept question may itself be removed by the embedding stage later
+        while doc_id in self.removed:
+            doc_id = self.removed[doc_id]
+        return doc_id
+
+    def check_text(self, doc_id: str, document: Document) -> Optional[Tuple[str, float]]:
+        """
+        MinHash stage: return (kept ID, estimated Jaccard) if the question is a near-duplicate,
+        otherwise remember it and return None.
+        """
+        if document.metadata.get("type") != "question":
+            return None
+        bucket = self._seeded_bucket(document)
+        code = bucket.code(document.page_content)
+        signature = self.hasher.signature(document.page_content)
+        band_keys = self._band_keys(signature, code)
+        candidates = {table[key] for table, key in zip(bucket.tables, band_keys) if key in table}
+        best = None
+        for index in candidates:
+            similarity = float(np.mean(bucket.signatures[index] == signature))
+            if similarity >= self.jaccard_threshold and (best is None or similarity > best[1]):
+                best = (index, similarity)
+        if best is None:
+            self._keep_signature(bucket, doc_id, signature, band_keys)
+            return None
+        kept_id = bucket.ids[best[0]]
+        if kept_id == doc_id:
+            # The same question again (a replayed row); writing it is an idempotent overwrite
+            return None
+        self.removed[doc_id] = kept_id
+        self.stats["minhash"] += 1
+        return self._representative(kept_id), best[1]
+
+    def check_vectors(self, ids: List[str], documents: List[Document],
+                      vectors: np.ndarray) -> Tuple[List[bool], List[Tuple[int, str, float]]]:
+        """
+        Embedding stage for one batch.
+
+        Returns:
+            (keep flag per document, [(position, kept ID, cosine similarity)] for removed ones)
+        """
+        keep = [True] * len(ids)
+        duplicates = []
+        positions_by_bucket: Dict[Tuple, List[int]] = {}
+        for position, doc in enumerate(documents):
+            if doc.metadata.get("type") == "question":
+                self._seeded_bucket(doc)
+                positions_by_bucket.setdefault(bucket_key(doc.metadata), []).append(position)
+
+        for key, positions in positions_by_bucket.items():
+            bucket = self._bucket(key)
+            batch = _normalize_rows(np.asarray(vectors)[positions])
+            codes = np.asarray([bucket.code(documents[position].page_content) for position in positions])
+            rows = np.arange(len(positions))
+
+            # Best match among questions kept in earlier batches
+            best_previous = np.full(len(positions), -1.0, dtype=np.float32)
+            best_previous_id: List[Optional[str]] = [None] * len(positions)
+            offset = 0
+            for block, block_codes in zip(bucket.vector_blocks, bucket.vector_code_blocks):
+                scores = np.where(codes[:, None] == block_codes[None, :], batch @ block.T, -1.0)
+                columns = scores.argmax(axis=1)
+                for row in np.nonzero(scores[rows, columns] > best_previous)[0]:
+                    best_previous[row] = scores[row, columns[row]]
+                    best_previous_id[row] = bucket.vector_ids[offset + columns[row]]
+                offset += len(block)
+
+            within = np.where(codes[:, None] == codes[None, :], batch @ batch.T, -1.0)
+            kept_rows: List[int] = []
+            for row, position in enumerate(positions):
+                if best_previous_id[row] == ids[position]:
+                    # A replayed row that is already kept; writing it again is an idempotent overwrite
+                    continue
+                match_id, similarity = None, -1.0
+                if best_previous[row] >= self.embedding_threshold:
+                    match_id, similarity = best_previous_id[row], float(best_previous[row])
+                elif kept_rows:
+                    scores = within[row, kept_rows]
+                    best = int(scores.argmax())
+                    if scores[best] >= self.embedding_threshold:
+                        match_id, similarity = ids[positions[kept_rows[best]]], float(scores[best])
+                if match_id is None:
+                    kept_rows.append(row)
+                    continue
+                keep[position] = False
+                self.removed[ids[position]] = match_id
+                self.stats["embedding"] += 1
+                duplicates.append((position, self._representative(match_id), similarity))
+
+            if kept_rows:
+                bucket.vector_blocks.append(batch[kept_rows])
+                bucket.vector_code_blocks.append(codes[kept_rows])
+                bucket.vector_ids.extend(ids[positions[row]] for row in kept_rows)
+        return keep, duplicates
+
+    def seed(self, ids: Iterable[str], documents: Iterable[Document], vectors: np.ndarray) -> int:
+        """Register questions that are already stored as kept, without checking them. Returns how many."""
+        ids, documents = list(ids), list(documents)
+        positions_by_bucket: Dict[Tuple, List[int]] = {}
+        for position, doc in enumerate(documents):
+            if doc.metadata.get("type") == "question":
+                positions_by_bucket.setdefault(bucket_key(doc.metadata), []).append(position)
+        for key, positions in positions_by_bucket.items():
+            self._keep_stored(self._bucket(key), [ids[position] for position in positions],
+                              [documents[position].page_content for position in positions],
+                              np.asarray(vectors)[positions])
+        return sum(len(positions) for positions in positions_by_bucket.values())
+
+    def attach_store(self, store, page_size: int = 5000) -> None:
+        """
+        Check new rows against the questions already in the store too.
+
+        Nothing is read here: each bucket's stored questions are loaded the first
+        time an incoming question falls into it.
+        """
+        self.store = store
+        self.page_size = page_size
+
+    def report(self) -> Dict:
+        """Clusters with at least one removed question, by kept question ID."""
+        clusters: Dict[str, List[str]] = {}
+        for doc_id in self.removed:
+            clusters.setdefault(self._representative(doc_id), []).append(doc_id)
+        return {"removed": len(self.removed), "clusters": len(clusters),
+                "removed_by_minhash": self.stats["minhash"], "removed_by_embedding": self.stats["embedding"],
+                "stored_questions_loaded": self.stats["seeded"],
+                "jaccard_threshold": self.jaccard_threshold, "embedding_threshold": self.embedding_threshold,
+                "lsh_bands": self.bands, "lsh_rows": self.rows}
@@ -0,0 +1,89 @@
+"""
+Cross-request micro-batching for query embeddings.
+
+Request threads each need one query embedding at a time. Run separately,
+those are many tiny forward passes competing for the GIL and CPU cores.
+EmbeddingBatcher queues the texts from every thread. A single worker thread
+flushes the queue once it holds `max_batch_size` texts, or `max_wait_ms`
+after the oldest one arrived, and runs one batched `embed_documents` call
+for the whole flush. Callers wait on a Future for their own vector.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from config import EMBEDDING_BATCH_MAX_SIZE, EMBEDDING_BATCH_MAX_WAIT_MS
+from logger import logger
+from metrics import EMBEDDING_BATCH_SIZE, EMBEDDING_QUEUE_WAIT
+
+
+class EmbeddingBatcher(Embeddings):
+    """Embeddings wrapper that coalesces concurrent embed_query calls into batches."""
+
+    def __init__(self, base: Embeddings, max_batch_size: int = EMBEDDING_BATCH_MAX_SIZE,
+                 max_wait_ms: float = EMBEDDING_BATCH_MAX_WAIT_MS):
+        self.base = base
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._lock = threading.Lock()
+        self._queue: Optional["queue.Queue[Tuple[str, Future, float]]"] = None
+        self._pid = None
+
+    def _ensure_worker(self) -> "queue.Queue":
+        # Started lazily, and again after a fork, since threads do not survive into gunicorn workers
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, args=(self._queue,), name="embedding-batcher",
+                                 daemon=True).start()
+            return self._queue
+
+    def submit(self, text: str) -> Future:
+        """Queue a text for embedding; the Future resolves to its vector."""
+        future: Future = Future()
+        self._ensure_worker().put((text, future, time.perf_counter()))
+        return future
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.submit(text).result()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Callers passing a list have already batched it
+        return self.base.embed_documents(texts)
+
+    def _collect(self, pending: "queue.Queue") -> List[Tuple[str, Future, float]]:
+        """Block for one request, then gather more until the batch is full or the deadline passes."""
+        batch = [pending.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(pending.get(timeout=remaining) if remaining > 0 else pending.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, pending: "queue.Queue") -> None:
+        while True:
+            batch = self._collect(pending)
+            started = time.perf_counter()
+            EMBEDDING_BATCH_SIZE.observe(len(batch))
+            for _, _, enqueued in batch:
+                EMBEDDING_QUEUE_WAIT.observe(started - enqueued)
+            texts = list(dict.fromkeys(text for text, _, _ in batch))
+            try:
+                vectors = dict(zip(texts, self.base.embed_documents(texts)))
+            except Exception as e:
+                logger.error("Batched embedding of %s texts failed: %s", len(texts), e)
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for text, future, _ in batch:
+                future.set_result(vectors[text])
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Export the embedding model to ONNX for the onnx embedding runtime.
+
+Writes model.onnx, an int8 dynamically quantized model_int8.onnx, the fast
+tokenizer and embedding_config.json (pooling, normalization, max length) to
+EMBEDDING_ONNX_DIR, then checks that both ONNX models reproduce the
+sentence-transformers vectors. Exits non-zero if parity is not met.
+
+    python export_onnx_model.py [--model all-MiniLM-L6-v2] [--output models/all-MiniLM-L6-v2]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from config import EMBEDDING_MODEL, EMBEDDING_ONNX_DIR
+from logger import logger
+
+# Minimum cosine similarity to the sentence-transformers vector, per model variant
+PARITY_THRESHOLDS = {"float": 0.9999, "int8": 0.98}
+
+PARITY_TEXTS = [
+    "What is the Pythagorean theorem?",
+    "Solve the quadratic equation: x² - 5x + 6 = 0",
+    "high_school biology genetics",
+    "Explain the difference between incomplete dominance and codominance.",
+    "photosynthesis",
+    "A store sold 128 toys on Saturday and 157 toys on Sunday. How many toys did they sell altogether?",
+    "Elementary poetry education focuses on understanding and reciting classical poems.\nIncluding works by famous poets.",
+    "",
+]
+
+
+def export(model_name: str, output_dir: str, opset: int = 17) -> None:
+    """Export the transformer, tokenizer and pooling settings of a sentence-transformers model."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize, Pooling
+
+    from onnx_embeddings import CONFIG_FILE, MODEL_FILE, QUANTIZED_MODEL_FILE
+
+    os.makedirs(output_dir, exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model[0].tokenizer
+    pooling_config = next(module for module in model if isinstance(module, Pooling)).get_config_dict()
+    # sentence-transformers >= 6 stores one pooling_mode; older versions a flag per mode
+    pooling = pooling_config.get("pooling_mode") or (
+        "cls" if pooling_config.get("pooling_mode_cls_token")
+        else "mean" if pooling_config.get("pooling_mode_mean_tokens") else None)
+    if pooling not in ("cls", "mean"):
+        raise ValueError(f"Unsupported pooling mode {pooling!r} for {model_name}")
+
+    config = {
+        "model_name": model_name,
+        "pooling": pooling,
+        "normalize": any(isinstance(module, Normalize) for module in model),
+        "max_seq_length": model.max_seq_length,
+        "dimension": model.get_sentence_embedding_dimension(),
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": tokenizer.pad_token_id,
+    }
+    with open(os.path.join(output_dir, CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    tokenizer.backend_tokenizer.save(os.path.join(output_dir, "tokenizer.json"))
+
+    class LastHiddenState(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.inner(input_ids=input_ids, attention_mask=attention_mask,
+                              token_type_ids=token_type_ids).last_hidden_state
+
+    sample = tokenizer(["an example sentence", "another one"], padding=True, return_tensors="pt")
+    token_type_ids = sample.get("token_type_ids", torch.zeros_like(sample["input_ids"]))
+    dynamic = {0: "batch", 1: "sequence"}
+    model_path = os.path.join(output_dir, MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            LastHiddenState(transformer),
+            (sample["input_ids"], sample["attention_mask"], token_type_ids),
+            model_path,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={"input_ids": dynamic, "attention_mask": dynamic, "token_type_ids": dynamic,
+                          "last_hidden_state": dynamic},
+            opset_version=opset,
+            dynamo=False,
+        )
+    logger.info("Exported %s to %s", model_name, model_path)
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(model_path, os.path.join(output_dir, QUANTIZED_MODEL_FILE), weight_type=QuantType.QInt8)
+    logger.info("Wrote int8 dynamically quantized model to %s", os.path.join(output_dir, QUANTIZED_MODEL_FILE))
+
+
+def check_parity(model_name: str, output_dir: str) -> bool:
+    """Compare ONNX vectors with HuggingFaceEmbeddings on PARITY_TEXTS; returns True if within thresholds."""
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    from onnx_embeddings import OnnxEmbeddings
+
+    reference = np.asarray(HuggingFaceEmbeddings(model_name=model_name).embed_documents(PARITY_TEXTS))
+    passed = True
+    for variant, quantized in (("float", False), ("int8", True)):
+        vectors = np.asarray(OnnxEmbeddings(output_dir, quantized=quantized).embed_documents(PARITY_TEXTS))
+        cosine = (reference * vectors).sum(axis=1) / (
+            np.linalg.norm(reference, axis=1) * np.linalg.norm(vectors, axis=1))
+        ok = cosine.min() >= PARITY_THRESHOLDS[variant]
+        passed = passed and ok
+        logger.info("Parity %s model: min cosine %.6f, mean %.6f, max abs diff %.2e (%s)", variant,
+                    cosine.min(), cosine.mean(), np.abs(reference - vectors).max(), "ok" if ok else "FAILED")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--output", default=EMBEDDING_ONNX_DIR)
+    parser.add_argument("--check-only", action="store_true", help="only run the parity check")
+    args = parser.parse_args()
+
+    try:
+        if not args.check_only:
+            export(args.model, args.output)
+        if not check_parity(args.model, args.output):
+            logger.error("ONNX embeddings do not match %s closely enough", args.model)
+            return 1
+        return 0
+    except Exception as e:
+        logger.error("Error exporting embedding model: %s", e)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+"""
+Gunicorn configuration.
+
+Sets up prometheus_client multiprocess mode so /metrics aggregates samples
+from every worker rather than whichever worker happens to serve the scrape,
+and starts each worker's warm-up (see warmup.py) and index reload watcher
+(see index_versions.py) once the app is loaded.
+"""
+
+import os
+import shutil
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8080")
+
+# Must be set before any worker imports prometheus_client
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+
+
+def on_starting(server):
+    """Start every master process with an empty metrics directory."""
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """Drop the live gauges of a worker that exited."""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    """Warm up in the background so the worker answers /healthz while models load."""
+    from config import WARMUP_ON_START
+    from index_versions import start_watcher
+    if WARMUP_ON_START:
+        from warmup import start_warm_up
+        start_warm_up()
+    # Pick up rebuilt indexes without restarting the worker
+    start_watcher()
@@ -0,0 +1,231 @@
+"""
+Versioned vector store directories and hot reload.
+
+Full rebuilds never touch the store being served. They go into a new
+directory next to it, and a pointer file is flipped once validation passes:
+
+    VECTOR_STORE_DIR/
+        CURRENT                  name of the version being served
+        versions/<version>/      one complete store per rebuild
+
+Without CURRENT, VECTOR_STORE_DIR itself is the store, as it was before
+versioning. Index snapshots (snapshot.py) use the same CURRENT pointer over
+their own version directories.
+
+Each web worker runs a watcher thread (start_watcher) that polls the pointer.
+When it moves, the watcher opens and warms the new index in the background.
+apply_pending() swaps it in between requests, so in-flight requests finish
+on the index they started with and no worker restarts. Requests are counted
+with begin_request()/end_request(), and the replaced index is closed once the
+last request that started before the swap has finished.
+"""
+
+import datetime
+import os
+import shutil
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import VECTOR_RELOAD_INTERVAL, VECTOR_STORE_DIR, WARMUP_QUERY
+from logger import logger
+
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+
+
+def read_current(directory: str) -> Optional[str]:
+    """The version CURRENT names in a directory, or None if there is no pointer."""
+    try:
+        with open(os.path.join(directory, CURRENT_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def set_current(directory: str, version: str) -> None:
+    """Atomically point CURRENT at a version; readers see the old or the new name, never a partial one."""
+    tmp_path = os.path.join(directory, f"{CURRENT_FILE}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(directory, CURRENT_FILE))
+
+
+def store_directory(root: str = VECTOR_STORE_DIR) -> str:
+    """The directory of the store being served under root."""
+    version = read_current(root)
+    return os.path.join(root, VERSIONS_DIR, version) if version else root
+
+
+def new_version_directory(root: str = VECTOR_STORE_DIR) -> str:
+    """Create an empty directory for a rebuild; names sort by creation time."""
+    version = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    path = os.path.join(root, VERSIONS_DIR, version)
+    os.makedirs(path)
+    return path
+
+
+def collect_garbage(directory: str, current: str, keep: int,
+                    age: Optional[Callable[[str], Any]] = None) -> List[str]:
+    """
+    Delete old version directories, keeping the current one and the newest others up to `keep` in total.
+
+    The version before the current one is kept by default so workers that have not
+    yet noticed the flip (and a rollback) still have it. Directory mtimes are not
+    used: they change whenever a file inside is added or removed.
+
+    Args:
+        directory: Directory holding the version directories
+        current: Name of the current version, which is never deleted
+        keep: Versions to keep, including the current one
+        age: Sort key of a version name, larger for newer versions; defaults to the
+            name itself, which is the creation time for new_version_directory names
+
+    Returns:
+        Names of the deleted versions
+    """
+    versions = sorted(
+        (name for name in os.listdir(directory)
+         if os.path.isdir(os.path.join(directory, name)) and not name.startswith(".") and name != current),
+        key=age, reverse=True,
+    )
+    removed = versions[max(0, keep - 1):]
+    for name in removed:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+        logger.info("Deleted old index version %s", name)
+    return removed
+
+
+_lock = threading.Lock()
+_pending = None
+_state: Dict[str, Any] = {"pid": None, "reloads": 0, "last_reload": None, "error": None, "failed_directory": None}
+# Swaps so far; each request is counted under the generation it started in
+_generation = 0
+_in_flight: Dict[int, int] = {}
+# (last generation that served it, store) of replaced stores not closed yet
+_retired: List[Tuple[int, Any]] = []
+
+
+def begin_request() -> int:
+    """Count a request as in flight; pass the returned generation to end_request() when it finishes."""
+    with _lock:
+        _in_flight[_generation] = _in_flight.get(_generation, 0) + 1
+        return _generation
+
+
+def end_request(generation: int) -> None:
+    """Stop counting a request, closing the replaced stores it was the last possible user of."""
+    with _lock:
+        _in_flight[generation] -= 1
+        if not _in_flight[generation]:
+            del _in_flight[generation]
+    _close_retired()
+
+
+def _close_retired() -> None:
+    with _lock:
+        oldest = min(_in_flight, default=_generation)
+        closable = [store for served_until, store in _retired if served_until < oldest]
+        _retired[:] = [(served_until, store) for served_until, store in _retired if served_until >= oldest]
+    for store in closable:
+        _close(store)
+
+
+def _close(store) -> None:
+    try:
+        store.close()
+    except Exception as e:
+        logger.error("Cannot close the replaced index %s: %s", getattr(store, "directory", None), e)
+
+
+def check_for_new_index() -> bool:
+    """
+    Open the index the pointer names if it is not the one being served.
+
+    The new store is warmed here, off the request path, and only swapped in by apply_pending().
+    A version that fails to open is not retried until the pointer moves again.
+
+    Returns:
+        True if a new store is waiting to be swapped in
+    """
+    global _pending
+    from vector_store import live_directory, open_vector_store, vector_store
+
+    # Nothing is served yet; the first request opens whatever is current
+    if not vector_store.initialized:
+        return False
+    target = live_directory()
+    if target in (vector_store.directory, _state["failed_directory"]):
+        return False
+    if _pending is not None and _pending.directory == target:
+        return True
+
+    start = time.perf_counter()
+    try:
+        store = open_vector_store()
+        store.search(WARMUP_QUERY, k=1)
+    except Exception as e:
+        logger.error("Cannot open the new index %s, still serving %s: %s", target, vector_store.directory, e)
+        _state.update(error=str(e), failed_directory=target)
+        return False
+    with _lock:
+        # A newer version overtook one that was opened but never served
+        superseded, _pending = _pending, store
+    if superseded is not None:
+        _close(superseded)
+    _state.update(error=None, failed_directory=None)
+    logger.info("Opened new index %s in %.2fs", target, time.perf_counter() - start)
+    return True
+
+
+def apply_pending() -> None:
+    """Swap in a newly opened index; called between requests, before begin_request()."""
+    global _pending, _generation
+    if _pending is None:
+        return
+    from vector_store import vector_store
+
+    with _lock:
+        store, _pending = _pending, None
+        if store is None:
+            return
+        previous = vector_store.replace(store)
+        if previous is not None:
+            _retired.append((_generation, previous))
+        _generation += 1
+    # Closed now if no request is running, otherwise when the last one that may use it ends
+    _close_retired()
+    _state["reloads"] += 1
+    _state["last_reload"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    logger.info("Now serving index %s (was %s)", store.directory, getattr(previous, "directory", None))
+
+
+def _watch(interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        try:
+            check_for_new_index()
+        except Exception as e:
+            logger.error("Index reload check failed: %s", e)
+
+
+def start_watcher(interval: float = VECTOR_RELOAD_INTERVAL) -> None:
+    """Poll the index pointer in a background thread, once per process; an interval of 0 disables reloads."""
+    if interval <= 0:
+        return
+    with _lock:
+        if _state["pid"] == os.getpid():
+            return
+        _state["pid"] = os.getpid()
+    threading.Thread(target=_watch, args=(interval,), name="index-reload", daemon=True).start()
+
+
+def status() -> Dict[str, Any]:
+    """Which index this process serves and its reload history."""
+    from vector_store import vector_store
+
+    return {"directory": vector_store.directory if vector_store.initialized else None,
+            "reloads": _state["reloads"], "last_reload": _state["last_reload"], "error": _state["error"],
+            "retired_open": len(_retired)}
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Streaming bulk ingestion of question banks and content into the vector store.
+
+Rows are read lazily from JSONL, CSV or Parquet files (optionally gzipped for
+JSONL/CSV), validated, and embedded in large batches by a pool of worker
+processes, each with its own copy of the embedding model. Results are written
+in input order with one backend write per partition per batch. Partitions are
+persisted only at checkpoints, every --checkpoint-every documents. After a
+crash, --resume continues from the last checkpoint. Document IDs are content
+hashes, so replaying the rows after the checkpoint overwrites rather than
+duplicates. Content longer than CONTENT_CHUNK_TOKENS is stored as
+overlapping chunks (see chunking.py). Near-duplicate questions, of each
+other or of questions already stored, are dropped (see dedup.py).
+
+Row fields: text (or question/content), type (question or content; defaults
+to question when an answer is given), topic, difficulty (questions), answer
+(questions), grade, subject, source (defaults to the file name).
+
+    python ingest.py question_bank.jsonl --workers 4
+    python ingest.py question_bank.parquet --resume --rejects rejects.jsonl
+    python ingest.py question_bank.jsonl --dedup-report duplicates.jsonl
+"""
+
+import argparse
+import csv
+import gzip
+import hashlib
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema.document import Document
+
+from chunking import chunk_document
+from config import (DEDUP_EMBEDDING_THRESHOLD, DEDUP_ENABLED, DEDUP_JACCARD_THRESHOLD, DEFAULT_DIFFICULTY_LEVELS,
+                    VECTOR_BACKEND, VECTOR_STORE_DIR)
+from dedup import NearDuplicateFilter
+from index_versions import store_directory
+from logger import logger
+from vector_store import VectorStore, create_embedding_model, document_id
+
+CHECKPOINT_DIR = "ingest_checkpoints"
+
+
+class RowError(ValueError):
+    """A row that cannot be ingested."""
+
+
+def _open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+
+def read_jsonl(path: str) -> Iterator[Dict]:
+    with _open_text(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                yield RowError(f"invalid JSON: {e}")
+
+
+def read_csv(path: str) -> Iterator[Dict]:
+    with _open_text(path) as f:
+        yield from csv.DictReader(f)
+
+
+def read_parquet(path: str, batch_rows: int = 10000) -> Iterator[Dict]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Reading Parquet files requires pyarrow (pip install pyarrow)")
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_rows):
+        yield from batch.to_pylist()
+
+
+READERS = {"jsonl": read_jsonl, "ndjson": read_jsonl, "csv": read_csv, "parquet": read_parquet}
+
+
+def detect_format(path: str) -> str:
+    name = path[:-3] if path.endswith(".gz") else path
+    extension = os.path.splitext(name)[1].lstrip(".").lower()
+    if extension not in READERS:
+        raise ValueError(f"Cannot tell the format of {path}; pass --format ({', '.join(READERS)})")
+    return extension
+
+
+def validate_row(row, default_source: str) -> Document:
+    """Turn a raw row into a Document with the metadata the retrieval code expects, or raise RowError."""
+    if isinstance(row, RowError):
+        raise row
+
+    def field(name: str) -> Optional[str]:
+        value = row.get(name)
+        if value is None:
+            return None
+        return str(value).strip() or None
+
+    text = field("text") or field("question") or field("content")
+    if not text:
+        raise RowError("missing text")
+    answer = field("answer")
+    doc_type = (field("type") or ("question" if answer else "content")).lower()
+    if doc_type not in ("question", "content"):
+        raise RowError(f"unknown type {doc_type!r}")
+    topic = field("topic")
+    if not topic:
+        raise RowError("missing topic")
+
+    metadata = {"type": doc_type, "topic": topic, "source": field("source") or default_source}
+    for name in ("grade", "subject"):
+        value = field(name)
+        if value:
+            metadata[name] = value
+    if doc_type == "question":
+        difficulty = (field("difficulty") or "").lower()
+        if difficulty not in DEFAULT_DIFFICULTY_LEVELS:
+            raise RowError(f"difficulty must be one of {DEFAULT_DIFFICULTY_LEVELS}, got {difficulty or None!r}")
+        if not answer:
+            raise RowError("question without an answer")
+        metadata.update(difficulty=difficulty, answer=answer)
+    return Document(page_content=text, metadata=metadata)
+
+
+class Checkpoint:
+    """Progress of one input file, saved atomically next to the store."""
+
+    def __init__(self, input_path: str, store_directory: str):
+        self.input_path = os.path.abspath(input_path)
+        digest = hashlib.sha1(self.input_path.encode("utf-8")).hexdigest()[:12]
+        self.path = os.path.join(store_directory, CHECKPOINT_DIR,
+                                 f"{os.path.basename(input_path)}-{digest}.json")
+
+    def _fingerprint(self) -> Dict:
+        stat = os.stat(self.input_path)
+        return {"input": self.input_path, "size": stat.st_size, "mtime": stat.st_mtime}
+
+    def load(self) -> Optional[Dict]:
+        """Return the saved progress, or None if there is none; raises if the input has changed since."""
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, encoding="utf-8") as f:
+            state = json.load(f)
+        if {key: state.get(key) for key in ("input", "size", "mtime")} != self._fingerprint():
+            raise RuntimeError(f"{self.input_path} changed since the checkpoint was written; ingest it without --resume")
+        return state
+
+    def save(self, **progress) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({**self._fingerprint(), **progress}, f)
+        os.replace(tmp_path, self.path)
+
+
+# Embedding model of a pool worker process
+_worker_model = None
+
+
+def _init_worker(threads: int) -> None:
+    global _worker_model
+    _worker_model = create_embedding_model(threads=threads)
+    # Keep workers x threads within the cores; torch otherwise uses them all in every process
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(threads)
+
+
+def _embed(texts: List[str]) -> np.ndarray:
+    return np.asarray(_worker_model.embed_documents(texts), dtype=np.float32)
+
+
+def peak_rss_mb() -> Tuple[float, float]:
+    """Peak resident memory of this process and of the largest worker process, in MB."""
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024)
+
+
+class Ingestion:
+    """One run over one input file."""
+
+    def __init__(self, path: str, store: VectorStore, file_format: Optional[str] = None,
+                 batch_size: int = 256, workers: int = 1, checkpoint_every: int = 10000,
+                 source: Optional[str] = None, rejects_path: Optional[str] = None,
+                 dedup: Optional[NearDuplicateFilter] = None, dedup_report_path: Optional[str] = None):
+        self.path = path
+        self.store = store
+        self.reader = READERS[file_format or detect_format(path)]
+        self.batch_size = batch_size
+        self.workers = workers
+        self.checkpoint_every = checkpoint_every
+        self.source = source or os.path.basename(path).split(".")[0]
+        self.rejects_path = rejects_path
+        self.dedup = dedup
+        self.dedup_report_path = dedup_report_path
+        self.checkpoint = Checkpoint(path, store.directory)
+        self.stats = {"rows": 0, "documents": 0, "invalid": 0, "duplicates": 0, "near_duplicates": 0}
+
+    def _near_duplicate(self, report, doc_id: str, doc: Document, kept_id: str, stage: str,
+                        similarity: float) -> None:
+        self.stats["near_duplicates"] += 1
+        if report is not None:
+            report.write(json.dumps({"id": doc_id, "duplicate_of": kept_id, "stage": stage,
+                                     "similarity": round(similarity, 4), "topic": doc.metadata.get("topic"),
+                                     "difficulty": doc.metadata.get("difficulty"), "text": doc.page_content}) + "\n")
+
+    def _batches(self, skip_rows: int, rejects, report) -> Iterator[Tuple[int, List[str], List[Document]]]:
+        """Yield (rows consumed so far, ids, documents) per batch of valid, batch-unique documents."""
+        ids: List[str] = []
+        documents: List[Document] = []
+        seen = set()
+        for row_number, row in enumerate(self.reader(self.path), start=1):
+            if row_number <= skip_rows:
+                continue
+            self.stats["rows"] += 1
+            try:
+                doc = validate_row(row, self.source)
+            except RowError as e:
+                self.stats["invalid"] += 1
+                if self.stats["invalid"] <= 10:
+                    logger.warning("Skipping row %s of %s: %s", row_number, self.path, e)
+                if rejects is not None:
+                    rejects.write(json.dumps({"row": row_number, "error": str(e),
+                                              "data": row if isinstance(row, dict) else None}, default=str) + "\n")
+                continue
+            # Long content becomes several chunk documents, all written in the same batch
+            for doc in chunk_document(doc) if doc.metadata["type"] == "content" else [doc]:
+                doc_id = document_id(doc)
+                # Backends reject repeated IDs within one write
+                if doc_id in seen:
+                    self.stats["duplicates"] += 1
+                    continue
+                # Lexical near-duplicates are dropped before they cost any embedding time
+                match = self.dedup.check_text(doc_id, doc) if self.dedup else None
+                if match:
+                    self._near_duplicate(report, doc_id, doc, match[0], "minhash", match[1])
+                    continue
+                seen.add(doc_id)
+                ids.append(doc_id)
+                documents.append(doc)
+            if len(documents) >= self.batch_size:
+                yield row_number, ids, documents
+                ids, documents, seen = [], [], set()
+        if documents or self.stats["rows"]:
+            yield skip_rows + self.stats["rows"], ids, documents
+
+    def run(self, resume: bool = False) -> Dict:
+        state = self.checkpoint.load() if resume else None
+        if state and state.get("complete"):
+            logger.info("%s was already ingested completely (%s documents)", self.path, state["documents"])
+            return {**self.stats, "skipped_rows": state["rows"]}
+        skip_rows = state["rows"] if state else 0
+        previous = state or {}
+        if skip_rows:
+            logger.info("Resuming %s after row %s", self.path, skip_rows)
+
+        threads = max(1, (os.cpu_count() or 1) // max(1, self.workers))
+        executor = None
+        if self.workers:
+            # spawn: forking a parent that has touched torch or onnxruntime thread pools can deadlock
+            executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                           initializer=_init_worker, initargs=(threads,))
+        else:
+            _init_worker(threads)
+
+        def embed(documents):
+            if not documents:
+                return _ImmediateResult(None)
+            texts = [doc.page_content for doc in documents]
+            return executor.submit(_embed, texts) if executor else _ImmediateResult(_embed(texts))
+
+        if self.dedup:
+            self.dedup.attach_store(self.store)
+
+        start = time.perf_counter()
+        since_checkpoint = 0
+        rejects = open(self.rejects_path, "a", encoding="utf-8") if self.rejects_path else None
+        report = open(self.dedup_report_path, "a", encoding="utf-8") if self.dedup_report_path else None
+        pending = deque()
+        try:
+            def write(rows_done, ids, documents, future):
+                nonlocal since_checkpoint
+                if documents:
+                    vectors = future.result()
+                    if self.dedup:
+                        keep, duplicates = self.dedup.check_vectors(ids, documents, vectors)
+                        for position, kept_id, similarity in duplicates:
+                            self._near_duplicate(report, ids[position], documents[position], kept_id,
+                                                 "embedding", similarity)
+                        ids = [doc_id for doc_id, kept in zip(ids, keep) if kept]
+                        documents = [doc for doc, kept in zip(documents, keep) if kept]
+                        vectors = vectors[np.asarray(keep, dtype=bool)]
+                    if documents:
+                        self.store.add_embedded(ids, documents, vectors, persist=False)
+                self.stats["documents"] += len(documents)
+                since_checkpoint += len(documents)
+                if since_checkpoint >= self.checkpoint_every:
+                    self._checkpoint(rows_done, previous, start)
+                    since_checkpoint = 0
+                return rows_done
+
+            rows_done = skip_rows
+            for rows_end, ids, documents in self._batches(skip_rows, rejects, report):
+                pending.append((rows_end, ids, documents, embed(documents)))
+                # Bounded look-ahead keeps every worker busy without buffering the whole file
+                while len(pending) > 2 * max(1, self.workers):
+                    rows_done = write(*pending.popleft())
+            while pending:
+                rows_done = write(*pending.popleft())
+            self._checkpoint(rows_done, previous, start, complete=True)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+            if rejects is not None:
+                rejects.close()
+            if report is not None:
+                report.close()
+
+        elapsed = time.perf_counter() - start
+        main_rss, worker_rss = peak_rss_mb()
+        if self.dedup:
+            self.stats["dedup"] = self.dedup.report()
+        return {**self.stats, "skipped_rows": skip_rows, "seconds": round(elapsed, 2),
+                "docs_per_second": round(self.stats["documents"] / elapsed, 1) if elapsed else 0.0,
+                "peak_rss_mb": round(main_rss, 1), "peak_worker_rss_mb": round(worker_rss, 1)}
+
+    def _checkpoint(self, rows_done: int, previous: Dict, start: float, complete: bool = False) -> None:
+        """Persist everything written so far, then record how far the input has been consumed."""
+        self.store.persist()
+        self.checkpoint.save(rows=rows_done,
+                             documents=previous.get("documents", 0) + self.stats["documents"],
+                             invalid=previous.get("invalid", 0) + self.stats["invalid"],
+                             complete=complete)
+        elapsed = time.perf_counter() - start
+        logger.info("Checkpoint at row %s: %s documents, %.1f docs/s, peak RSS %.0f MB",
+                    rows_done, self.stats["documents"], self.stats["documents"] / elapsed if elapsed else 0.0,
+                    peak_rss_mb()[0])
+
+
+class _ImmediateResult:
+    """Future-like wrapper for results computed in this process."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def result(self):
+        return self.value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="JSONL, CSV or Parquet file")
+    parser.add_argument("--format", choices=sorted(READERS), help="input format; detected from the extension")
+    parser.add_argument("--source", help="metadata source for rows without one (default: the file name)")
+    parser.add_argument("--batch-size", type=int, default=256, help="documents per embedding batch and write")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="embedding processes; 0 embeds in this process")
+    parser.add_argument("--checkpoint-every", type=int, default=10000, help="documents between persists")
+    parser.add_argument("--resume", action="store_true", help="continue from the last checkpoint for this file")
+    parser.add_argument("--rejects", help="append invalid rows with their errors to this JSONL file")
+    parser.add_argument("--no-dedup", dest="dedup", action="store_false", default=DEDUP_ENABLED,
+                        help="keep near-duplicate questions")
+    parser.add_argument("--jaccard-threshold", type=float, default=DEDUP_JACCARD_THRESHOLD,
+                        help="MinHash similarity at which a question is a near-duplicate")
+    parser.add_argument("--similarity-threshold", type=float, default=DEDUP_EMBEDDING_THRESHOLD,
+                        help="embedding cosine similarity at which a question is a paraphrase")
+    parser.add_argument("--dedup-report", help="append every dropped near-duplicate to this JSONL file")
+    parser.add_argument("--backend", default=VECTOR_BACKEND)
+    parser.add_argument("--store-dir", default=VECTOR_STORE_DIR, help="store root; its current version is written to")
+    args = parser.parse_args()
+
+    try:
+        # Write-only: skip building the in-memory indexes over what is already stored
+        store = VectorStore(backend_kind=args.backend, directory=store_directory(args.store_dir), load_indexes=False)
+        ingestion = Ingestion(args.input, store, file_format=args.format, batch_size=args.batch_size,
+                              workers=args.workers, checkpoint_every=args.checkpoint_every,
+                              source=args.source, rejects_path=args.rejects,
+                              dedup=NearDuplicateFilter(args.jaccard_threshold, args.similarity_threshold)
+                              if args.dedup else None,
+                              dedup_report_path=args.dedup_report)
+        report = ingestion.run(resume=args.resume)
+    except Exception as e:
+        logger.error("Ingestion of %s failed: %s", args.input, e)
+        return 1
+    print(json.dumps(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
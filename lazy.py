@@ -0,0 +1,60 @@
+"""
+Thread-safe lazy singletons.
+
+Module-level objects that are expensive to build (the embedding model, the
+vector store, the LLM chains) are wrapped in Lazy so importing a module only
+defines them. The first use, or an explicit warm-up, builds the object once
+per process; concurrent first users wait on the same lock instead of each
+building their own copy.
+"""
+
+import threading
+import time
+from typing import Callable, Generic, Optional, TypeVar
+
+from logger import logger
+
+T = TypeVar("T")
+
+
+class Lazy(Generic[T]):
+    """Proxy that builds its object on first attribute access (or get()) and delegates to it."""
+
+    def __init__(self, factory: Callable[[], T], name: str):
+        self._factory = factory
+        self._name = name
+        self._lock = threading.Lock()
+        self._instance: Optional[T] = None
+
+    def get(self) -> T:
+        """Return the object, building it if this is the first call in the process."""
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    start = time.perf_counter()
+                    # A failing factory leaves the proxy empty, so the next call retries
+                    self._instance = self._factory()
+                    logger.info("Initialized %s in %.2fs", self._name, time.perf_counter() - start)
+                instance = self._instance
+        return instance
+
+    def replace(self, instance: T) -> Optional[T]:
+        """Swap in a new object (e.g. a reopened index) and return the previous one."""
+        with self._lock:
+            previous, self._instance = self._instance, instance
+        return previous
+
+    @property
+    def initialized(self) -> bool:
+        return self._instance is not None
+
+    def __getattr__(self, attr):
+        # Only reached for attributes the proxy itself lacks; guard its own fields against
+        # recursion on half-built copies (copy/pickle create instances without __init__)
+        if attr in ("_factory", "_name", "_lock", "_instance"):
+            raise AttributeError(attr)
+        return getattr(self.get(), attr)
+
+    def __repr__(self):
+        return f"Lazy({self._name}, initialized={self.initialized})"
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Append-only log of learner events and per-learner resume snapshots.
+
+Each question asked and each answer evaluated is appended as an event to a
+SQLite database in WAL mode (LEARNER_EVENTS_DB). An event records the
+learner, session, topic, difficulty, question ID, answer, correctness and
+timings. After every turn, the agent's state is also queued as the learner's
+snapshot. A returning learner, in a new session or after a restart, resumes
+from that snapshot in one read instead of replaying the conversation.
+
+Writes never happen on the request path. record() and save_snapshot() put
+items on a bounded queue, and one writer thread per process commits
+everything queued in a single transaction: every LEARNER_EVENTS_FLUSH_MS, or
+sooner once LEARNER_EVENTS_BATCH_SIZE items are waiting. Only the latest
+snapshot of each learner in a batch is written. If the queue is full, items
+are dropped and counted rather than blocking the request. With WAL, gunicorn
+workers append concurrently, and readers never wait for writers.
+
+    python learner_events.py stats                   # accuracy and timings per topic and difficulty
+    python learner_events.py export events.jsonl     # events as JSON lines for offline analysis
+    python learner_events.py show LEARNER_ID         # a learner's snapshot and latest events
+"""
+
+import argparse
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from config import (
+    LEARNER_EVENTS_BATCH_SIZE, LEARNER_EVENTS_DB, LEARNER_EVENTS_ENABLED, LEARNER_EVENTS_FLUSH_MS,
+    LEARNER_EVENTS_QUEUE_SIZE
+)
+from logger import logger
+from metrics import LEARNER_EVENT_BATCH, LEARNER_EVENTS
+
+SNAPSHOT_FORMAT = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    learner_id TEXT NOT NULL,
+    session_id TEXT,
+    kind TEXT NOT NULL,
+    topic TEXT,
+    difficulty TEXT,
+    question_id TEXT,
+    is_correct INTEGER,
+    response_ms REAL,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS events_learner ON events (learner_id, id);
+CREATE TABLE IF NOT EXISTS snapshots (
+    learner_id TEXT PRIMARY KEY,
+    ts REAL NOT NULL,
+    state TEXT NOT NULL
+);
+"""
+
+EVENT_COLUMNS = ("ts", "learner_id", "session_id", "kind", "topic", "difficulty", "question_id",
+                 "is_correct", "response_ms", "data")
+
+
+def connect(path: str = LEARNER_EVENTS_DB) -> sqlite3.Connection:
+    """Open the event database, creating it in WAL mode if needed."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    # A commit is durable against process crashes; fsync happens at checkpoints
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class EventLog:
+    """Queues events and snapshots and group-commits them from a background thread."""
+
+    def __init__(self, path: str = LEARNER_EVENTS_DB, flush_ms: float = LEARNER_EVENTS_FLUSH_MS,
+                 batch_size: int = LEARNER_EVENTS_BATCH_SIZE, queue_size: int = LEARNER_EVENTS_QUEUE_SIZE):
+        self.path = path
+        self.flush_interval = flush_ms / 1000.0
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._queue: Optional[queue.Queue] = None
+        self._pid = None
+        self._reader: Optional[sqlite3.Connection] = None
+        self._reader_pid = None
+
+    def _ensure_writer(self) -> queue.Queue:
+        # Started lazily, and again after a fork, since threads do not survive into gunicorn workers
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(self.queue_size)
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, args=(self._queue,), name="learner-events",
+                                 daemon=True).start()
+            return self._queue
+
+    def _put(self, item) -> None:
+        try:
+            self._ensure_writer().put_nowait(item)
+        except queue.Full:
+            LEARNER_EVENTS.labels(result="dropped").inc()
+
+    def record(self, learner_id: str, kind: str, session_id: Optional[str] = None, topic: Optional[str] = None,
+               difficulty: Optional[str] = None, question_id: Optional[str] = None,
+               is_correct: Optional[bool] = None, response_ms: Optional[float] = None, **data) -> None:
+        """
+        Queue one event; extra keyword arguments are stored as JSON.
+
+        is_correct must already be parsed (see utils.parse_bool); anything but a bool is
+        stored as NULL rather than guessed, so a raw "false" never counts as correct.
+        """
+        self._put(("event", (time.time(), learner_id, session_id, kind, topic, difficulty, question_id,
+                             int(is_correct) if isinstance(is_correct, bool) else None, response_ms,
+                             json.dumps(data, ensure_ascii=False) if data else None)))
+
+    def save_snapshot(self, learner_id: str, state: Dict[str, Any]) -> None:
+        """
+        Queue the learner's latest resumable state.
+
+        The state is serialized here, on the caller's thread: it holds the agent's live
+        lists and dicts, which the next turn may change before the writer commits.
+        """
+        try:
+            payload = json.dumps(dict(state, format=SNAPSHOT_FORMAT), ensure_ascii=False)
+        except (TypeError, ValueError) as e:
+            LEARNER_EVENTS.labels(result="failed").inc()
+            logger.error("Cannot serialize the snapshot of learner %s: %s", learner_id, e)
+            return
+        self._put(("snapshot", (learner_id, time.time(), payload)))
+
+    def load_snapshot(self, learner_id: str) -> Optional[Dict[str, Any]]:
+        """The learner's last snapshot, or None; one indexed read."""
+        try:
+            with self._lock:
+                if self._reader_pid != os.getpid():
+                    self._reader = connect(self.path)
+                    self._reader_pid = os.getpid()
+                row = self._reader.execute("SELECT state FROM snapshots WHERE learner_id = ?",
+                                           (learner_id,)).fetchone()
+        except sqlite3.Error as e:
+            logger.error("Cannot read the snapshot of learner %s: %s", learner_id, e)
+            return None
+        if row is None:
+            return None
+        state = json.loads(row[0])
+        return state if state.get("format") == SNAPSHOT_FORMAT else None
+
+    def _run(self, items: queue.Queue) -> None:
+        connection = None
+        while True:
+            batch = [items.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(items.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                if connection is None:
+                    connection = connect(self.path)
+                self._commit(connection, batch)
+            except Exception as e:
+                # Anything escaping here would kill the writer thread and leave the queue to fill up
+                LEARNER_EVENTS.labels(result="failed").inc(len(batch))
+                logger.error("Dropped %s learner events: %s", len(batch), e)
+            finally:
+                for _ in batch:
+                    items.task_done()
+
+    def _commit(self, connection: sqlite3.Connection, batch: List) -> None:
+        events = [payload for kind, payload in batch if kind == "event"]
+        # Only each learner's newest snapshot in the batch matters
+        snapshots = {payload[0]: payload for kind, payload in batch if kind == "snapshot"}
+        with connection:
+            connection.executemany(
+                f"INSERT INTO events ({', '.join(EVENT_COLUMNS)}) VALUES ({', '.join('?' * len(EVENT_COLUMNS))})",
+                events)
+            connection.executemany(
+                "INSERT INTO snapshots (learner_id, ts, state) VALUES (?, ?, ?) "
+                "ON CONFLICT(learner_id) DO UPDATE SET ts = excluded.ts, state = excluded.state",
+                list(snapshots.values()))
+        LEARNER_EVENT_BATCH.observe(len(batch))
+        LEARNER_EVENTS.labels(result="written").inc(len(batch))
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until everything queued in this process is committed; False on timeout."""
+        items = self._queue if self._pid == os.getpid() else None
+        if items is None:
+            return True
+        end = time.monotonic() + timeout
+        while items.unfinished_tasks:
+            if time.monotonic() > end:
+                return False
+            time.sleep(0.01)
+        return True
+
+
+event_log = EventLog()
+# Commit what is still queued when the process exits normally
+atexit.register(event_log.flush)
+
+
+def load_event_log() -> Optional[EventLog]:
+    """The process-wide event log, or None when learner event logging is disabled."""
+    return event_log if LEARNER_EVENTS_ENABLED else None
+
+
+def _stats(connection: sqlite3.Connection) -> None:
+    rows = connection.execute(
+        "SELECT topic, difficulty, COUNT(*), AVG(is_correct), AVG(response_ms) FROM events "
+        "WHERE kind = 'answer' GROUP BY topic, difficulty ORDER BY COUNT(*) DESC").fetchall()
+    learners, events = connection.execute("SELECT COUNT(DISTINCT learner_id), COUNT(*) FROM events").fetchone()
+    print(f"{events} events from {learners} learners\n")
+    print(f"{'topic':<32} {'difficulty':<10} {'answers':>8} {'correct':>8} {'answer s':>9}")
+    for topic, difficulty, answers, correct, response_ms in rows:
+        print(f"{(topic or '-')[:32]:<32} {difficulty or '-':<10} {answers:>8} {(correct or 0):>8.0%} "
+              f"{(response_ms or 0) / 1000:>9.1f}")
+
+
+def _export(connection: sqlite3.Connection, out: str) -> None:
+    cursor = connection.execute(f"SELECT id, {', '.join(EVENT_COLUMNS)} FROM events ORDER BY id")
+    count = 0
+    with open(out, "w", encoding="utf-8") as f:
+        for row in cursor:
+            event = dict(zip(("id",) + EVENT_COLUMNS, row))
+            event.update(json.loads(event.pop("data") or "{}"))
+            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+            count += 1
+    print(f"Exported {count} events to {out}")
+
+
+def _show(connection: sqlite3.Connection, learner_id: str, limit: int) -> None:
+    row = connection.execute("SELECT state FROM snapshots WHERE learner_id = ?", (learner_id,)).fetchone()
+    print(json.dumps(json.loads(row[0]) if row else None, indent=2, ensure_ascii=False))
+    for row in connection.execute(
+            f"SELECT {', '.join(EVENT_COLUMNS)} FROM events WHERE learner_id = ? ORDER BY id DESC LIMIT ?",
+            (learner_id, limit)):
+        print(dict(zip(EVENT_COLUMNS, row)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=LEARNER_EVENTS_DB, help="event database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="accuracy and answer times per topic and difficulty")
+    export = commands.add_parser("export", help="write all events as JSON lines")
+    export.add_argument("out")
+    show = commands.add_parser("show", help="print a learner's snapshot and latest events")
+    show.add_argument("learner_id")
+    show.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"No event database at {args.db}", file=sys.stderr)
+        return 1
+    connection = connect(args.db)
+    if args.command == "stats":
+        _stats(connection)
+    elif args.command == "export":
+        _export(connection, args.out)
+    else:
+        _show(connection, args.learner_id, args.limit)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
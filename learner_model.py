@@ -0,0 +1,166 @@
+"""
+In-process learner model that picks the next practice after each answer.
+
+Every answer used to go through knowledge_analysis_chain with the whole chat
+history, only to get back a knowledge level, a topic and a difficulty. Those
+follow from the learner's recent correctness on the current learning path
+step. This model works them out locally with Bayesian knowledge tracing
+(BKT): each topic has a probability that the learner has mastered it, updated
+from each answer.
+
+- The posterior after an answer accounts for guessing and slipping. Guessing
+  is likelier on easier questions.
+- After each answer there is a LEARNER_P_LEARN chance the learner learned the
+  topic.
+- The mastery probability picks the difficulty (easy below 0.5, medium below
+  0.8, hard above) and the knowledge level.
+- The learner stays on a learning path step until mastery reaches
+  LEARNER_MASTERY_THRESHOLD after at least LEARNER_MIN_ATTEMPTS answers.
+
+The LLM is only consulted (Decision.consult_llm) when the model is unsure:
+- The learner is moving to the next step, or has finished the path.
+- The learner has answered LEARNER_MAX_ATTEMPTS times since the topic was last
+  analysed, e.g. without mastering the step.
+- The current topic is not on the learning path.
+Its answer is then fed back with align(). A topic the analysis keeps against
+the model's proposal is practised locally until LEARNER_MAX_ATTEMPTS more
+answers.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set
+
+from config import (
+    LEARNER_MASTERY_THRESHOLD, LEARNER_MAX_ATTEMPTS, LEARNER_MIN_ATTEMPTS,
+    LEARNER_P_INIT, LEARNER_P_LEARN, LEARNER_P_SLIP
+)
+
+# Chance of answering correctly without knowing the topic, by difficulty
+GUESS = {"easy": 0.3, "medium": 0.2, "hard": 0.1}
+# Mastery assumed for a topic the first analysis placed at a difficulty
+SEED_MASTERY = {"medium": 0.65, "hard": 0.85}
+LEVELS = [(0.5, "easy", "beginner"), (0.8, "medium", "intermediate"), (1.01, "hard", "advanced")]
+
+
+def path_topics(learning_path: Any) -> List[str]:
+    """The step topics of a learning path as planned by learning_path_chain, in step order."""
+    steps = learning_path.get("learning_path", []) if isinstance(learning_path, dict) else learning_path
+    if not isinstance(steps, list):
+        return []
+    steps = [step for step in steps if isinstance(step, dict) and step.get("topic")]
+    steps.sort(key=lambda step: step.get("step") if isinstance(step.get("step"), (int, float)) else 0)
+    return [str(step["topic"]) for step in steps]
+
+
+@dataclass
+class Decision:
+    """What to practise next; consult_llm means the model defers to knowledge_analysis_chain."""
+    knowledge_level: str
+    next_topic: str
+    difficulty: str
+    consult_llm: bool = False
+    reason: str = ""
+
+
+class LearnerModel:
+    """Per-topic knowledge tracing over one learning path."""
+
+    def __init__(self, learning_path: Any, topic: Optional[str], difficulty: Optional[str] = None):
+        self.learning_path = learning_path
+        self.topics = path_topics(learning_path)
+        self.mastery: Dict[str, float] = {}
+        self.attempts: Dict[str, int] = {}  # Answers since the topic was last analysed by the LLM
+        self.confirmed: Set[str] = set()
+        self.topic = topic or (self.topics[0] if self.topics else "")
+        self.difficulty = difficulty
+        self._seed(self.topic, difficulty)
+
+    def _seed(self, topic: str, difficulty: Optional[str]) -> None:
+        key = topic.lower()
+        if key not in self.mastery:
+            self.mastery[key] = max(LEARNER_P_INIT, SEED_MASTERY.get((difficulty or "").lower(), 0.0))
+            self.attempts[key] = 0
+
+    def _step(self, topic: str) -> Optional[int]:
+        for index, step_topic in enumerate(self.topics):
+            if step_topic.lower() == topic.lower():
+                return index
+        return None
+
+    def _level(self, mastery: float):
+        return next((difficulty, level) for bound, difficulty, level in LEVELS if mastery < bound)
+
+    def observe(self, is_correct: bool, difficulty: Optional[str] = None) -> Decision:
+        """
+        Update the current topic with an answer and decide what comes next.
+
+        Args:
+            is_correct: Whether the learner's answer was judged correct
+            difficulty: Difficulty of the question answered (defaults to the last one chosen)
+
+        Returns:
+            The next practice; when consult_llm is set, it is the model's proposal only
+        """
+        key = self.topic.lower()
+        self._seed(self.topic, difficulty)
+        guess = GUESS.get((difficulty or self.difficulty or "").lower(), GUESS["medium"])
+        known = self.mastery[key]
+        if is_correct:
+            posterior = known * (1 - LEARNER_P_SLIP) / (known * (1 - LEARNER_P_SLIP) + (1 - known) * guess)
+        else:
+            posterior = known * LEARNER_P_SLIP / (known * LEARNER_P_SLIP + (1 - known) * (1 - guess))
+        self.mastery[key] = posterior + (1 - posterior) * LEARNER_P_LEARN
+        self.attempts[key] += 1
+        return self._decide()
+
+    def _decide(self) -> Decision:
+        key = self.topic.lower()
+        mastery, attempts = self.mastery[key], self.attempts[key]
+        step = self._step(self.topic)
+        difficulty, level = self._level(mastery)
+        if attempts >= LEARNER_MAX_ATTEMPTS:
+            return Decision(level, self.topic, difficulty, True, f"{attempts} answers since the last analysis")
+        if key in self.confirmed:
+            self.difficulty = difficulty
+            return Decision(level, self.topic, difficulty, False, f"mastery {mastery:.2f}, topic kept by the analysis")
+        if step is None:
+            return Decision(level, self.topic, difficulty, True, "topic is not on the learning path")
+
+        if mastery >= LEARNER_MASTERY_THRESHOLD and attempts >= LEARNER_MIN_ATTEMPTS:
+            if step + 1 < len(self.topics):
+                next_topic = self.topics[step + 1]
+                self._seed(next_topic, None)
+                difficulty, level = self._level(self.mastery[next_topic.lower()])
+                return Decision(level, next_topic, difficulty, True, f"mastered step {step + 1}")
+            return Decision(level, self.topic, difficulty, True, "mastered the last step")
+
+        self.difficulty = difficulty
+        return Decision(level, self.topic, difficulty, False, f"mastery {mastery:.2f} after {attempts} answers")
+
+    def align(self, topic: Optional[str], difficulty: Optional[str]) -> None:
+        """Follow the topic and difficulty the LLM chose after a consult_llm decision."""
+        if not topic:
+            return
+        key = topic.lower()
+        if key == self.topic.lower() or self._step(topic) is None:
+            # The analysis overruled the model: keep this topic locally until LEARNER_MAX_ATTEMPTS more answers
+            self.confirmed.add(key)
+        else:
+            self.confirmed.discard(key)
+        self.attempts[key] = 0
+        self.topic = topic
+        self.difficulty = difficulty
+        self._seed(topic, difficulty)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"topic": self.topic, "difficulty": self.difficulty, "mastery": dict(self.mastery),
+                "attempts": dict(self.attempts), "confirmed": sorted(self.confirmed)}
+
+    @classmethod
+    def from_dict(cls, learning_path: Any, data: Dict[str, Any]) -> "LearnerModel":
+        """Rebuild a model saved with to_dict, e.g. from a learner's resume snapshot."""
+        model = cls(learning_path, data.get("topic"), data.get("difficulty"))
+        model.mastery.update(data.get("mastery", {}))
+        model.attempts.update(data.get("attempts", {}))
+        model.confirmed.update(data.get("confirmed", []))
+        return model
@@ -0,0 +1,172 @@
+"""
+In-process BM25 index for keyword retrieval.
+
+Topic queries such as "photosynthesis" or "quadratic equations" are usually
+exact keyword matches, which BM25 answers without an embedding model call.
+VectorStore keeps a BM25Index next to its metadata index and uses it either on
+its own (when the keyword match is unambiguous) or fused with vector results
+through reciprocal_rank_fusion.
+"""
+
+import heapq
+import math
+import re
+import threading
+from typing import Container, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from langchain.schema.document import Document
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from how if in into is it its of on or that the
+their there these this to was what when where which who why will with you your
+""".split())
+
+# (id, score, coverage); coverage is the idf-weighted share of query terms the document contains
+LexicalHit = Tuple[str, float, float]
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords; underscores split words, as in topic keys."""
+    return [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over document text plus selected metadata fields.
+
+    Metadata fields are indexed as extra weighted occurrences of their tokens,
+    so a question about "x² - 9" still matches the query "algebra" through its
+    topic.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, field_weights: Optional[Dict[str, int]] = None):
+        self.k1 = k1
+        self.b = b
+        self.field_weights = field_weights if field_weights is not None else {"topic": 2}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._terms: Dict[str, Dict[str, int]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def _document_terms(self, document: Document) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for token in tokenize(document.page_content):
+            counts[token] = counts.get(token, 0) + 1
+        for field, weight in self.field_weights.items():
+            value = document.metadata.get(field)
+            if value is not None:
+                for token in tokenize(str(value)):
+                    counts[token] = counts.get(token, 0) + weight
+        return counts
+
+    def add(self, ids: List[str], documents: List[Document]) -> None:
+        """Index documents under their stored IDs, replacing any previous entry."""
+        with self._lock:
+            for doc_id, document in zip(ids, documents):
+                self._remove(doc_id)
+                counts = self._document_terms(document)
+                self._terms[doc_id] = counts
+                self._lengths[doc_id] = sum(counts.values())
+                self._total_length += self._lengths[doc_id]
+                for term, count in counts.items():
+                    self._postings.setdefault(term, {})[doc_id] = count
+
+    def remove(self, ids: Iterable[str]) -> None:
+        """Drop documents from the index."""
+        with self._lock:
+            for doc_id in ids:
+                self._remove(doc_id)
+
+    def _remove(self, doc_id: str) -> None:
+        counts = self._terms.pop(doc_id, None)
+        if counts is None:
+            return
+        self._total_length -= self._lengths.pop(doc_id)
+        for term in counts:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def _idf(self, term: str) -> float:
+        df = len(self._postings.get(term, ()))
+        return math.log(1.0 + (len(self._terms) - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int, filters: Sequence[Set[str]] = (),
+               exclude: Optional[Container[str]] = None) -> List[LexicalHit]:
+        """
+        Return the k best-scoring documents for a keyword query.
+
+        Filters are never intersected up front: each term walks either its own
+        postings or the smallest filter set, whichever is shorter, and checks
+        membership in the rest. Terms are scored rarest first; once the terms
+        left could not lift an unseen document into the top k (MaxScore), the
+        common ones only update documents already scored instead of walking
+        their whole postings.
+
+        Args:
+            query: Free-text query
+            k: Number of hits to return
+            filters: Sets of allowed IDs, a document must be in all of them (e.g. the
+                metadata index postings of each filter value, smallest first); only read
+            exclude: Optional IDs to leave out (e.g. a learner's seen questions)
+
+        Returns:
+            Hits sorted by descending score; documents matching no query term are omitted
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            if not terms or not self._terms:
+                return []
+            average_length = self._total_length / len(self._terms)
+            weights = {term: self._idf(term) for term in terms}
+            total_weight = sum(weights.values())
+            terms.sort(key=weights.__getitem__, reverse=True)
+            # A term adds at most idf * (k1 + 1) to a document's score
+            remaining = sum(weights.values()) * (self.k1 + 1.0)
+            scores: Dict[str, float] = {}
+            matched: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term, {})
+                if len(scores) >= k and remaining <= heapq.nlargest(k, scores.values())[-1]:
+                    # No document outside the current candidates can reach the top k any more
+                    matches = [(doc_id, postings.get(doc_id)) for doc_id in scores]
+                    required = ()
+                elif filters and len(filters[0]) < len(postings):
+                    # list() of a set runs without releasing the GIL, so a concurrent add cannot break it
+                    matches = ((doc_id, postings.get(doc_id)) for doc_id in list(filters[0]))
+                    required = filters[1:]
+                else:
+                    matches = postings.items()
+                    required = filters
+                remaining -= weights[term] * (self.k1 + 1.0)
+                for doc_id, count in matches:
+                    if not count or any(doc_id not in allowed for allowed in required) \
+                            or (exclude is not None and doc_id in exclude):
+                        continue
+                    norm = self.k1 * (1.0 - self.b + self.b * self._lengths[doc_id] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + weights[term] * count * (self.k1 + 1.0) / (count + norm)
+                    matched[doc_id] = matched.get(doc_id, 0.0) + weights[term]
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(doc_id, score, matched[doc_id] / total_weight) for doc_id, score in best]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int, rrf_k: int = 60) -> List[str]:
+    """
+    Merge ranked ID lists with reciprocal rank fusion.
+
+    Each list contributes 1 / (rrf_k + rank) for every ID it contains; IDs are
+    returned by descending total, ties broken by first appearance.
+    """
+    totals: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            totals[doc_id] = totals.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(totals, key=totals.__getitem__, reverse=True)[:k]
@@ -0,0 +1,303 @@
+"""
+Shared, rate-limit-aware access to the LLM provider.
+
+Every chain call goes through one LLMScheduler per process, which keeps the
+process inside the provider's limits instead of finding them through 429s.
+
+- Requests per minute and tokens per minute are token buckets per model
+  (LLM_RPM_LIMIT and LLM_TPM_LIMIT, per-model overrides in LLM_RATE_LIMITS).
+  A call reserves one request and its estimated tokens: the prompt plus
+  max_tokens, or LLM_COMPLETION_TOKENS_ESTIMATE. The estimate is corrected
+  with the usage the provider reports once the call returns.
+- At most LLM_MAX_CONCURRENCY calls are in flight. All clients share one
+  pooled HTTP connection pool of that size.
+- Waiting calls are served by priority class, then in arrival order:
+  interactive (learner turns), then prefetch, then batch. Callers choose the
+  class with `llm_priority()`; the default is interactive. Prefetch and
+  batch calls also leave LLM_INTERACTIVE_RESERVE of each bucket unused, so
+  a learner's call rarely waits behind background work for a refill.
+- Each call has a queueing deadline, set per class by LLM_DEADLINES or
+  passed to `llm_priority()`. A call that cannot start before its deadline
+  raises DeadlineExceeded instead of waiting indefinitely.
+- A 429 or 5xx from the provider pauses that model's lane for the
+  Retry-After time. The call is then retried while its deadline allows, up
+  to LLM_MAX_RETRIES times. The OpenAI client's own retries are turned off,
+  so they cannot bypass the buckets.
+
+Limits apply per process. Under gunicorn, set them to the provider's limits
+divided by the number of workers.
+"""
+
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from config import (
+    LLM_DEADLINES, LLM_INTERACTIVE_RESERVE, LLM_MAX_CONCURRENCY, LLM_MAX_RETRIES, LLM_RATE_LIMITS, LLM_RPM_LIMIT,
+    LLM_TPM_LIMIT
+)
+from logger import logger
+from metrics import LLM_QUEUE_DEPTH, LLM_QUEUE_WAIT, LLM_REQUESTS, LLM_RETRIES, LLM_TOKENS
+
+PRIORITIES = {"interactive": 0, "prefetch": 1, "batch": 2}
+DEFAULT_RETRY_AFTER = 1.0
+
+_priority: contextvars.ContextVar = contextvars.ContextVar("llm_priority", default="interactive")
+_deadline: contextvars.ContextVar = contextvars.ContextVar("llm_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """An LLM call could not start before its queueing deadline."""
+
+
+class TokenBucket:
+    """Continuously refilled bucket holding up to one minute's allowance."""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float, reserve: float = 0.0) -> float:
+        """Seconds until `amount` is available with a `reserve` share of the capacity left over (0 if it is now)."""
+        self._refill(now)
+        needed = min(amount + reserve * self.capacity, self.capacity)
+        return 0.0 if self.level >= needed else (needed - self.level) / self.rate
+
+    def take(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.level -= amount
+
+    def give(self, amount: float) -> None:
+        """Return unused allowance; a negative amount charges more than was reserved."""
+        self.level = min(self.capacity, self.level + amount)
+
+
+class _Lane:
+    """Buckets, pause and waiting calls of one model."""
+
+    def __init__(self, rpm: float, tpm: float):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.paused_until = 0.0
+        self.waiting: List[List] = []
+
+    def wait_time(self, tokens: float, now: float, reserve: float) -> float:
+        return max(self.paused_until - now,
+                   self.requests.wait_time(1, now, reserve) if self.requests else 0.0,
+                   self.tokens.wait_time(tokens, now, reserve) if self.tokens else 0.0)
+
+
+class Ticket:
+    """A granted call and the tokens it reserved."""
+
+    __slots__ = ("model", "tokens")
+
+    def __init__(self, model: str, tokens: float):
+        self.model = model
+        self.tokens = tokens
+
+
+class LLMScheduler:
+    """Priority queue in front of per-model RPM/TPM token buckets and a concurrency limit."""
+
+    def __init__(self, rpm: float = LLM_RPM_LIMIT, tpm: float = LLM_TPM_LIMIT,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY, limits: Optional[Dict[str, Dict[str, float]]] = None,
+                 max_retries: int = LLM_MAX_RETRIES, interactive_reserve: float = LLM_INTERACTIVE_RESERVE):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.limits = LLM_RATE_LIMITS if limits is None else limits
+        self.max_retries = max_retries
+        self.interactive_reserve = interactive_reserve
+        self._cond = threading.Condition()
+        self._lanes: Dict[str, _Lane] = {}
+        self._active = 0
+        self._sequence = itertools.count()
+
+    def _lane(self, model: str) -> _Lane:
+        lane = self._lanes.get(model)
+        if lane is None:
+            limits = self.limits.get(model, {})
+            lane = self._lanes[model] = _Lane(limits.get("rpm", self.rpm), limits.get("tpm", self.tpm))
+        return lane
+
+    def acquire(self, model: str, tokens: float, priority: str = "interactive",
+                deadline: Optional[float] = None) -> Ticket:
+        """
+        Wait for this call's turn and reserve its request and tokens.
+
+        Args:
+            model: Model the call goes to (each model has its own limits and queue)
+            tokens: Estimated prompt plus completion tokens
+            priority: "interactive", "prefetch" or "batch"
+            deadline: time.monotonic() value after which the call gives up waiting
+
+        Raises:
+            DeadlineExceeded: if the call cannot start before the deadline
+        """
+        entry = [PRIORITIES[priority], next(self._sequence)]
+        reserve = self.interactive_reserve if entry[0] > PRIORITIES["interactive"] else 0.0
+        start = time.monotonic()
+        with self._cond:
+            lane = self._lane(model)
+            if lane.tokens:
+                # A call larger than the whole bucket would never fit; let it drain the bucket instead
+                tokens = min(tokens, lane.tokens.capacity)
+            heapq.heappush(lane.waiting, entry)
+            LLM_QUEUE_DEPTH.labels(priority=priority).inc()
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = None
+                    if lane.waiting[0] is entry and self._active < self.max_concurrency:
+                        wait = lane.wait_time(tokens, now, reserve)
+                        if wait <= 0:
+                            heapq.heappop(lane.waiting)
+                            if lane.requests:
+                                lane.requests.take(1, now)
+                            if lane.tokens:
+                                lane.tokens.take(tokens, now)
+                            self._active += 1
+                            # The next call in line may be able to start too
+                            self._cond.notify_all()
+                            LLM_QUEUE_WAIT.labels(priority=priority).observe(now - start)
+                            return Ticket(model, tokens)
+                    if deadline is not None and now >= deadline:
+                        lane.waiting.remove(entry)
+                        heapq.heapify(lane.waiting)
+                        self._cond.notify_all()
+                        LLM_REQUESTS.labels(priority=priority, outcome="deadline").inc()
+                        raise DeadlineExceeded(
+                            f"{priority} call to {model} waited {now - start:.1f}s without a slot")
+                    timeouts = [t for t in (wait, deadline - now if deadline is not None else None) if t is not None]
+                    self._cond.wait(min(timeouts) if timeouts else None)
+            finally:
+                LLM_QUEUE_DEPTH.labels(priority=priority).dec()
+
+    def release(self, ticket: Ticket, used_tokens: Optional[float] = None) -> None:
+        """Free the call's concurrency slot and settle its token reservation with the actual usage."""
+        with self._cond:
+            self._active -= 1
+            lane = self._lane(ticket.model)
+            if used_tokens is not None and lane.tokens:
+                lane.tokens.give(ticket.tokens - used_tokens)
+            self._cond.notify_all()
+
+    def pause(self, model: str, seconds: float) -> None:
+        """Hold every call to a model for `seconds`, e.g. after the provider answered 429."""
+        with self._cond:
+            lane = self._lane(model)
+            lane.paused_until = max(lane.paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def call(self, model: str, tokens: float, fn: Callable[[], Any], priority: Optional[str] = None,
+             deadline: Optional[float] = None) -> Any:
+        """
+        Run fn (one provider call to `model`) when the limits allow, retrying rate-limit and server errors.
+
+        Priority and deadline default to the ones set with llm_priority().
+        """
+        from langchain_community.callbacks import get_openai_callback
+
+        priority = priority or _priority.get()
+        deadline = deadline if deadline is not None else _deadline.get()
+        if deadline is None:
+            deadline = time.monotonic() + LLM_DEADLINES[priority]
+        for attempt in range(self.max_retries + 1):
+            ticket = self.acquire(model, tokens, priority, deadline)
+            used = None
+            try:
+                with get_openai_callback() as usage:
+                    result = fn()
+                if usage.total_tokens:
+                    used = usage.total_tokens
+                    LLM_TOKENS.labels(model=model, kind="prompt").inc(usage.prompt_tokens)
+                    LLM_TOKENS.labels(model=model, kind="completion").inc(usage.completion_tokens)
+                LLM_REQUESTS.labels(priority=priority, outcome="ok").inc()
+                return result
+            except Exception as e:
+                retry_after = retry_delay(e)
+                if retry_after is None or attempt == self.max_retries \
+                        or time.monotonic() + retry_after >= deadline:
+                    LLM_REQUESTS.labels(priority=priority, outcome="error").inc()
+                    raise
+                LLM_RETRIES.labels(model=model, status=str(getattr(e, "status_code", "error"))).inc()
+                logger.warning("LLM call to %s failed (%s), retrying in %.1fs", model, e, retry_after)
+                self.pause(model, retry_after)
+            finally:
+                self.release(ticket, used)
+
+
+def retry_delay(error: Exception) -> Optional[float]:
+    """Seconds to wait before retrying after a provider error, or None if it should not be retried."""
+    status = getattr(error, "status_code", None)
+    if status != 429 and not (isinstance(status, int) and status >= 500):
+        return None
+    response = getattr(error, "response", None)
+    header = response.headers.get("retry-after") if response is not None else None
+    try:
+        return max(0.0, float(header)) if header else DEFAULT_RETRY_AFTER
+    except ValueError:
+        return DEFAULT_RETRY_AFTER
+
+
+@contextmanager
+def llm_priority(priority: str, timeout: Optional[float] = None) -> Iterator[None]:
+    """
+    Run the enclosed LLM calls in a priority class.
+
+    Args:
+        priority: "interactive", "prefetch" or "batch"
+        timeout: Seconds the enclosed calls may queue in total (default LLM_DEADLINES[priority])
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown LLM priority {priority!r}; expected one of {', '.join(PRIORITIES)}")
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    priority_token = _priority.set(priority)
+    deadline_token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _priority.reset(priority_token)
+        _deadline.reset(deadline_token)
+
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def http_client():
+    """The pooled HTTP client every LLM client in this process shares."""
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            import httpx
+            _http_client = httpx.Client(limits=httpx.Limits(max_connections=LLM_MAX_CONCURRENCY,
+                                                            max_keepalive_connections=LLM_MAX_CONCURRENCY))
+        return _http_client
+
+
+def pooled_clients(api_base: str = "", timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    OpenAI clients for a chat model that use the shared connection pool and leave retries to the scheduler.
+
+    Returned as the client and async_client arguments of ChatOpenAI (the async one only exists because
+    ChatOpenAI requires it; the chains call the provider synchronously).
+    """
+    import openai
+    params = {"base_url": api_base or None, "timeout": timeout, "max_retries": 0}
+    return {"client": openai.OpenAI(http_client=http_client(), **params).chat.completions,
+            "async_client": openai.AsyncOpenAI(**params).chat.completions}
+
+
+scheduler = LLMScheduler()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for an OpenAI-compatible chat completions API.
+
+It answers POST /v1/chat/completions with plausible output for each of the
+agent's prompts: JSON for the JSON chains, text for the others. No network
+access or API key is needed. Each model gets a latency and quality profile:
+- time to first token
+- time per completion token
+- the share of answers that come back as malformed JSON
+
+Cheaper and faster models make more mistakes. Usage is reported the way the
+real API reports it, so cost can be worked out from token counts.
+`max_tokens` truncates the output.
+
+    python llm_standin.py --port 8090
+    python llm_standin.py --port 8090 --rpm 60 --tpm 20000
+    OPENAI_API_BASE=http://localhost:8090/v1 python app.py
+
+Profiles can be replaced or extended with --profiles, e.g.
+'{"my-model": {"ttft_ms": 100, "ms_per_token": 5, "json_error_rate": 0.1}}'.
+Models without a profile use DEFAULT_PROFILE. --speed scales every latency,
+e.g. 0.1 for quick benchmark runs.
+
+--rpm and --tpm enforce requests and tokens per minute per model, like the
+provider does. A request over the limit gets a 429 with a Retry-After header
+and an OpenAI-style rate limit error, so rate limiting and retries can be
+tested locally. Tokens are charged as prompt plus completion.
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+PROFILES: Dict[str, Dict[str, float]] = {
+    "gpt-4o-mini": {"ttft_ms": 150, "ms_per_token": 8, "json_error_rate": 0.08},
+    "gpt-3.5-turbo": {"ttft_ms": 200, "ms_per_token": 10, "json_error_rate": 0.05},
+    "gpt-4o": {"ttft_ms": 350, "ms_per_token": 18, "json_error_rate": 0.01},
+    "gpt-4": {"ttft_ms": 500, "ms_per_token": 30, "json_error_rate": 0.01},
+}
+DEFAULT_PROFILE = {"ttft_ms": 200, "ms_per_token": 10, "json_error_rate": 0.05}
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    """Approximate token count (words and punctuation), the same for prompts and completions."""
+    return len(_TOKEN.findall(text))
+
+
+def _section(prompt: str, label: str) -> str:
+    """Text after `label` up to the next blank line."""
+    match = re.search(re.escape(label) + r"\s*(.*?)(?:\n\s*\n|$)", prompt, re.S)
+    return match.group(1).strip() if match else ""
+
+
+def _line(prompt: str, label: str) -> str:
+    """Rest of the line after `label`."""
+    match = re.search(re.escape(label) + r"[ \t]*(.*)", prompt)
+    return match.group(1).strip() if match else ""
+
+
+def _words(text: str) -> set:
+    return {word for word in re.findall(r"\w+", text.lower()) if len(word) > 2}
+
+
+def respond(prompt: str) -> Tuple[Any, bool]:
+    """The answer to one of the agent's prompts, and whether it is meant to be JSON."""
+    if "Extract the grade level" in prompt:
+        words = _line(prompt, "User input:").lower()
+        grade = next((g for g in ("elementary", "middle school", "high school", "college") if g in words), None)
+        subject = next((s for s in ("math", "physics", "chemistry", "biology", "literature", "history")
+                        if s in words), None)
+        topic = words.rsplit(" ", 1)[-1] if words else None
+        return {"grade": grade, "subject": subject, "topic": topic}, True
+    if "plan a structured learning path" in prompt:
+        return {"learning_path": [
+            {"step": 1, "topic": "basic concepts", "description": "Definitions and the core vocabulary"},
+            {"step": 2, "topic": "core methods", "description": "Standard techniques with worked examples"},
+            {"step": 3, "topic": "applications", "description": "Multi-step problems that combine the methods"},
+        ]}, True
+    if "analyze the user's knowledge level" in prompt:
+        return {"knowledge_level": "beginner", "next_topic": "basic concepts", "difficulty": "easy",
+                "reasoning": "The learner is just starting, so begin with the basics."}, True
+    if "generate 3 educational questions" in prompt:
+        topic = _line(prompt, "Topic:")
+        return {"questions": [{"question": f"Question {i} about {topic}?", "answer": f"Answer {i} about {topic}."}
+                              for i in range(1, 4)]}, True
+    if "select the most appropriate one" in prompt:
+        try:
+            questions = json.loads(_section(prompt, "Available Questions (JSON list):"))
+            asked = json.loads(_section(prompt, "Asked Questions (JSON list):") or "[]")
+        except ValueError:
+            questions, asked = [], []
+        choice = next((q for q in questions if q.get("question") not in asked), questions[0] if questions else {})
+        return {"selected_question": choice.get("question", ""), "answer": choice.get("answer", ""),
+                "reasoning": "It matches the learner's level and has not been asked yet."}, True
+    if "Evaluate the user's answer" in prompt:
+        correct, given = _words(_line(prompt, "Correct answer:")), _words(_line(prompt, "User's answer:"))
+        is_correct = bool(correct) and len(correct & given) / len(correct) >= 0.5
+        return {"is_correct": is_correct,
+                "feedback": "Well done." if is_correct else "That is not quite right.",
+                "explanation": "This question checks the key definition of the topic.",
+                "tips_for_improvement": "Review the worked examples, then try a similar question."}, True
+    if "Choose your question type" in prompt:
+        return "authoritative", False
+    if "educational assistant" in prompt:
+        return ("Hello! I'm your learning assistant. Which grade level, subject and topic "
+                "would you like to study today?"), False
+    return "I can help with that. Could you tell me more about what you would like to learn?", False
+
+
+def render(answer: Any, is_json: bool, rng: random.Random, json_error_rate: float) -> str:
+    """Format an answer the way a chat model would, sometimes with broken JSON."""
+    if not is_json:
+        return answer
+    text = json.dumps(answer, indent=4, ensure_ascii=False)
+    if rng.random() < json_error_rate:
+        # The usual failure modes: a trailing comma or a cut-off object
+        broken = text.replace('"\n}', '",\n}', 1) if rng.random() < 0.5 else text
+        text = broken if broken != text else text[:len(text) // 2]
+    return f"```json\n{text}\n```"
+
+
+def truncate(text: str, max_tokens: int) -> str:
+    """Cut text after max_tokens tokens."""
+    tokens = list(_TOKEN.finditer(text))
+    return text if len(tokens) <= max_tokens else text[:tokens[max_tokens].start()].rstrip()
+
+
+class RateLimited(Exception):
+    """A request over the stand-in's requests or tokens per minute."""
+
+    def __init__(self, message: str, kind: str, retry_after: float, headers: Dict[str, str]):
+        super().__init__(message)
+        self.kind = kind
+        self.retry_after = retry_after
+        self.headers = headers
+
+
+class _Limit:
+    """Per-minute allowance refilled continuously, as the provider's limits are."""
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def available(self, now: float) -> float:
+        self.level = min(self.per_minute, self.level + (now - self.updated) * self.per_minute / 60.0)
+        self.updated = now
+        return self.level
+
+    def retry_after(self, amount: float) -> float:
+        return (min(amount, self.per_minute) - self.level) * 60.0 / self.per_minute
+
+
+class StandIn:
+    """Completion logic, latency model and rate limits, shared by all request threads."""
+
+    def __init__(self, profiles: Optional[Dict[str, Dict[str, float]]] = None, speed: float = 1.0, seed: int = 0,
+                 rpm: float = 0, tpm: float = 0):
+        self.profiles = dict(PROFILES, **(profiles or {}))
+        self.speed = speed
+        self.rpm = rpm
+        self.tpm = tpm
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._limits: Dict[str, Tuple[Optional[_Limit], Optional[_Limit]]] = {}
+        self.rate_limited = 0
+
+    def _admit(self, model: str, tokens: int) -> Dict[str, str]:
+        """Charge one request and its tokens to the model's limits, or raise RateLimited."""
+        with self._lock:
+            if model not in self._limits:
+                self._limits[model] = (_Limit(self.rpm) if self.rpm else None, _Limit(self.tpm) if self.tpm else None)
+            requests, token_limit = self._limits[model]
+            now = time.monotonic()
+            headers = {}
+            for kind, limit, amount in (("requests", requests, 1), ("tokens", token_limit, tokens)):
+                if limit is None:
+                    continue
+                headers[f"x-ratelimit-limit-{kind}"] = str(int(limit.per_minute))
+                if limit.available(now) < min(amount, limit.per_minute):
+                    self.rate_limited += 1
+                    retry_after = limit.retry_after(amount)
+                    headers.update({"retry-after": f"{retry_after:.3f}",
+                                    f"x-ratelimit-remaining-{kind}": str(int(limit.level)),
+                                    f"x-ratelimit-reset-{kind}": f"{retry_after:.3f}s"})
+                    unit = "requests per min (RPM)" if kind == "requests" else "tokens per min (TPM)"
+                    raise RateLimited(f"Rate limit reached for {model} on {unit}: Limit {int(limit.per_minute)}, "
+                                      f"Requested {amount}. Please try again in {retry_after:.3f}s.",
+                                      kind, retry_after, headers)
+            for limit, amount in ((requests, 1), (token_limit, tokens)):
+                if limit is not None:
+                    limit.level -= amount
+            for kind, limit in (("requests", requests), ("tokens", token_limit)):
+                if limit is not None:
+                    headers[f"x-ratelimit-remaining-{kind}"] = str(max(0, int(limit.level)))
+            return headers
+
+    def profile(self, model: str) -> Dict[str, float]:
+        return dict(DEFAULT_PROFILE, **self.profiles.get(model, {}))
+
+    def complete(self, request: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """The completion for a request and its rate limit headers; raises RateLimited over the limits."""
+        model = request.get("model") or "gpt-3.5-turbo"
+        prompt = "\n".join(str(message.get("content", "")) for message in request.get("messages", []))
+        profile = self.profile(model)
+        with self._lock:
+            rng = random.Random(self._rng.random())
+        answer, is_json = respond(prompt)
+        text = render(answer, is_json, rng, profile["json_error_rate"])
+        finish_reason = "stop"
+        max_tokens = request.get("max_tokens") or request.get("max_completion_tokens")
+        if max_tokens and count_tokens(text) > max_tokens:
+            text, finish_reason = truncate(text, max_tokens), "length"
+        prompt_tokens, completion_tokens = count_tokens(prompt), count_tokens(text)
+        headers = self._admit(model, prompt_tokens + completion_tokens)
+        time.sleep((profile["ttft_ms"] + profile["ms_per_token"] * completion_tokens) / 1000.0 * self.speed)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                         "finish_reason": finish_reason}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }, headers
+
+
+class _Handler(BaseHTTPRequestHandler):
+    standin: StandIn = None
+
+    def _send(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+            self._send(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send(400, {"error": {"message": "Request body is not JSON", "type": "invalid_request_error"}})
+            return
+        if request.get("stream"):
+            self._send(400, {"error": {"message": "Streaming is not supported", "type": "invalid_request_error"}})
+            return
+        try:
+            body, headers = self.standin.complete(request)
+        except RateLimited as e:
+            self._send(429, {"error": {"message": str(e), "type": e.kind, "param": None,
+                                       "code": "rate_limit_exceeded"}}, e.headers)
+            return
+        self._send(200, body, headers)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(standin: StandIn, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Start the stand-in in a background thread; the bound port is server.server_address[1]."""
+    handler = type("StandInHandler", (_Handler,), {"standin": standin})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="llm-standin", daemon=True).start()
+    return server
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--profiles", type=json.loads, default={}, help="model profiles as JSON")
+    parser.add_argument("--speed", type=float, default=1.0, help="latency multiplier")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rpm", type=float, default=0, help="requests per minute per model; 0 = unlimited")
+    parser.add_argument("--tpm", type=float, default=0, help="tokens per minute per model; 0 = unlimited")
+    args = parser.parse_args(argv)
+
+    server = serve(StandIn(args.profiles, args.speed, args.seed, args.rpm, args.tpm), args.host, args.port)
+    print(f"LLM stand-in listening on http://{args.host}:{server.server_address[1]}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,15 @@
+import atexit
 import logging
 import os
+import queue
+import random
 import sys
-from datetime import datetime
-from config import LOG_LEVEL, CONSOLE_LOG_LEVEL, FILE_LOG_LEVEL, LOG_FORMAT, LOG_DIR
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from config import (
+    LOG_LEVEL, CONSOLE_LOG_LEVEL, FILE_LOG_LEVEL, LOG_FORMAT, LOG_DIR, LOG_FILE_NAME,
+    LOG_ROTATION, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_ROTATION_WHEN, LOG_QUEUE_SIZE,
+    LOG_JSON_SAMPLE_RATE
+)
 
 # Get log level constants from string names
 def get_log_level(level_name):
@@ -14,59 +21,128 @@ def get_log_level(level_name):
         "CRITICAL": logging.CRITICAL
     }.get(level_name, logging.INFO)
 
+class DeferredFormatQueueHandler(QueueHandler):
+    """
+    Queue handler that leaves message formatting to the writer thread.
+
+    The stock QueueHandler formats every record on the calling thread before
+    enqueueing it. Records here never leave the process, so only the traceback
+    (which must be captured while it is live) is rendered up front, and any
+    argument that is not an immutable scalar is snapshotted with str() so a
+    caller mutating it afterwards cannot change what gets written.
+    """
+
+    _IMMUTABLE = (str, int, float, bool, bytes, type(None))
+
+    def _snapshot(self, value):
+        return value if isinstance(value, self._IMMUTABLE) else str(value)
+
+    def prepare(self, record):
+        if record.exc_info and not record.exc_text:
+            record.exc_text = _formatter.formatException(record.exc_info)
+        if isinstance(record.args, dict):
+            record.args = {key: self._snapshot(value) for key, value in record.args.items()}
+        elif record.args:
+            record.args = tuple(self._snapshot(arg) for arg in record.args)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Never block a request on logging; drop the record instead
+            pass
+
+class SamplingFilter(logging.Filter):
+    """Let through only a fraction of the DEBUG records marked with `sampled=True`."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if getattr(record, "sampled", False) and record.levelno <= logging.DEBUG:
+            return self.rate >= 1.0 or random.random() < self.rate
+        return True
+
+def create_file_handler(path):
+    """
+    Create the rotating file handler configured by LOG_ROTATION.
+
+    Rotation renames the file out from under any other process writing to it,
+    so each process (e.g. every gunicorn worker) gets its own file, suffixed
+    with its pid.
+    """
+    root, ext = os.path.splitext(path)
+    path = f"{root}.{os.getpid()}{ext}"
+    if LOG_ROTATION == "time":
+        return TimedRotatingFileHandler(path, when=LOG_ROTATION_WHEN, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    return RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+
 # Create logs directory if it doesn't exist
 if not os.path.exists(LOG_DIR):
     os.makedirs(LOG_DIR)
 
-# Configure logging
-timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-log_file = os.path.join(LOG_DIR, f'education_agent_{timestamp}.log')
+log_file = os.path.join(LOG_DIR, LOG_FILE_NAME)
 
 # Create logger
 logger = logging.getLogger('education_agent')
 logger.setLevel(get_log_level(LOG_LEVEL))
+logger.propagate = False
+
+_formatter = logging.Formatter(LOG_FORMAT)
 
 # Create console handler with the configured log level
 console_handler = logging.StreamHandler(sys.stdout)
 console_handler.setLevel(get_log_level(CONSOLE_LOG_LEVEL))
+console_handler.setFormatter(_formatter)
 
-# Create file handler which logs even debug messages
-file_handler = logging.FileHandler(log_file, encoding='utf-8')
+# Create rotating file handler
+file_handler = create_file_handler(log_file)
 file_handler.setLevel(get_log_level(FILE_LOG_LEVEL))
+file_handler.setFormatter(_formatter)
 
-# Create formatter and add it to the handlers
-formatter = logging.Formatter(LOG_FORMAT)
-console_handler.setFormatter(formatter)
-file_handler.setFormatter(formatter)
+# Callers only enqueue records; a background listener thread formats and writes them
+log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+queue_handler = DeferredFormatQueueHandler(log_queue)
+queue_handler.addFilter(SamplingFilter(LOG_JSON_SAMPLE_RATE))
+logger.addHandler(queue_handler)
 
-# Add the handlers to the logger
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
+listener = QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)
 
 def log_state_change(old_state, new_state):
     """Log state transitions"""
-    logger.info(f"State transition: {old_state} -> {new_state}")
+    logger.info("State transition: %s -> %s", old_state, new_state)
 
 def log_user_input(user_input):
     """Log user input"""
-    logger.info(f"User input: {user_input}")
+    logger.info("User input: %s", user_input)
 
 def log_agent_response(response):
     """Log agent response"""
-    logger.info(f"Agent response: {response[:100]}..." if len(response) > 100 else f"Agent response: {response}")
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    if len(response) > 100:
+        logger.info("Agent response: %s...", response[:100])
+    else:
+        logger.info("Agent response: %s", response)
 
 def log_json_result(step_name, json_data):
-    """Log JSON results from various steps"""
+    """Log JSON results from various steps (sampled by LOG_JSON_SAMPLE_RATE)"""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
     if len(json_data) > 500:
-        logger.debug(f"{step_name} result: {json_data[:500]}...")
+        logger.debug("%s result: %s...", step_name, json_data[:500], extra={"sampled": True})
     else:
-        logger.debug(f"{step_name} result: {json_data}")
+        logger.debug("%s result: %s", step_name, json_data, extra={"sampled": True})
 
 def log_error(error_msg, exception=None):
     """Log errors"""
     if exception:
-        logger.error(f"{error_msg}: {str(exception)}", exc_info=True)
+        logger.error("%s: %s", error_msg, exception, exc_info=True)
     else:
         logger.error(error_msg)
 
-logger.info("Logging system initialized") 
\ No newline at end of file
+logger.info("Logging system initialized")
@@ -1,8 +1,7 @@
 import os
 import time
 from agent import EducationAgent
-from chains import memory
-from logger import logger, log_user_input, log_agent_response
+from logger import logger
 
 # You need to set your OpenAI API key here or as an environment variable
 # os.environ["OPENAI_API_KEY"] = "your-api-key"
@@ -11,7 +10,7 @@ def main():
     """Main function to run the Education Agent."""
     
     logger.info("=== Starting Education Assistant MVP ===")
-    logger.info(f"OpenAI API key configured: {'Yes' if os.environ.get('OPENAI_API_KEY') else 'No'}")
+    logger.info("OpenAI API key configured: %s", 'Yes' if os.environ.get('OPENAI_API_KEY') else 'No')
     
     print("\n=== Education Assistant MVP ===\n")
     
@@ -20,13 +19,12 @@ def main():
     response = agent.process("")
     end_time = time.time()
     
-    logger.debug(f"Initial greeting response time: {end_time - start_time:.2f} seconds")
+    logger.debug("Initial greeting response time: %.2f seconds", end_time - start_time)
     print("Assistant: ", response)
     
     while True:
         try:
             user_input = input("You: ")
-            log_user_input(user_input)
             
             if user_input.lower() in ["exit", "quit", "bye"]:
                 logger.info("User requested to exit")
@@ -37,19 +35,19 @@ def main():
             response = agent.process(user_input)
             end_time = time.time()
             
-            logger.debug(f"Response time: {end_time - start_time:.2f} seconds")
+            logger.debug("Response time: %.2f seconds", end_time - start_time)
             print("Assistant: ", response)
             
             # Update memory
-            memory.chat_memory.add_user_message(user_input)
-            memory.chat_memory.add_ai_message(response)
+            agent.memory.chat_memory.add_user_message(user_input)
+            agent.memory.chat_memory.add_ai_message(response)
             
         except KeyboardInterrupt:
             logger.info("Program interrupted by user (KeyboardInterrupt)")
             print("\nExiting program. Goodbye!")
             break
         except Exception as e:
-            logger.error(f"Unexpected error: {str(e)}", exc_info=True)
+            logger.error("Unexpected error: %s", e, exc_info=True)
             print(f"An error occurred: {str(e)}")
             print("Please try again or restart the program.")
     
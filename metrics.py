@@ -0,0 +1,182 @@
+"""
+Prometheus metrics for the Education Assistant.
+
+Latency histograms are fed from finished tracing spans, so every instrumented
+stage (agent turns, chain calls, vector store operations, embedding calls) is
+measured once, in one place. Counters and gauges are updated directly by the
+code paths they describe.
+
+When PROMETHEUS_MULTIPROC_DIR is set (see gunicorn.conf.py), every gunicorn
+worker writes its samples to memory-mapped files in that directory and
+/metrics aggregates across all live workers.
+"""
+
+import os
+
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+from tracing import Span, add_span_listener
+
+MULTIPROCESS_MODE = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+# Latency histograms
+TURN_LATENCY = Histogram(
+    "education_turn_latency_seconds",
+    "Latency of one agent turn, labelled by the state the turn started in",
+    ["state"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 60),
+)
+LLM_CALL_LATENCY = Histogram(
+    "education_llm_call_latency_seconds",
+    "Latency of LLM chain calls",
+    ["chain"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30),
+)
+VECTOR_SEARCH_LATENCY = Histogram(
+    "education_vector_search_latency_seconds",
+    "Latency of vector store operations",
+    ["operation"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+EMBEDDING_LATENCY = Histogram(
+    "education_embedding_latency_seconds",
+    "Latency of embedding model calls",
+    ["operation"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    "education_embedding_batch_size",
+    "Query embeddings computed per batched model call",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+EMBEDDING_QUEUE_WAIT = Histogram(
+    "education_embedding_queue_wait_seconds",
+    "Time a query embedding request waited for its batch to be flushed",
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+LEARNER_EVENT_BATCH = Histogram(
+    "education_learner_event_batch_size",
+    "Learner events and snapshots committed per transaction",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512),
+)
+LLM_QUEUE_WAIT = Histogram(
+    "education_llm_queue_wait_seconds",
+    "Time an LLM call waited for the rate limits and a concurrency slot, by priority class",
+    ["priority"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+# Counters
+FALLBACKS = Counter(
+    "education_fallbacks_total",
+    "Retrieval fallbacks taken (mock_db, generation, default_question)",
+    ["kind"],
+)
+EMBEDDING_CACHE_REQUESTS = Counter(
+    "education_embedding_cache_requests_total",
+    "Query embedding cache lookups; result is hit or miss",
+    ["result"],
+)
+HYBRID_SEARCH_PATHS = Counter(
+    "education_hybrid_search_total",
+    "Hybrid searches by the path that answered them (lexical, fused or vector)",
+    ["path"],
+)
+LLM_ESCALATIONS = Counter(
+    "education_llm_escalations_total",
+    "Chain calls rerun on the escalation model because the output was not the expected JSON",
+    ["chain"],
+)
+LLM_REQUESTS = Counter(
+    "education_llm_requests_total",
+    "LLM calls by priority class and outcome (ok, error, or deadline when the call never got a slot)",
+    ["priority", "outcome"],
+)
+LLM_RETRIES = Counter(
+    "education_llm_retries_total",
+    "LLM calls retried after a provider error, by model and HTTP status (429 is a rate limit)",
+    ["model", "status"],
+)
+LLM_TOKENS = Counter(
+    "education_llm_tokens_total",
+    "Tokens reported by the provider, by model and kind (prompt or completion)",
+    ["model", "kind"],
+)
+JSON_PARSE_FAILURES = Counter(
+    "education_json_parse_failures_total",
+    "LLM outputs that failed strict JSON parsing; outcome is recovered or failed",
+    ["outcome"],
+)
+SEEN_SKIPPED = Counter(
+    "education_seen_questions_skipped_total",
+    "Retrieved questions left out because the learner has already been asked them",
+)
+SEEN_OVERFETCH_SEARCHES = Counter(
+    "education_seen_overfetch_searches_total",
+    "Repeated vector searches with more candidates to find enough unseen questions",
+)
+LEARNER_DECISIONS = Counter(
+    "education_learner_decisions_total",
+    "Next-practice decisions after an answer, by who made them (model or llm)",
+    ["source"],
+)
+LEARNER_EVENTS = Counter(
+    "education_learner_events_total",
+    "Learner events and snapshots by outcome (written, dropped when the queue is full, or failed)",
+    ["result"],
+)
+
+# Gauges (summed over live workers in multiprocess mode)
+ACTIVE_SESSIONS = Gauge(
+    "education_active_sessions",
+    "Learner sessions currently held in memory",
+    multiprocess_mode="livesum",
+)
+QUEUE_DEPTH = Gauge(
+    "education_queue_depth",
+    "Chat requests currently waiting or being processed",
+    multiprocess_mode="livesum",
+)
+LLM_QUEUE_DEPTH = Gauge(
+    "education_llm_queue_depth",
+    "LLM calls waiting for the rate limits or a concurrency slot, by priority class",
+    ["priority"],
+    multiprocess_mode="livesum",
+)
+
+
+def _record_span(finished: Span) -> None:
+    """Route a finished span to the matching latency histogram."""
+    name = finished.name
+    seconds = finished.duration_ms / 1000.0
+    if name == "agent.process":
+        # Nested process() calls (state resets) are part of the outer turn
+        if finished.parent_id is None:
+            TURN_LATENCY.labels(state=finished.attributes.get("state", "unknown")).observe(seconds)
+    elif name.startswith("chain."):
+        LLM_CALL_LATENCY.labels(chain=name[len("chain."):]).observe(seconds)
+    elif name.startswith("vector_store."):
+        VECTOR_SEARCH_LATENCY.labels(operation=name[len("vector_store."):]).observe(seconds)
+    elif name.startswith("embedding."):
+        EMBEDDING_LATENCY.labels(operation=name[len("embedding."):]).observe(seconds)
+
+
+add_span_listener(_record_span)
+
+
+def render_metrics() -> bytes:
+    """Render all metrics in the Prometheus text exposition format."""
+    if MULTIPROCESS_MODE:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
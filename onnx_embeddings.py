@@ -0,0 +1,85 @@
+"""
+ONNX Runtime embedding backend.
+
+Runs a sentence-transformers model exported by export_onnx_model.py without
+importing torch: tokenization uses the `tokenizers` library, the transformer
+runs in an onnxruntime CPU session with a fixed thread count, and pooling and
+normalization are done in NumPy exactly as the original model's pipeline
+describes them (embedding_config.json).
+"""
+
+import json
+import os
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from logger import logger
+
+CONFIG_FILE = "embedding_config.json"
+TOKENIZER_FILE = "tokenizer.json"
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model_int8.onnx"
+
+
+class OnnxEmbeddings(Embeddings):
+    """Embeddings computed by an exported ONNX model on CPU."""
+
+    def __init__(self, model_dir: str, quantized: bool = False, threads: int = 0, batch_size: int = 32):
+        """
+        Load an exported model.
+
+        Args:
+            model_dir: Directory written by export_onnx_model.py
+            quantized: Use the int8 dynamically quantized model instead of the float one
+            threads: Intra-op threads for onnxruntime; 0 lets onnxruntime decide
+            batch_size: Texts per session run
+        """
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, CONFIG_FILE), encoding="utf-8") as f:
+            self.config = json.load(f)
+        self.batch_size = batch_size
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_token_id"], pad_token=self.config["pad_token"])
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        model_path = os.path.join(model_dir, QUANTIZED_MODEL_FILE if quantized else MODEL_FILE)
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self._input_names = {node.name for node in self.session.get_inputs()}
+        logger.info("Loaded ONNX embedding model %s from %s (threads=%s)",
+                    self.config["model_name"], model_path, threads or "auto")
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        hidden = self.session.run(None, {name: feeds[name] for name in self._input_names})[0]
+
+        if self.config["pooling"] == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = attention_mask[:, :, None].astype(hidden.dtype)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.config["normalize"]:
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Same preprocessing as HuggingFaceEmbeddings, so both runtimes see identical input
+        texts = [text.replace("\n", " ") for text in texts]
+        vectors = [self._embed_batch(texts[start:start + self.batch_size])
+                   for start in range(0, len(texts), self.batch_size)]
+        return np.concatenate(vectors).tolist() if vectors else []
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
@@ -1,60 +1,109 @@
 #!/usr/bin/env python3
 """
 Utility script to reinitialize the vector store database.
-This script clears any existing data and adds fresh documents from mock data.
+A full rebuild loads fresh documents from mock data into a new version
+directory next to the live store. It runs validation queries against it and
+only then atomically points VECTOR_STORE_DIR/CURRENT at it. Running workers
+switch to the new version between requests, and old versions beyond
+VECTOR_KEEP_VERSIONS are deleted (see index_versions.py).
+
+    python reinitialize_vector_store.py               # rebuild into a new version and swap
+    python reinitialize_vector_store.py --incremental # sync changed documents into the live version
+    python reinitialize_vector_store.py --dry-run     # report what a sync would change
 """
 
+import argparse
 import os
-import sys
 import shutil
-from pathlib import Path
+import sys
+from typing import List
 
 # Import configuration
-from config import VECTOR_STORE_DIR, USE_VECTOR_STORE
+from config import VECTOR_KEEP_VERSIONS, VECTOR_STORE_DIR, USE_VECTOR_STORE
+from index_versions import VERSIONS_DIR, collect_garbage, new_version_directory, set_current
 from logger import logger
 
-def clear_vector_store():
-    """Clear existing vector store data by removing the directory."""
+def validate_store(store) -> List[str]:
+    """Run the lookups the app depends on against a store; returns the problems found."""
+    from data import mock_knowledge_base, mock_question_db, split_topic_key
+
+    problems = []
+    stats = store.get_collection_stats()
+    if not stats.get("document_count"):
+        problems.append(f"the store is empty ({stats})")
+    for key in mock_knowledge_base:
+        parts = split_topic_key(key)
+        if not parts:
+            continue
+        grade, subject, topic = parts
+        if not store.search_by_metadata(grade=grade, subject=subject, topic=topic, k=1, doc_type="content"):
+            problems.append(f"no content found by metadata for {key}")
+        if not store.search(f"{grade} {subject} {topic}", k=1, where={"type": "content"},
+                            route={"grade": grade, "subject": subject}):
+            problems.append(f"no content found by search for {key}")
+    for topic_key in mock_question_db:
+        topic = (split_topic_key(topic_key) or (None, None, topic_key))[2]
+        if not store.search(topic, k=1, where={"type": "question"}):
+            problems.append(f"no questions found by search for {topic_key}")
+    return problems
+
+def rebuild(keep: int) -> bool:
+    """Build a new store version from the mock data, validate it and make it current."""
+    from data import initialize_vector_store
+    from vector_store import VectorStore
+
+    directory = new_version_directory(VECTOR_STORE_DIR)
+    version = os.path.basename(directory)
+    logger.info("Building vector store version %s in %s", version, directory)
     try:
-        if os.path.exists(VECTOR_STORE_DIR):
-            logger.info(f"Removing existing vector store directory: {VECTOR_STORE_DIR}")
-            shutil.rmtree(VECTOR_STORE_DIR)
-            logger.info("Vector store directory successfully removed")
-            return True
-        else:
-            logger.info(f"Vector store directory {VECTOR_STORE_DIR} does not exist. Nothing to clean.")
-            return True
+        store = VectorStore(directory=directory)
+        if not initialize_vector_store(store=store):
+            raise RuntimeError("initializing the new version failed")
+        store.persist()
+        problems = validate_store(store)
+        if problems:
+            raise RuntimeError("validation failed: " + "; ".join(problems[:10]))
     except Exception as e:
-        logger.error(f"Error clearing vector store: {str(e)}")
+        logger.error("Discarding version %s, the live store is unchanged: %s", version, e)
+        shutil.rmtree(directory, ignore_errors=True)
         return False
 
+    set_current(VECTOR_STORE_DIR, version)
+    logger.info("Vector store version %s is now current", version)
+    if keep:
+        collect_garbage(os.path.join(VECTOR_STORE_DIR, VERSIONS_DIR), version, keep)
+    return True
+
 def main():
     """Main function to reinitialize the vector store."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--incremental", action="store_true",
+                        help="keep the store and only add, update and delete documents that changed")
+    parser.add_argument("--dry-run", action="store_true", help="only report the diff against the stored documents")
+    parser.add_argument("--keep", type=int, default=VECTOR_KEEP_VERSIONS,
+                        help="versions to keep after a rebuild, including the new one; 0 keeps all")
+    args = parser.parse_args()
+
     if not USE_VECTOR_STORE:
         logger.error("Vector store is disabled in configuration. Set USE_VECTOR_STORE=true in .env file")
         return 1
 
     logger.info("Starting vector store reinitialization")
-    
-    # Step 1: Clear existing vector store
-    if not clear_vector_store():
-        logger.error("Failed to clear vector store. Aborting reinitialization.")
-        return 1
-    
-    # Step 2: Reinitialize vector store
     try:
-        from data import initialize_vector_store
-        
-        logger.info("Initializing fresh vector store")
-        if initialize_vector_store():
+        if not (args.incremental or args.dry_run):
+            ok = rebuild(args.keep)
+        else:
+            from data import initialize_vector_store
+            ok = initialize_vector_store(dry_run=args.dry_run)
+        if ok:
             logger.info("Vector store successfully reinitialized")
             return 0
         else:
             logger.error("Failed to initialize vector store")
             return 1
     except Exception as e:
-        logger.error(f"Error during vector store reinitialization: {str(e)}")
+        logger.error("Error during vector store reinitialization: %s", e)
         return 1
 
 if __name__ == "__main__":
-    sys.exit(main()) 
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""
+Per-learner sets of questions already asked, applied inside retrieval.
+
+Each learner's set is a Bloom filter over content-hash question IDs, about
+1.2 bytes per question at a 1% false-positive rate. A false positive only
+means an unseen question is skipped. When the filter holds
+SEEN_QUESTIONS_CAPACITY questions, it becomes the previous generation and a
+fresh one is started. Membership is checked against both generations, so the
+oldest questions are forgotten first and the error rate stays bounded.
+
+Sets are persisted as one small JSON file per learner under
+LEARNER_DATA_DIR/seen. They therefore survive session eviction, worker
+restarts and new browser sessions. Every add merges with the file under an
+exclusive lock (Bloom filters merge by OR), so workers serving the same
+learner do not overwrite each other's additions.
+"""
+
+import base64
+import fcntl
+import hashlib
+import json
+import math
+import os
+import threading
+from typing import Iterable, Optional
+
+from config import LEARNER_DATA_DIR, SEEN_QUESTIONS_CAPACITY, SEEN_QUESTIONS_ENABLED, SEEN_QUESTIONS_ERROR_RATE
+from logger import logger
+
+FORMAT = 1
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over string keys, using double hashing of one BLAKE2b digest."""
+
+    def __init__(self, capacity: int, error_rate: float, bits: Optional[bytearray] = None, count: int = 0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bits if bits is not None else bytearray((self.num_bits + 7) // 8)
+        self.count = count
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.num_bits for i in range(self.num_hashes))
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def add(self, key: str) -> bool:
+        """Add a key; returns False if it was (probably) present already."""
+        if key in self:
+            return False
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+        return True
+
+    def merge(self, other: "BloomFilter") -> None:
+        """Union with a filter of the same size; the count becomes an estimate."""
+        self.bits = bytearray(a | b for a, b in zip(self.bits, other.bits))
+        self.count = max(self.count, other.count)
+
+    def to_dict(self):
+        return {"count": self.count, "bits": base64.b64encode(bytes(self.bits)).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, data, capacity: int, error_rate: float) -> "BloomFilter":
+        return cls(capacity, error_rate, bytearray(base64.b64decode(data["bits"])), data["count"])
+
+
+class SeenQuestions:
+    """The questions one learner has been asked, as two generations of Bloom filters."""
+
+    def __init__(self, learner_id: str, directory: str, capacity: int = SEEN_QUESTIONS_CAPACITY,
+                 error_rate: float = SEEN_QUESTIONS_ERROR_RATE):
+        self.learner_id = learner_id
+        self.capacity = capacity
+        self.error_rate = error_rate
+        # Learner IDs come from cookies; never use them as file names directly
+        name = hashlib.sha256(learner_id.encode("utf-8")).hexdigest()
+        self.path = os.path.join(directory, name[:2], name + ".json")
+        self._lock = threading.Lock()
+        self._mtime = None
+        self.generation = 0
+        self.current = BloomFilter(capacity, error_rate)
+        self.previous: Optional[BloomFilter] = None
+        self._load()
+
+    def __contains__(self, question_id: str) -> bool:
+        return question_id in self.current or (self.previous is not None and question_id in self.previous)
+
+    def __len__(self) -> int:
+        return self.current.count + (self.previous.count if self.previous is not None else 0)
+
+    def _read(self):
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("format") != FORMAT or data.get("capacity") != self.capacity \
+                or data.get("error_rate") != self.error_rate:
+            # Filters of another size cannot be merged; start over rather than misreport
+            logger.warning("Discarding seen questions of learner %s stored with other settings", self.learner_id)
+            return None
+        return data
+
+    def _load(self) -> None:
+        try:
+            data = self._read()
+            self._mtime = os.path.getmtime(self.path)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError) as e:
+            logger.error("Cannot read seen questions from %s: %s", self.path, e)
+            return
+        if data:
+            self._apply(data)
+
+    def _apply(self, data) -> None:
+        self.generation = data["generation"]
+        self.current = BloomFilter.from_dict(data["current"], self.capacity, self.error_rate)
+        self.previous = (BloomFilter.from_dict(data["previous"], self.capacity, self.error_rate)
+                         if data.get("previous") else None)
+
+    def refresh(self) -> None:
+        """Pick up questions another worker recorded for this learner."""
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                return
+            if mtime != self._mtime:
+                self._load()
+
+    def add(self, question_ids: Iterable[str]) -> None:
+        """Record asked questions and persist them, merged with whatever is on disk."""
+        question_ids = [question_id for question_id in question_ids if question_id]
+        if not question_ids:
+            return
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + ".lock", "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    stored = self._read() if os.path.exists(self.path) else None
+                except (OSError, ValueError, KeyError):
+                    stored = None
+                if stored and stored["generation"] > self.generation:
+                    self._apply(stored)
+                elif stored and stored["generation"] == self.generation:
+                    self.current.merge(BloomFilter.from_dict(stored["current"], self.capacity, self.error_rate))
+                for question_id in question_ids:
+                    if question_id in self:
+                        continue
+                    if self.current.count >= self.capacity:
+                        self.previous, self.current = self.current, BloomFilter(self.capacity, self.error_rate)
+                        self.generation += 1
+                    self.current.add(question_id)
+                self._write()
+
+    def _write(self) -> None:
+        data = {"format": FORMAT, "capacity": self.capacity, "error_rate": self.error_rate,
+                "generation": self.generation, "current": self.current.to_dict(),
+                "previous": self.previous.to_dict() if self.previous is not None else None}
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.path.getmtime(self.path)
+
+
+def load_seen_questions(learner_id: str) -> Optional[SeenQuestions]:
+    """The persisted seen set of a learner, or None when seen-question tracking is disabled."""
+    if not SEEN_QUESTIONS_ENABLED:
+        return None
+    return SeenQuestions(learner_id, os.path.join(LEARNER_DATA_DIR, "seen"))
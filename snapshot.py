@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Versioned, checksummed index snapshots.
+
+A snapshot is a directory that can be deployed as an artifact:
+
+    <output>/<version>/
+        manifest.json            version, embedding model, partition layout,
+                                 document IDs hash per source, file checksums
+        numpy/<partition>/       vectors (memory-mapped on load), records, meta
+        query_texts.json         precomputed query embeddings for known topics
+        query_vectors.npy
+    <output>/CURRENT             name of the snapshot to serve; workers switch to a new one
+                                 without restarting (see index_versions.py)
+
+The version is derived from the stored content-hash document IDs (the
+ingestion manifest) plus everything that changes the vectors (embedding
+model, dimension, partition layout, quantization). Rebuilding an unchanged
+store therefore gives the same version. Workers load snapshots read-only
+through the numpy backend and never embed documents (see load_snapshot).
+
+    python snapshot.py build --output snapshots      # from VECTOR_STORE_DIR
+    python snapshot.py verify snapshots              # sizes and sha256 of every file
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import sys
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from langchain.schema.document import Document
+
+from config import (EMBEDDING_MODEL, VECTOR_BACKEND, VECTOR_KEEP_VERSIONS, VECTOR_QUANTIZATION, VECTOR_RESCORE,
+                    VECTOR_STORE_DIR)
+from index_versions import CURRENT_FILE, collect_garbage, read_current, set_current, store_directory
+from logger import logger
+from vector_backends import NumpyBackend
+
+SNAPSHOT_FORMAT = 1
+MANIFEST_FILE = "manifest.json"
+QUERY_TEXTS_FILE = "query_texts.json"
+QUERY_VECTORS_FILE = "query_vectors.npy"
+
+
+class SnapshotError(ValueError):
+    """A snapshot that is incomplete, corrupted or not the one expected."""
+
+
+def ids_hash(ids: Iterable[str]) -> str:
+    """Order-independent fingerprint of a set of content-hash document IDs."""
+    digest = hashlib.sha256()
+    for doc_id in sorted(ids):
+        digest.update(doc_id.encode("utf-8") + b"\n")
+    return digest.hexdigest()
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def resolve_snapshot(path: str) -> str:
+    """A snapshot directory, or the one named by CURRENT in a directory of snapshots."""
+    if os.path.exists(os.path.join(path, MANIFEST_FILE)):
+        return path
+    version = read_current(path)
+    if version:
+        return os.path.join(path, version)
+    raise SnapshotError(f"{path} is neither a snapshot nor a directory with a {CURRENT_FILE} snapshot")
+
+
+def snapshot_created_at(path: str) -> str:
+    """The build time recorded in a snapshot's manifest, or "" if it cannot be read."""
+    try:
+        with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f).get("created_at") or ""
+    except (OSError, json.JSONDecodeError):
+        return ""
+
+
+def build_snapshot(store, output_dir: str, page_size: int = 5000) -> str:
+    """
+    Export every partition of a vector store into a new snapshot without re-embedding documents.
+
+    Args:
+        store: Source VectorStore (any backend)
+        output_dir: Directory snapshots are built into; CURRENT is pointed at the new one
+        page_size: Documents copied per backend read
+
+    Returns:
+        Path of the snapshot directory
+    """
+    from data import known_query_texts
+    from vector_store import embeddings
+
+    os.makedirs(output_dir, exist_ok=True)
+    staging = os.path.join(output_dir, f".building-{os.getpid()}")
+    shutil.rmtree(staging, ignore_errors=True)
+
+    ids_by_source: Dict[str, List[str]] = {}
+    partitions: Dict[str, int] = {}
+    topics = {}
+    dimension = None
+    for name, backend in sorted(store.partitions.items()):
+        target = NumpyBackend(os.path.join(staging, "numpy", name), quantization=VECTOR_QUANTIZATION,
+                              rescore=VECTOR_RESCORE)
+        offset = 0
+        while True:
+            page = backend.get(limit=page_size, offset=offset, include_embeddings=True)
+            if not page["ids"]:
+                break
+            target.add(page["ids"], page["documents"], page["metadatas"], page["embeddings"])
+            for doc_id, metadata in zip(page["ids"], page["metadatas"]):
+                ids_by_source.setdefault(metadata.get("source") or "", []).append(doc_id)
+                key = tuple(metadata.get(field) for field in ("topic", "grade", "subject"))
+                topics.setdefault(key, metadata)
+            offset += len(page["ids"])
+        target.persist()
+        partitions[name] = target.count()
+        dimension = dimension or target.dimension
+        logger.info("Snapshot partition %s: %s documents", name, partitions[name])
+
+    # Ship the query vectors for every known topic so workers start with a warm cache
+    query_texts = list(dict.fromkeys(known_query_texts([Document(page_content="", metadata=m)
+                                                        for m in topics.values()])))
+    query_vectors = np.asarray(embeddings.embed_documents(query_texts) if query_texts else [], dtype=np.float32)
+    with open(os.path.join(staging, QUERY_TEXTS_FILE), "w", encoding="utf-8") as f:
+        json.dump(query_texts, f)
+    np.save(os.path.join(staging, QUERY_VECTORS_FILE), query_vectors)
+
+    all_ids = [doc_id for ids in ids_by_source.values() for doc_id in ids]
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "manifest_hash": ids_hash(all_ids),
+        "embedding_model": EMBEDDING_MODEL,
+        "dimension": dimension,
+        "partition_fields": list(store.router.fields),
+        "quantization": VECTOR_QUANTIZATION,
+    }
+    version = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    files = {}
+    for root, _, names in os.walk(staging):
+        for file_name in sorted(names):
+            path = os.path.join(root, file_name)
+            files[os.path.relpath(path, staging)] = {"size": os.path.getsize(path), "sha256": file_sha256(path)}
+    manifest.update(
+        version=version,
+        created_at=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        documents=len(all_ids),
+        partitions=partitions,
+        sources={source or "none": {"documents": len(ids), "manifest_hash": ids_hash(ids)}
+                 for source, ids in sorted(ids_by_source.items())},
+        files=files,
+    )
+    with open(os.path.join(staging, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    final = os.path.join(output_dir, version)
+    if os.path.exists(final):
+        logger.info("Snapshot %s already exists with identical content", version)
+        shutil.rmtree(staging)
+    else:
+        os.rename(staging, final)
+    set_current(output_dir, version)
+    logger.info("Built snapshot %s with %s documents in %s partitions", version, len(all_ids), len(partitions))
+    return final
+
+
+def verify_snapshot(path: str, checksums: bool = True) -> Dict:
+    """
+    Check a snapshot against its manifest.
+
+    Args:
+        path: Snapshot directory (or a directory with CURRENT)
+        checksums: Hash every file; otherwise only presence and sizes are checked,
+            which is independent of corpus size
+
+    Returns:
+        The manifest
+
+    Raises:
+        SnapshotError: If a file is missing, has the wrong size or checksum, or the format is unknown
+    """
+    path = resolve_snapshot(path)
+    try:
+        with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise SnapshotError(f"Cannot read the manifest of {path}: {e}")
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise SnapshotError(f"Snapshot {path} has format {manifest.get('format')}, expected {SNAPSHOT_FORMAT}")
+    problems = []
+    for relative, expected in manifest["files"].items():
+        file_path = os.path.join(path, relative)
+        if not os.path.exists(file_path):
+            problems.append(f"{relative} is missing")
+        elif os.path.getsize(file_path) != expected["size"]:
+            problems.append(f"{relative} is {os.path.getsize(file_path)} bytes, expected {expected['size']}")
+        elif checksums and file_sha256(file_path) != expected["sha256"]:
+            problems.append(f"{relative} does not match its checksum")
+    if problems:
+        raise SnapshotError(f"Snapshot {path} is corrupted: " + "; ".join(problems))
+    manifest["path"] = path
+    return manifest
+
+
+def load_snapshot(path: str, expected_version: Optional[str] = None, verify_checksums: bool = False):
+    """
+    Open a snapshot as a read-only VectorStore.
+
+    Vectors are memory-mapped and the shipped query embeddings are put in the
+    embedding cache, so nothing is embedded and no model is loaded at startup.
+
+    Args:
+        path: Snapshot directory (or a directory with CURRENT)
+        expected_version: Refuse any other snapshot version (or ingestion manifest hash)
+        verify_checksums: Hash every file instead of only checking sizes
+
+    Raises:
+        SnapshotError: If the snapshot is corrupted, not the expected version, or built with another model
+    """
+    from vector_store import PartitionRouter, VectorStore, embeddings
+
+    manifest = verify_snapshot(path, checksums=verify_checksums)
+    if expected_version and expected_version not in (manifest["version"], manifest["manifest_hash"]):
+        raise SnapshotError(f"Snapshot {manifest['path']} is version {manifest['version']}, expected {expected_version}")
+    if manifest["embedding_model"] != EMBEDDING_MODEL:
+        raise SnapshotError(f"Snapshot {manifest['path']} was embedded with {manifest['embedding_model']}, "
+                            f"but EMBEDDING_MODEL is {EMBEDDING_MODEL}")
+
+    router = PartitionRouter(fields=manifest["partition_fields"])
+    store = VectorStore(backend_kind="numpy", directory=manifest["path"], router=router, read_only=True)
+    store.snapshot = {key: manifest[key] for key in ("version", "manifest_hash", "created_at", "documents")}
+
+    with open(os.path.join(manifest["path"], QUERY_TEXTS_FILE), encoding="utf-8") as f:
+        query_texts = json.load(f)
+    if query_texts:
+        embeddings.preload(query_texts, np.load(os.path.join(manifest["path"], QUERY_VECTORS_FILE)).tolist())
+    logger.info("Serving index snapshot %s (%s documents) from %s",
+                manifest["version"], manifest["documents"], manifest["path"])
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="export the vector store into a new snapshot")
+    build.add_argument("--output", default="snapshots", help="directory snapshots are built into")
+    build.add_argument("--backend", default=VECTOR_BACKEND, help="backend of the source store")
+    build.add_argument("--store-dir", default=VECTOR_STORE_DIR,
+                       help="source store directory (its current version, if it has versions)")
+    build.add_argument("--keep", type=int, default=VECTOR_KEEP_VERSIONS,
+                       help="snapshots to keep in --output, including the new one; 0 keeps all")
+    verify = commands.add_parser("verify", help="check a snapshot's files against its manifest")
+    verify.add_argument("path")
+    verify.add_argument("--sizes-only", action="store_true", help="skip the sha256 checksums")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "build":
+            from vector_store import VectorStore
+            store = VectorStore(backend_kind=args.backend, directory=store_directory(args.store_dir),
+                                load_indexes=False)
+            path = build_snapshot(store, args.output)
+            manifest = verify_snapshot(path)
+            if args.keep:
+                collect_garbage(args.output, manifest["version"], args.keep,
+                                age=lambda name: snapshot_created_at(os.path.join(args.output, name)))
+        else:
+            manifest = verify_snapshot(args.path, checksums=not args.sizes_only)
+    except Exception as e:
+        logger.error("Snapshot %s failed: %s", args.command, e)
+        return 1
+    print(json.dumps({key: manifest[key] for key in ("path", "version", "manifest_hash", "documents", "partitions")}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+Span-based tracing for agent turns.
+
+Every call wrapped in `span()` (or decorated with `traced`) records a Span with
+its parent, the trace it belongs to and the learner session it runs under.
+Spans are always timed (it only costs a couple of perf_counter calls), so span
+listeners such as the metrics module see every stage; exporting them to a
+JSON-lines file or an OTLP/HTTP collector is switched on from config.
+
+Command line usage:
+    python tracing.py summarize logs/traces.jsonl   # critical path per state
+    python tracing.py collect --port 4318           # local OTLP collector stand-in
+"""
+
+import argparse
+import contextvars
+import functools
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+from config import TRACING_ENABLED, TRACE_EXPORT_FILE, OTLP_TRACES_ENDPOINT, TRACE_SERVICE_NAME
+from logger import logger
+
+# The span that is currently open in this thread / task
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+# Callbacks invoked with every finished span (e.g. metrics collection)
+_span_listeners: List[Callable[["Span"], None]] = []
+
+
+class Span:
+    """A single timed operation inside a trace."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "session_id",
+                 "attributes", "status", "start_time_ns", "end_time_ns", "_start_perf", "duration_ms")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str],
+                 session_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.session_id = session_id
+        self.attributes = attributes
+        self.status = "ok"
+        self.start_time_ns = time.time_ns()
+        self.end_time_ns = None
+        self._start_perf = time.perf_counter()
+        self.duration_ms = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """Attach an attribute to the span."""
+        self.attributes[key] = value
+
+    def end(self) -> None:
+        """Close the span and record its duration."""
+        self.duration_ms = (time.perf_counter() - self._start_perf) * 1000.0
+        self.end_time_ns = self.start_time_ns + int(self.duration_ms * 1_000_000)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Flat representation used by the JSON-lines exporter and the CLI."""
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "session_id": self.session_id,
+            "start_time_ns": self.start_time_ns,
+            "end_time_ns": self.end_time_ns,
+            "duration_ms": round(self.duration_ms, 3) if self.duration_ms is not None else None,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+@contextmanager
+def span(name: str, session_id: Optional[str] = None, **attributes):
+    """
+    Open a span as a child of the current one.
+
+    Args:
+        name: Span name, e.g. "chain.learning_path" or "vector_store.search"
+        session_id: Learner session; inherited from the parent span if omitted
+        **attributes: Extra attributes stored on the span
+
+    Yields:
+        The open Span, so callers can add attributes while it runs
+    """
+    parent = _current_span.get()
+    if parent is not None:
+        trace_id = parent.trace_id
+        parent_id = parent.span_id
+        session_id = session_id or parent.session_id
+    else:
+        trace_id = uuid.uuid4().hex
+        parent_id = None
+
+    current = Span(name, trace_id, parent_id, session_id, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.status = "error"
+        current.attributes["error"] = str(e)
+        raise
+    finally:
+        current.end()
+        _current_span.reset(token)
+        _finish_span(current)
+
+
+def traced(name: Optional[str] = None):
+    """Decorator that wraps every call of the function in a span."""
+    def decorator(func):
+        span_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_span() -> Optional[Span]:
+    """Return the span open in the current context, if any."""
+    return _current_span.get()
+
+
+def add_span_listener(listener: Callable[[Span], None]) -> None:
+    """Register a callback that receives every finished span."""
+    _span_listeners.append(listener)
+
+
+def _finish_span(finished: Span) -> None:
+    for listener in _span_listeners:
+        try:
+            listener(finished)
+        except Exception as e:
+            logger.warning("Span listener failed: %s", e)
+    if _exporter_worker is not None:
+        _exporter_worker.submit(finished)
+
+
+class JsonLinesExporter:
+    """Append finished spans to a local JSON-lines file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, spans: List[Span]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            for s in spans:
+                f.write(json.dumps(s.to_dict(), default=str) + "\n")
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPHttpExporter:
+    """Send spans to an OTLP/HTTP collector using the JSON encoding."""
+
+    def __init__(self, endpoint: str, service_name: str = TRACE_SERVICE_NAME, timeout: float = 2.0):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+
+    def _encode(self, spans: List[Span]) -> Dict[str, Any]:
+        otlp_spans = []
+        for s in spans:
+            attributes = dict(s.attributes)
+            if s.session_id:
+                attributes["session.id"] = s.session_id
+            otlp_spans.append({
+                "traceId": s.trace_id,
+                "spanId": s.span_id,
+                "parentSpanId": s.parent_id or "",
+                "name": s.name,
+                "kind": 1,
+                "startTimeUnixNano": str(s.start_time_ns),
+                "endTimeUnixNano": str(s.end_time_ns),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items()],
+                "status": {"code": 2 if s.status == "error" else 1},
+            })
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{"scope": {"name": "education_agent"}, "spans": otlp_spans}],
+            }]
+        }
+
+    def export(self, spans: List[Span]) -> None:
+        body = json.dumps(self._encode(spans)).encode("utf-8")
+        req = urllib.request.Request(self.endpoint, data=body, headers={"Content-Type": "application/json"})
+        urllib.request.urlopen(req, timeout=self.timeout).close()
+
+
+class _ExportWorker:
+    """Background thread that batches finished spans to the exporters off the request path."""
+
+    def __init__(self, exporters: List[Any], max_batch: int = 256, flush_interval: float = 1.0):
+        self.exporters = exporters
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=10000)
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def submit(self, finished: Span) -> None:
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            # Dropping a span is preferable to blocking a user turn
+            pass
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            for exporter in self.exporters:
+                try:
+                    exporter.export(batch)
+                except Exception as e:
+                    logger.warning("Span export via %s failed: %s", type(exporter).__name__, e)
+
+
+def _create_exporter_worker() -> Optional[_ExportWorker]:
+    if not TRACING_ENABLED:
+        return None
+    exporters = []
+    if TRACE_EXPORT_FILE:
+        exporters.append(JsonLinesExporter(TRACE_EXPORT_FILE))
+    if OTLP_TRACES_ENDPOINT:
+        exporters.append(OTLPHttpExporter(OTLP_TRACES_ENDPOINT))
+    if not exporters:
+        return None
+    logger.info("Tracing enabled with exporters: %s", ', '.join(type(e).__name__ for e in exporters))
+    return _ExportWorker(exporters)
+
+
+_exporter_worker = _create_exporter_worker()
+
+
+# ---------------------------------------------------------------------------
+# Command line: critical-path summary and collector stand-in
+# ---------------------------------------------------------------------------
+
+def load_spans(path: str) -> List[Dict[str, Any]]:
+    """Load spans written by JsonLinesExporter or the collector stand-in."""
+    spans = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                spans.append(json.loads(line))
+    return spans
+
+
+def _critical_path(root: Dict[str, Any], children: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Follow the longest child at each level, starting from the root span."""
+    path = [root]
+    node = root
+    while children.get(node["span_id"]):
+        node = max(children[node["span_id"]], key=lambda s: s["duration_ms"] or 0.0)
+        path.append(node)
+    return path
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(spans: List[Dict[str, Any]], root_name: str = "agent.process") -> Dict[str, Dict[str, Any]]:
+    """
+    Summarize turn latency and the critical path per agent state.
+
+    Returns:
+        Mapping of state -> {"turns", "p50_ms", "p95_ms", "stages"} where
+        "stages" maps each span name on the critical path to its mean time
+        (exclusive of its own critical child) and share of the turn.
+    """
+    children: Dict[str, List[Dict[str, Any]]] = {}
+    for s in spans:
+        if s.get("parent_id"):
+            children.setdefault(s["parent_id"], []).append(s)
+
+    per_state: Dict[str, Dict[str, Any]] = {}
+    for root in spans:
+        if root.get("parent_id") or root.get("name") != root_name:
+            continue
+        state = root.get("attributes", {}).get("state", "unknown")
+        entry = per_state.setdefault(state, {"durations": [], "stage_totals": {}})
+        total = root["duration_ms"] or 0.0
+        entry["durations"].append(total)
+
+        path = _critical_path(root, children)
+        for i, node in enumerate(path):
+            below = path[i + 1]["duration_ms"] if i + 1 < len(path) else 0.0
+            exclusive = max(0.0, (node["duration_ms"] or 0.0) - (below or 0.0))
+            entry["stage_totals"][node["name"]] = entry["stage_totals"].get(node["name"], 0.0) + exclusive
+
+    summary = {}
+    for state, entry in per_state.items():
+        durations = entry["durations"]
+        turn_total = sum(durations) or 1.0
+        stages = {
+            name: {"mean_ms": total / len(durations), "share": total / turn_total}
+            for name, total in sorted(entry["stage_totals"].items(), key=lambda item: -item[1])
+        }
+        summary[state] = {
+            "turns": len(durations),
+            "p50_ms": _percentile(durations, 50),
+            "p95_ms": _percentile(durations, 95),
+            "stages": stages,
+        }
+    return summary
+
+
+def _print_summary(summary: Dict[str, Dict[str, Any]]) -> None:
+    if not summary:
+        print("No agent turns found.")
+        return
+    for state, entry in summary.items():
+        print(f"\nState: {state}  turns={entry['turns']}  p50={entry['p50_ms']:.1f}ms  p95={entry['p95_ms']:.1f}ms")
+        print("  Critical path (mean exclusive time):")
+        for name, stage in entry["stages"].items():
+            print(f"    {name:<40} {stage['mean_ms']:>10.1f}ms  {stage['share'] * 100:5.1f}%")
+
+
+class _CollectorHandler(BaseHTTPRequestHandler):
+    """Accept OTLP/HTTP JSON trace exports and append them as flat spans."""
+
+    output_path = "otlp_spans.jsonl"
+    _lock = threading.Lock()
+
+    def do_POST(self):
+        if self.path != "/v1/traces":
+            self.send_response(404)
+            self.end_headers()
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        lines = []
+        for resource_spans in payload.get("resourceSpans", []):
+            for scope_spans in resource_spans.get("scopeSpans", []):
+                for s in scope_spans.get("spans", []):
+                    attributes = {a["key"]: next(iter(a["value"].values())) for a in s.get("attributes", [])}
+                    start, end = int(s["startTimeUnixNano"]), int(s["endTimeUnixNano"])
+                    lines.append(json.dumps({
+                        "name": s["name"],
+                        "trace_id": s["traceId"],
+                        "span_id": s["spanId"],
+                        "parent_id": s.get("parentSpanId") or None,
+                        "session_id": attributes.pop("session.id", None),
+                        "start_time_ns": start,
+                        "end_time_ns": end,
+                        "duration_ms": (end - start) / 1_000_000,
+                        "status": "error" if s.get("status", {}).get("code") == 2 else "ok",
+                        "attributes": attributes,
+                    }))
+        with self._lock, open(self.output_path, "a", encoding="utf-8") as f:
+            for line in lines:
+                f.write(line + "\n")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Education agent tracing tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    summarize_parser = sub.add_parser("summarize", help="Summarize the critical path per agent state")
+    summarize_parser.add_argument("path", nargs="?", default=TRACE_EXPORT_FILE)
+    summarize_parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+
+    collect_parser = sub.add_parser("collect", help="Run a local OTLP/HTTP collector stand-in")
+    collect_parser.add_argument("--port", type=int, default=4318)
+    collect_parser.add_argument("--out", default="otlp_spans.jsonl")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "summarize":
+        if not os.path.exists(args.path):
+            print(f"Trace file not found: {args.path}")
+            return 1
+        result = summarize(load_spans(args.path))
+        if args.json:
+            print(json.dumps(result, indent=2))
+        else:
+            _print_summary(result)
+        return 0
+
+    _CollectorHandler.output_path = args.out
+    server = ThreadingHTTPServer(("0.0.0.0", args.port), _CollectorHandler)
+    print(f"OTLP collector stand-in listening on :{args.port}/v1/traces, writing to {args.out}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,22 @@
 import json
 import random
 import re
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 import os
 
-from data import mock_question_db
+from data import ensure_vector_store_initialized, mock_question_db
 from chains import generate_questions_chain
-from config import MAX_QUESTIONS, USE_VECTOR_STORE
+from chunking import assemble_context, truncate_to_tokens
+from config import CONTENT_CANDIDATE_CHUNKS, CONTENT_TOKEN_BUDGET, MAX_QUESTIONS, USE_VECTOR_STORE
 from logger import logger
+from metrics import FALLBACKS, JSON_PARSE_FAILURES
+from seen_questions import SeenQuestions
+from tracing import traced
 
 # Import vector store only when enabled
 if USE_VECTOR_STORE:
     try:
-        from vector_store import vector_store
+        from vector_store import document_id, vector_store
         VECTOR_STORE_AVAILABLE = True
     except ImportError:
         logger.warning("Vector store module import failed, falling back to mock data")
@@ -37,6 +41,7 @@ def clean_json_string(json_str: str) -> str:
     
     return cleaned_json
 
+@traced("utils.parse_json_safely")
 def parse_json_safely(json_str: str) -> Dict[str, Any]:
     """
     Safely parse a JSON string, trying different cleaning approaches if necessary.
@@ -51,17 +56,32 @@ def parse_json_safely(json_str: str) -> Dict[str, Any]:
         cleaned_json = clean_json_string(json_str)
         return json.loads(cleaned_json)
     except json.JSONDecodeError as e:
-        logger.warning(f"Error parsing JSON: {str(e)}. Trying alternate parsing approach.")
+        logger.warning("Error parsing JSON: %s. Trying alternate parsing approach.", e)
         try:
             # Try to extract anything that looks like a JSON object
             potential_json = re.search(r'\{[\s\S]*\}', cleaned_json)
             if potential_json:
-                return json.loads(potential_json.group(0))
+                parsed = json.loads(potential_json.group(0))
+                JSON_PARSE_FAILURES.labels(outcome="recovered").inc()
+                return parsed
             raise e
         except Exception:
+            JSON_PARSE_FAILURES.labels(outcome="failed").inc()
             logger.error("All JSON parsing attempts failed")
             raise
 
+def parse_bool(value: Any) -> bool:
+    """
+    Read a boolean field from LLM JSON output, where it may come back as a string.
+    
+    "true", "yes" and "1" (any case) are True; "false", "no", "", None and other
+    strings are False. Non-string values use their truth value.
+    """
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "yes", "1")
+    return bool(value)
+
+@traced("utils.retrieve_content")
 def retrieve_content(grade: str, subject: str, topic: str) -> str:
     """
     Retrieve relevant content from the knowledge base using Chroma vector store.
@@ -73,91 +93,100 @@ def retrieve_content(grade: str, subject: str, topic: str) -> str:
         topic: Specific topic (e.g., "geometry", "mechanics")
         
     Returns:
-        Retrieved content as a string
+        Retrieved content as a string of at most CONTENT_TOKEN_BUDGET tokens
     """
-    logger.debug(f"Retrieving content for grade={grade}, subject={subject}, topic={topic}")
+    logger.debug("Retrieving content for grade=%s, subject=%s, topic=%s", grade, subject, topic)
     
     # Format the search query
     search_query = f"{grade} {subject} {topic}"
     
     # Format key to match mock database (for fallback)
     key = f"{grade}_{subject}_{topic}".lower().replace(" ", "_")
-    logger.debug(f"Formatted key: {key}")
+    logger.debug("Formatted key: %s", key)
     
     # Try using vector store if available
     if VECTOR_STORE_AVAILABLE:
         try:
             logger.info("Using Chroma vector store for content retrieval")
+            ensure_vector_store_initialized()
             
-            # First try with metadata search
+            # First try an exact metadata lookup (no embedding needed)
             documents = vector_store.search_by_metadata(
                 grade=grade.lower(),
                 subject=subject.lower(),
                 topic=topic.lower(),
-                k=2
+                k=CONTENT_CANDIDATE_CHUNKS,
+                doc_type="content"
             )
             
             # If no results with metadata, try semantic search
             if not documents:
                 logger.debug("No results with metadata search, trying semantic search")
-                documents = vector_store.search(search_query, k=2)
+                documents = vector_store.search(
+                    search_query,
+                    k=CONTENT_CANDIDATE_CHUNKS,
+                    where={QUESTION_TYPE_KEY: "content"},
+                    route={"grade": grade, "subject": subject}
+                )
             
             if documents:
-                # Combine content from retrieved documents
-                contents = [doc.page_content for doc in documents]
-                combined_content = "\n".join(contents)
-                logger.info(f"Found {len(documents)} documents in vector store")
+                # Fit the best chunks into the prompt budget, in reading order
+                combined_content = assemble_context(documents, CONTENT_TOKEN_BUDGET)
+                logger.info("Found %s documents in vector store", len(documents))
                 return combined_content
             else:
                 logger.warning("No documents found in vector store, falling back to mock database")
         except Exception as e:
-            logger.error(f"Error retrieving from vector store: {str(e)}")
+            logger.error("Error retrieving from vector store: %s", e)
             logger.warning("Falling back to mock database")
     
     # Fallback to mock database
+    FALLBACKS.labels(kind="mock_db").inc()
     from data import mock_knowledge_base
     content = mock_knowledge_base.get(key, "No relevant content found. Here are some general learning tips.")
+    content = truncate_to_tokens(content, CONTENT_TOKEN_BUDGET)
     
     if key in mock_knowledge_base:
-        logger.info(f"Content found in mock database for key: {key}")
+        logger.info("Content found in mock database for key: %s", key)
     else:
-        logger.warning(f"No content found for key: {key}, using default content")
+        logger.warning("No content found for key: %s, using default content", key)
     
     return content
 
-def retrieve_questions(topic: str, difficulty: str) -> List[Dict[str, str]]:
+@traced("utils.retrieve_questions")
+def retrieve_questions(topic: str, difficulty: str, subject: Optional[str] = None,
+                       grade: Optional[str] = None, seen: Optional[SeenQuestions] = None) -> List[Dict[str, str]]:
     """
     Retrieve questions related to the topic and difficulty.
     Uses ChromaDB vector store if available and configured, otherwise falls back.
+    The learner's subject and grade, when known, narrow which partitions are searched.
+    Questions in `seen` are excluded inside the search; stored questions carry their "id".
     """
-    logger.debug(f"Retrieving questions for topic='{topic}', difficulty='{difficulty}'")
+    logger.debug("Retrieving questions for topic='%s', difficulty='%s'", topic, difficulty)
     
     questions = []
     
     if VECTOR_STORE_AVAILABLE:
         try:
-            logger.info(f"Attempting to retrieve questions from vector store for topic='{topic}', difficulty='{difficulty}'")
+            logger.info("Attempting to retrieve questions from vector store for topic='%s', difficulty='%s'", topic, difficulty)
+            ensure_vector_store_initialized()
+            if seen is not None:
+                seen.refresh()
             
-            # Reverting filter to use $and as suggested by error messages for multiple conditions
-            metadata_filter = {
-                "$and": [
-                    {QUESTION_TYPE_KEY: "question"},
-                    {QUESTION_DIFFICULTY_KEY: difficulty.lower()} 
-                ]
-            }
-            
-            # Perform similarity search with filter
-            # Access the underlying Langchain Chroma object for filtering capability
-            search_results: List[Document] = vector_store.vector_store.similarity_search(
-                query=topic, # Use topic for semantic relevance
-                k=MAX_QUESTIONS, 
-                filter=metadata_filter
-            )
+            # Exact topic/difficulty match from the metadata index first; semantic search only if that misses
+            route = {"subject": subject, "grade": grade}
+            search_results: List[Document] = vector_store.search_questions_many(
+                [(topic, difficulty)],
+                k=MAX_QUESTIONS,
+                routes=[route],
+                exclude=seen
+            )[0]
             
             if search_results:
-                logger.info(f"Found {len(search_results)} potential questions in vector store")
+                logger.info("Found %s potential questions in vector store", len(search_results))
                 questions = [
                     {
+                        "id": doc.id or document_id(doc),
                         "question": doc.page_content, 
                         "answer": doc.metadata.get(QUESTION_ANSWER_KEY, "Answer not found in metadata")
                     } 
@@ -165,56 +194,63 @@ def retrieve_questions(topic: str, difficulty: str) -> List[Dict[str, str]]:
                 ]
                 # Ensure we don't exceed MAX_QUESTIONS after potential duplicates or formatting issues
                 questions = questions[:MAX_QUESTIONS] 
-                logger.debug(f"Formatted {len(questions)} questions from vector store results.")
+                logger.debug("Formatted %s questions from vector store results.", len(questions))
+            elif seen is not None and len(seen):
+                logger.warning("No unseen questions in vector store for topic='%s', difficulty='%s', route=%s "
+                               "(learner has seen %s)", topic, difficulty, route, len(seen))
             else:
-                logger.warning(f"No questions found in vector store matching filters: {metadata_filter}")
+                logger.warning("No questions found in vector store for topic='%s', difficulty='%s', route=%s",
+                               topic, difficulty, route)
 
         except Exception as e:
-            logger.error(f"Error retrieving questions from vector store: {str(e)}")
+            logger.error("Error retrieving questions from vector store: %s", e)
             logger.warning("Falling back to generation or mock data due to vector store error.")
             # Proceed to fallback mechanisms below
     
     # Fallback 1: If vector store search failed or yielded no results
     if not questions:
-        logger.info(f"No questions retrieved from vector store (or store unavailable/error), attempting generation.")
+        logger.info("No questions retrieved from vector store (or store unavailable/error), attempting generation.")
         # Fallback to generate questions if none found/retrieved
+        FALLBACKS.labels(kind="generation").inc()
         result = generate_questions_chain.run(topic=topic, difficulty=difficulty)
         try:
             parsed_result = parse_json_safely(result)
             questions = parsed_result.get("questions", [])
             if questions:
-                 logger.info(f"Successfully generated {len(questions)} questions")
+                 logger.info("Successfully generated %s questions", len(questions))
                  # Ensure we don't exceed MAX_QUESTIONS from generation either
                  questions = questions[:MAX_QUESTIONS]
             else:
                  logger.warning("Question generation yielded no questions.")
         except Exception as e:
-            logger.error(f"Error parsing generated questions: {str(e)}")
+            logger.error("Error parsing generated questions: %s", e)
             # Fallback in case of parsing issues during generation
             questions = [] # Ensure questions list is empty before final fallback
 
     # Fallback 2: If vector store is disabled OR generation failed
     if not questions and not VECTOR_STORE_AVAILABLE:
         logger.warning("Vector store disabled and generation failed/disabled, falling back to mock database.")
+        FALLBACKS.labels(kind="mock_db").inc()
         # Format key to match mock database
         topic_key = topic.lower().replace(" ", "_")
-        logger.debug(f"Formatted topic key for mock DB: {topic_key}")
+        logger.debug("Formatted topic key for mock DB: %s", topic_key)
         
         # Get questions for the topic and difficulty from mock DB
         topic_questions = mock_question_db.get(topic_key, {})
         difficulty_questions = topic_questions.get(difficulty, [])
         
         if difficulty_questions:
-            logger.info(f"Found {len(difficulty_questions)} questions in mock DB for topic={topic_key}, difficulty={difficulty}")
+            logger.info("Found %s questions in mock DB for topic=%s, difficulty=%s", len(difficulty_questions), topic_key, difficulty)
             # Return up to MAX_QUESTIONS random questions from mock DB
             questions = random.sample(difficulty_questions, min(MAX_QUESTIONS, len(difficulty_questions)))
         else:
-            logger.warning(f"No questions found in mock DB for topic={topic_key}, difficulty={difficulty}")
+            logger.warning("No questions found in mock DB for topic=%s, difficulty=%s", topic_key, difficulty)
             
     # Final Fallback: If absolutely nothing works, return a default placeholder
     if not questions:
          logger.error("All question retrieval methods (vector store, generation, mock DB) failed. Using default fallback question.")
+         FALLBACKS.labels(kind="default_question").inc()
          questions = [{"question": f"Could not find or generate questions for {topic} ({difficulty}). Please try a different topic.", "answer": "N/A"}]
 
-    logger.debug(f"Final selected questions count: {len(questions)}")
+    logger.debug("Final selected questions count: %s", len(questions))
     return questions 
\ No newline at end of file
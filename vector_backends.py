@@ -0,0 +1,729 @@
+"""
+Storage backends behind VectorStore.
+
+VectorStore handles embedding, caching and the metadata index; a backend only
+stores (id, text, metadata, vector) records and answers vector queries with
+simple equality filters. Two backends are provided:
+
+- ChromaBackend: a persistent ChromaDB collection (the default)
+- NumpyBackend: an in-process index holding every vector in one contiguous
+  float32 (or int8 quantized) matrix, memory-mapped from disk so
+  gunicorn workers share pages
+"""
+
+import json
+import os
+import shutil
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from config import (VECTOR_INDEX_DEFAULTS, VECTOR_INDEX_PARAMS, VECTOR_PARTITION_FIELDS, VECTOR_QUANTIZATION,
+                    VECTOR_RESCORE, VECTOR_RESCORE_FACTOR)
+from logger import logger
+
+# A single query hit: (id, text, metadata, distance); lower distance is closer
+QueryHit = Tuple[str, str, Dict[str, Any], float]
+
+# Metadata fields kept in the in-memory inverted index ("source" scopes incremental syncs)
+INDEXED_METADATA_FIELDS = ("type", "grade", "subject", "topic", "difficulty", "source")
+# Fields the NumPy backend keeps row postings for; filters on any other field scan the metadata
+FILTER_FIELDS = INDEXED_METADATA_FIELDS + tuple(f for f in VECTOR_PARTITION_FIELDS if f not in INDEXED_METADATA_FIELDS)
+
+
+class VectorBackend(ABC):
+    """Interface every vector storage backend implements."""
+
+    @abstractmethod
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]],
+            embeddings: List[List[float]]) -> None:
+        """Insert or replace records."""
+
+    @abstractmethod
+    def delete(self, ids: List[str]) -> None:
+        """Remove records by ID."""
+
+    @abstractmethod
+    def get(self, where: Optional[Dict[str, Any]] = None, limit: Optional[int] = None,
+            offset: int = 0, include_embeddings: bool = False) -> Dict[str, List]:
+        """
+        Return {"ids", "documents", "metadatas"} for records matching every equality filter,
+        plus "embeddings" when include_embeddings is set.
+        """
+
+    @abstractmethod
+    def query(self, query_embeddings: List[List[float]], k: int,
+              where: Optional[Dict[str, Any]] = None) -> List[List[QueryHit]]:
+        """Return the k nearest records for each query vector, in query order."""
+
+    @abstractmethod
+    def count(self) -> int:
+        """Number of stored records."""
+
+    def persist(self) -> None:
+        """Flush pending writes to disk (a checkpoint)."""
+
+    def close(self) -> None:
+        """Release open files and connections; the backend must not be used afterwards."""
+
+
+def chroma_where(where: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Convert {field: value, ...} into Chroma's filter syntax ($and for several fields)."""
+    if not where:
+        return None
+    if len(where) == 1:
+        return dict(where)
+    return {"$and": [{key: value} for key, value in where.items()]}
+
+
+def index_params_for(collection_name: str) -> Dict[str, Any]:
+    """HNSW parameters for a collection: the defaults overlaid with its VECTOR_INDEX_PARAMS entry."""
+    params = dict(VECTOR_INDEX_DEFAULTS)
+    params.update(VECTOR_INDEX_PARAMS.get(collection_name, {}))
+    return params
+
+
+def hnsw_metadata(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Translate index parameters into Chroma collection metadata keys."""
+    return {f"hnsw:{key}": value for key, value in params.items()}
+
+
+class ChromaBackend(VectorBackend):
+    """Backend storing records in a persistent ChromaDB collection."""
+
+    # Parameters fixed when the HNSW graph is built; changing them needs a rebuild
+    CONSTRUCTION_PARAMS = ("space", "M", "construction_ef")
+    # Index parameter names in Chroma >= 1.0 collection configurations
+    CONFIGURATION_KEYS = {"space": "space", "M": "max_neighbors", "construction_ef": "ef_construction",
+                          "search_ef": "ef_search"}
+
+    def __init__(self, persist_directory: str, collection_name: str,
+                 collection_metadata: Optional[Dict[str, Any]] = None):
+        import chromadb
+
+        os.makedirs(persist_directory, exist_ok=True)
+        self.client = chromadb.PersistentClient(path=persist_directory)
+        # Embeddings are always computed by VectorStore, so no embedding function is attached
+        self.collection = self.client.get_or_create_collection(
+            name=collection_name,
+            metadata=collection_metadata,
+            embedding_function=None,
+        )
+        if collection_metadata:
+            self._reconcile_index_params(collection_metadata)
+
+    def current_index_params(self) -> Dict[str, Any]:
+        """
+        The index parameters the collection has now, under VECTOR_INDEX_DEFAULTS names.
+
+        Chroma >= 1.0 keeps them in configuration_json, and modify(configuration=...)
+        does not update the legacy hnsw:* metadata, so the metadata is only read on
+        older clients.
+        """
+        hnsw = (getattr(self.collection, "configuration_json", None) or {}).get("hnsw")
+        if hnsw:
+            return {param: hnsw[key] for param, key in self.CONFIGURATION_KEYS.items() if key in hnsw}
+        metadata = self.collection.metadata or {}
+        return {key[len("hnsw:"):]: value for key, value in metadata.items() if key.startswith("hnsw:")}
+
+    def _reconcile_index_params(self, requested: Dict[str, Any]) -> None:
+        """Apply a changed search_ef to an existing collection and warn about construction changes."""
+        existing = self.current_index_params()
+        for param in self.CONSTRUCTION_PARAMS:
+            key = f"hnsw:{param}"
+            if key in requested and param in existing and existing[param] != requested[key]:
+                logger.warning("Collection %s was built with %s=%s; %s=%s only applies after a rebuild",
+                               self.collection.name, param, existing[param], param, requested[key])
+        search_ef = requested.get("hnsw:search_ef")
+        if search_ef is not None and existing.get("search_ef") != search_ef:
+            self.set_search_ef(search_ef)
+
+    def set_search_ef(self, search_ef: int) -> None:
+        """
+        Change the query-time candidate list size of the collection.
+
+        The value is persisted with the collection; Chroma may keep using the
+        old value for an index it already has loaded until the client reopens it.
+        """
+        try:
+            # Chroma >= 1.0
+            self.collection.modify(configuration={"hnsw": {"ef_search": search_ef}})
+        except TypeError:
+            metadata = dict(self.collection.metadata or {})
+            metadata["hnsw:search_ef"] = search_ef
+            self.collection.modify(metadata=metadata)
+
+    def close(self):
+        # Chroma < 1.0 has no close(); its clients are only released when garbage collected
+        close = getattr(self.client, "close", None)
+        if close is not None:
+            close()
+
+    def add(self, ids, texts, metadatas, embeddings):
+        self.collection.upsert(ids=ids, documents=texts, metadatas=metadatas, embeddings=embeddings)
+
+    def delete(self, ids):
+        if ids:
+            self.collection.delete(ids=ids)
+
+    def get(self, where=None, limit=None, offset=0, include_embeddings=False):
+        include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+        found = self.collection.get(where=chroma_where(where), limit=limit, offset=offset or None,
+                                    include=include)
+        result = {"ids": found["ids"], "documents": found["documents"],
+                  "metadatas": [m or {} for m in found["metadatas"]]}
+        if include_embeddings:
+            result["embeddings"] = [list(map(float, vector)) for vector in found["embeddings"]]
+        return result
+
+    def query(self, query_embeddings, k, where=None):
+        if not query_embeddings:
+            return []
+        found = self.collection.query(query_embeddings=query_embeddings, n_results=k,
+                                      where=chroma_where(where),
+                                      include=["documents", "metadatas", "distances"])
+        return [
+            list(zip(ids, documents, [m or {} for m in metadatas], distances))
+            for ids, documents, metadatas, distances in zip(
+                found["ids"], found["documents"], found["metadatas"], found["distances"])
+        ]
+
+    def count(self):
+        return self.collection.count()
+
+
+class NumpyBackend(VectorBackend):
+    """
+    In-process exact-search backend.
+
+    On disk a collection is a raw float32 file of unit-normalized vectors
+    (`vectors.f32`, one row per record) plus `records.jsonl` holding the id,
+    text and metadata of each row in the same order. Vectors are opened with
+    np.memmap, so every worker maps the same page-cache pages instead of
+    holding a private copy. Deletions are tombstones until `compact()`.
+
+    Queries prefilter rows with sorted row postings per metadata value (kept
+    only for `filter_fields`, so unique per-document fields such as answer or
+    parent_id cost nothing), score all candidates with a single matrix product
+    and take the top k with argpartition. Filters on other fields fall back to
+    scanning the candidates' metadata.
+
+    With quantization="int8" candidates are scored against a compact copy of
+    the vectors (`vectors.i8`) with a per-dimension scale. The scale only
+    grows: a batch with larger values widens it and the stored codes are
+    re-encoded, so no vector is clipped. If rescore is set the float32 file is
+    kept as well, but it is not mapped: only the best rescore_factor * k
+    candidates of each query are read from it (with pread) and rescored
+    exactly. Without rescore the float32 file is not written at all.
+    """
+
+    VECTORS_FILE = "vectors.f32"
+    RECORDS_FILE = "records.jsonl"
+    META_FILE = "meta.json"
+    CODE_FILES = {"int8": "vectors.i8"}
+    CODE_DTYPES = {"int8": np.int8}
+    # Rows scored per block when quantized codes are widened to float32 (kept cache-sized)
+    SCORE_BLOCK_ROWS = 4096
+
+    def __init__(self, directory: str, dimension: Optional[int] = None, read_only: bool = False,
+                 quantization: Optional[str] = None, rescore: bool = True, rescore_factor: int = 4,
+                 filter_fields: Iterable[str] = FILTER_FIELDS):
+        if quantization == "float16":
+            # NumPy widens float16 without SIMD, which made scoring ~10x slower than float32
+            raise ValueError("float16 quantization is no longer supported; use int8")
+        if quantization not in (None, "none", "int8"):
+            raise ValueError(f"Unknown quantization '{quantization}'")
+        self.directory = directory
+        self.read_only = read_only
+        # None keeps whatever an existing collection was created with
+        self.quantization = quantization or "none"
+        self._requested_quantization = quantization
+        self.rescore = rescore
+        self.rescore_factor = rescore_factor
+        self._lock = threading.RLock()
+        self.dimension = dimension
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._row_of: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self.filter_fields = frozenset(filter_fields)
+        self._postings: Dict[str, Dict[Any, List[int]]] = {}
+        self._posting_arrays: Dict[Tuple[str, Any], np.ndarray] = {}
+        self._vectors: Optional[np.ndarray] = None
+        self._codes: Optional[np.ndarray] = None
+        self._scale: Optional[np.ndarray] = None
+        if not read_only:
+            os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    # -- persistence ---------------------------------------------------------
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @property
+    def keeps_full_precision(self) -> bool:
+        return self.quantization == "none" or self.rescore
+
+    def _matrix_files(self) -> List[Tuple[str, Any]]:
+        """(file name, dtype) of every vector file this collection keeps."""
+        files = []
+        if self.keeps_full_precision:
+            files.append((self.VECTORS_FILE, np.float32))
+        if self.quantization != "none":
+            files.append((self.CODE_FILES[self.quantization], self.CODE_DTYPES[self.quantization]))
+        return files
+
+    def _load(self) -> None:
+        meta_path = self._path(self.META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            self.dimension = meta["dimension"]
+            deleted = set(meta.get("deleted", []))
+            # The storage layout is fixed when the collection is created
+            stored = meta.get("quantization", "none")
+            if stored not in ("none", "int8"):
+                raise ValueError(f"Collection {self.directory} is stored with quantization={stored}, which is no "
+                                 f"longer supported; rebuild it with VECTOR_QUANTIZATION=int8 or none")
+            if stored != self.quantization and self._requested_quantization is not None:
+                logger.warning("Collection %s is stored with quantization=%s; ignoring requested %s",
+                               self.directory, stored, self.quantization)
+            self.quantization = stored
+            self.rescore = meta.get("rescore", self.rescore)
+            if meta.get("scale") is not None:
+                self._scale = np.asarray(meta["scale"], dtype=np.float32)
+        else:
+            deleted = set()
+
+        records_path = self._path(self.RECORDS_FILE)
+        if os.path.exists(records_path):
+            with open(records_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self._append_record(record["id"], record["text"], record["metadata"])
+
+        self._remap()
+        # Vectors are written before records, so an interrupted add leaves trailing vectors without records
+        file_rows = self._file_rows()
+        rows = min([len(self._ids)] + list(file_rows.values()))
+        if any(count > rows for count in file_rows.values()) and not self.read_only:
+            logger.warning("Truncating vectors without records in %s to %s rows", self.directory, rows)
+            self._vectors = self._codes = None
+            for name, dtype in self._matrix_files():
+                if file_rows.get(name, 0) > rows:
+                    with open(self._path(name), "r+b") as f:
+                        f.truncate(rows * np.dtype(dtype).itemsize * self.dimension)
+            self._remap()
+        if len(self._ids) > rows:
+            logger.warning("Dropping %s records without vectors in %s", len(self._ids) - rows, self.directory)
+            del self._ids[rows:], self._texts[rows:], self._metadatas[rows:]
+        self._alive = np.ones(len(self._ids), dtype=bool)
+        self._row_of = {}
+        for row, doc_id in enumerate(self._ids):
+            if doc_id in self._row_of:
+                self._alive[self._row_of[doc_id]] = False
+            self._row_of[doc_id] = row
+        for doc_id in deleted:
+            row = self._row_of.pop(doc_id, None)
+            if row is not None:
+                self._alive[row] = False
+        self._rebuild_postings()
+        logger.info("Loaded NumPy vector index from %s with %s records (quantization=%s)",
+                    self.directory, self.count(), self.quantization)
+
+    def _append_record(self, doc_id: str, text: str, metadata: Dict[str, Any]) -> None:
+        self._ids.append(doc_id)
+        self._texts.append(text)
+        self._metadatas.append(metadata)
+
+    def _file_rows(self) -> Dict[str, int]:
+        rows = {}
+        for name, dtype in self._matrix_files():
+            path = self._path(name)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            rows[name] = size // (np.dtype(dtype).itemsize * self.dimension) if self.dimension else 0
+        return rows
+
+    def _remap(self) -> None:
+        """(Re)open the vector files as read-only memory maps."""
+        self._vectors = self._codes = None
+        for name, dtype in self._matrix_files():
+            if name == self.VECTORS_FILE and self.quantization != "none":
+                # Only read row by row for rescoring
+                continue
+            path = self._path(name)
+            if self.dimension and os.path.exists(path) and os.path.getsize(path) > 0:
+                rows = os.path.getsize(path) // (np.dtype(dtype).itemsize * self.dimension)
+                matrix = np.memmap(path, dtype=dtype, mode="r", shape=(rows, self.dimension))
+            else:
+                matrix = np.zeros((0, self.dimension or 0), dtype=dtype)
+            if name == self.VECTORS_FILE:
+                self._vectors = matrix
+            else:
+                self._codes = matrix
+
+    def _write_meta(self) -> None:
+        # Superseded rows are resolved on load by ID order; only fully removed IDs need recording
+        deleted = sorted({self._ids[row] for row in np.flatnonzero(~self._alive)} - self._row_of.keys())
+        meta = {"dimension": self.dimension, "deleted": deleted,
+                "quantization": self.quantization, "rescore": self.rescore,
+                "scale": self._scale.tolist() if self._scale is not None else None}
+        tmp_path = self._path(self.META_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._path(self.META_FILE))
+
+    # -- quantization --------------------------------------------------------
+
+    @staticmethod
+    def _int8_scale(matrix: np.ndarray) -> np.ndarray:
+        """Per-dimension scale mapping the largest magnitude seen to 127."""
+        return np.maximum(np.abs(matrix).max(axis=0), 1e-6).astype(np.float32) / 127.0
+
+    def _encode(self, matrix: np.ndarray, dtype) -> np.ndarray:
+        if dtype == np.int8:
+            # The scale covers every stored vector (see _widen_scale), so clipping only absorbs rounding
+            return np.clip(np.rint(matrix / self._scale), -127, 127).astype(np.int8)
+        return matrix.astype(dtype)
+
+    def _widen_scale(self, matrix: np.ndarray) -> None:
+        """Grow the int8 scale to cover a new batch, re-encoding the stored codes; call with the lock held."""
+        needed = self._int8_scale(matrix)
+        if self._scale is not None and not (needed > self._scale).any():
+            return
+        if self._scale is None:
+            self._scale = needed
+        else:
+            rows = len(self._ids)
+            # Decoded with the old scale (or read exactly from the float32 file when it is kept)
+            stored = self._full_rows(np.arange(rows), self._vectors, self._codes)
+            self._scale = np.maximum(self._scale, needed)
+            logger.info("Widening the int8 scale of %s; re-encoding %s rows", self.directory, rows)
+            name = self.CODE_FILES["int8"]
+            tmp_path = self._path(name + ".tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(self._encode(stored, np.int8).tobytes())
+            self._codes = None
+            os.replace(tmp_path, self._path(name))
+        # The scale must be on disk before any codes that depend on it
+        self._write_meta()
+        self._remap()
+
+    def _open_full(self) -> Optional[int]:
+        """A descriptor of the float32 file when rows are read from it; it keeps reading this version after compact()."""
+        if self.quantization == "none" or not self.rescore:
+            return None
+        return os.open(self._path(self.VECTORS_FILE), os.O_RDONLY)
+
+    def _read_full_rows(self, rows: np.ndarray, fd: Optional[int] = None) -> np.ndarray:
+        """Read float32 rows straight from the file; only bulk reads (compaction, export) map it."""
+        if fd is None and len(rows) > 1024:
+            path = self._path(self.VECTORS_FILE)
+            total = os.path.getsize(path) // (4 * self.dimension)
+            return np.array(np.memmap(path, dtype=np.float32, mode="r", shape=(total, self.dimension))[rows])
+        row_bytes = 4 * self.dimension
+        matrix = np.empty((len(rows), self.dimension), dtype=np.float32)
+        own = fd is None
+        if own:
+            fd = os.open(self._path(self.VECTORS_FILE), os.O_RDONLY)
+        try:
+            for position, row in enumerate(rows):
+                matrix[position] = np.frombuffer(os.pread(fd, row_bytes, int(row) * row_bytes), dtype=np.float32)
+        finally:
+            if own:
+                os.close(fd)
+        return matrix
+
+    def _full_rows(self, rows: np.ndarray, vectors: Optional[np.ndarray],
+                   codes: Optional[np.ndarray], fd: Optional[int] = None) -> np.ndarray:
+        """Float32 vectors of the given rows, dequantized if no full-precision copy is kept."""
+        if vectors is not None:
+            return np.asarray(vectors[rows], dtype=np.float32)
+        if self.keeps_full_precision:
+            return self._read_full_rows(rows, fd)
+        block = np.asarray(codes[rows], dtype=np.float32)
+        return block * self._scale if self.quantization == "int8" else block
+
+    def _score(self, queries: np.ndarray, matrix: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Inner products of every query with the candidate rows of the search matrix."""
+        all_rows = rows.size == matrix.shape[0]
+        if matrix.dtype == np.float32:
+            return queries @ (matrix if all_rows else matrix[rows]).T
+        # Fold the per-dimension scale into the queries: q . (c * s) == (q * s) . c
+        queries = queries * self._scale
+        scores = np.empty((len(queries), rows.size), dtype=np.float32)
+        for start in range(0, rows.size, self.SCORE_BLOCK_ROWS):
+            end = min(start + self.SCORE_BLOCK_ROWS, rows.size)
+            block = matrix[start:end] if all_rows else matrix[rows[start:end]]
+            scores[:, start:end] = queries @ np.asarray(block, dtype=np.float32).T
+        return scores
+
+    # -- metadata postings ---------------------------------------------------
+
+    def _rebuild_postings(self) -> None:
+        self._postings = {field: {} for field in self.filter_fields}
+        self._posting_arrays = {}
+        for row, metadata in enumerate(self._metadatas):
+            self._add_postings(row, metadata)
+
+    def _add_postings(self, row: int, metadata: Dict[str, Any]) -> None:
+        for field in self.filter_fields:
+            value = metadata.get(field)
+            if value is not None:
+                self._postings[field].setdefault(value, []).append(row)
+                self._posting_arrays.pop((field, value), None)
+
+    def _posting_array(self, field: str, value: Any) -> np.ndarray:
+        """Sorted rows holding field=value (rows are appended in order, so the list is already sorted)."""
+        key = (field, value)
+        array = self._posting_arrays.get(key)
+        if array is None:
+            array = self._posting_arrays[key] = np.asarray(self._postings[field].get(value, ()), dtype=np.int64)
+        return array
+
+    def _candidate_rows(self, where: Optional[Dict[str, Any]], metadatas: List[Dict[str, Any]]) -> np.ndarray:
+        """Live rows matching every filter, in row order; call with the lock held."""
+        indexed = [(field, value) for field, value in (where or {}).items() if field in self.filter_fields]
+        scanned = [(field, value) for field, value in (where or {}).items() if field not in self.filter_fields]
+        if indexed:
+            postings = sorted((self._posting_array(field, value) for field, value in indexed), key=len)
+            rows = postings[0]
+            for other in postings[1:]:
+                if rows.size == 0:
+                    break
+                positions = np.minimum(np.searchsorted(other, rows), max(other.size - 1, 0))
+                rows = rows[other[positions] == rows] if other.size else other
+        else:
+            rows = np.arange(len(metadatas))
+        rows = rows[self._alive[rows]]
+        if scanned:
+            rows = np.fromiter((row for row in rows
+                                if all(metadatas[row].get(field) == value for field, value in scanned)),
+                               dtype=np.int64)
+        return rows
+
+    # -- VectorBackend -------------------------------------------------------
+
+    def add(self, ids, texts, metadatas, embeddings):
+        if self.read_only:
+            raise RuntimeError("NumPy vector index was opened read-only")
+        if not ids:
+            return
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1.0, norms)
+        with self._lock:
+            if not self.dimension:
+                self.dimension = matrix.shape[1]
+            elif matrix.shape[1] != self.dimension:
+                raise ValueError(f"Expected {self.dimension}-dimensional vectors, got {matrix.shape[1]}")
+            if self.quantization == "int8":
+                self._widen_scale(matrix)
+            # Vectors are written before records so a crash never leaves a record without its vector
+            for name, dtype in self._matrix_files():
+                with open(self._path(name), "ab") as f:
+                    f.write(self._encode(matrix, dtype).tobytes())
+            with open(self._path(self.RECORDS_FILE), "a", encoding="utf-8") as f:
+                for doc_id, text, metadata in zip(ids, texts, metadatas):
+                    f.write(json.dumps({"id": doc_id, "text": text, "metadata": metadata}) + "\n")
+
+            start = len(self._ids)
+            size = start + len(ids)
+            alive = np.zeros(size, dtype=bool)
+            alive[:start] = self._alive
+            for offset, (doc_id, text, metadata) in enumerate(zip(ids, texts, metadatas)):
+                row = start + offset
+                previous = self._row_of.get(doc_id)
+                if previous is not None:
+                    alive[previous] = False
+                self._append_record(doc_id, text, metadata)
+                self._row_of[doc_id] = row
+                alive[row] = True
+                self._add_postings(row, metadata)
+            self._alive = alive
+            self._remap()
+            if not os.path.exists(self._path(self.META_FILE)):
+                self._write_meta()
+
+    def delete(self, ids):
+        if self.read_only:
+            raise RuntimeError("NumPy vector index was opened read-only")
+        with self._lock:
+            for doc_id in ids:
+                row = self._row_of.pop(doc_id, None)
+                if row is not None:
+                    self._alive[row] = False
+            self._write_meta()
+
+    def get(self, where=None, limit=None, offset=0, include_embeddings=False):
+        # compact() swaps the lists and files, so take references to the current ones under the lock
+        with self._lock:
+            ids, texts, metadatas = self._ids, self._texts, self._metadatas
+            rows = self._candidate_rows(where, metadatas)
+            vectors, codes = self._vectors, self._codes
+            fd = self._open_full() if include_embeddings and vectors is None else None
+        try:
+            rows = rows[offset:offset + limit] if limit is not None else rows[offset:]
+            result = {
+                "ids": [ids[row] for row in rows],
+                "documents": [texts[row] for row in rows],
+                "metadatas": [metadatas[row] for row in rows],
+            }
+            if include_embeddings:
+                result["embeddings"] = self._full_rows(rows, vectors, codes, fd).tolist()
+        finally:
+            if fd is not None:
+                os.close(fd)
+        return result
+
+    def query(self, query_embeddings, k, where=None):
+        if not query_embeddings:
+            return []
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries /= np.where(norms == 0, 1.0, norms)
+        with self._lock:
+            ids, texts, metadatas = self._ids, self._texts, self._metadatas
+            rows = self._candidate_rows(where, metadatas)
+            vectors, codes = self._vectors, self._codes
+            rescoring = codes is not None and self.rescore and rows.size > 0
+            fd = self._open_full() if rescoring else None
+        try:
+            return self._query_rows(queries, k, rows, ids, texts, metadatas, vectors, codes, fd)
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def _query_rows(self, queries, k, rows, ids, texts, metadatas, vectors, codes, fd) -> List[List[QueryHit]]:
+        if rows.size == 0:
+            return [[] for _ in range(len(queries))]
+        rescoring = fd is not None
+        scores = self._score(queries, codes if codes is not None else vectors, rows)
+        k = min(k, rows.size)
+        shortlist = min(rows.size, k * self.rescore_factor) if rescoring else k
+        if shortlist < rows.size:
+            top = np.argpartition(-scores, shortlist - 1, axis=1)[:, :shortlist]
+        else:
+            top = np.broadcast_to(np.arange(rows.size), (len(queries), rows.size))
+        results = []
+        for i in range(len(queries)):
+            candidates = top[i]
+            candidate_scores = scores[i, candidates]
+            if rescoring:
+                # Exact scores from the float32 file for the shortlist only
+                candidate_scores = self._read_full_rows(rows[candidates], fd) @ queries[i]
+            order = np.argsort(-candidate_scores)[:k]
+            results.append([
+                (ids[rows[candidates[j]]], texts[rows[candidates[j]]],
+                 metadatas[rows[candidates[j]]], float(1.0 - candidate_scores[j]))
+                for j in order
+            ])
+        return results
+
+    def count(self):
+        return int(self._alive.sum())
+
+    def persist(self):
+        if not self.read_only:
+            with self._lock:
+                self._write_meta()
+
+    def close(self):
+        # Queries still running hold their own references, so the maps are unmapped once they finish
+        with self._lock:
+            self._ids, self._texts, self._metadatas = [], [], []
+            self._row_of = {}
+            self._alive = np.zeros(0, dtype=bool)
+            self._vectors = self._codes = None
+            self._rebuild_postings()
+
+    def compact(self) -> None:
+        """Rewrite the files without deleted or superseded rows (and refit the int8 scale)."""
+        with self._lock:
+            keep = np.flatnonzero(self._alive)
+            matrix = self._full_rows(keep, self._vectors, self._codes)
+            if self.quantization == "int8" and len(keep):
+                self._scale = self._int8_scale(matrix)
+            replacements = []
+            for name, dtype in self._matrix_files():
+                tmp_path = self._path(name + ".tmp")
+                with open(tmp_path, "wb") as f:
+                    f.write(self._encode(matrix, dtype).tobytes())
+                replacements.append((tmp_path, self._path(name)))
+            tmp_records = self._path(self.RECORDS_FILE + ".tmp")
+            with open(tmp_records, "w", encoding="utf-8") as f:
+                for row in keep:
+                    f.write(json.dumps({"id": self._ids[row], "text": self._texts[row],
+                                        "metadata": self._metadatas[row]}) + "\n")
+            replacements.append((tmp_records, self._path(self.RECORDS_FILE)))
+            self._vectors = self._codes = None
+            for tmp_path, path in replacements:
+                os.replace(tmp_path, path)
+            self._ids = [self._ids[row] for row in keep]
+            self._texts = [self._texts[row] for row in keep]
+            self._metadatas = [self._metadatas[row] for row in keep]
+            self._row_of = {doc_id: row for row, doc_id in enumerate(self._ids)}
+            self._alive = np.ones(len(self._ids), dtype=bool)
+            self._write_meta()
+            self._remap()
+            self._rebuild_postings()
+
+
+def create_backend(kind: str, directory: str, collection_name: str,
+                   collection_metadata: Optional[Dict[str, Any]] = None, read_only: bool = False) -> VectorBackend:
+    """
+    Create the backend selected by VECTOR_BACKEND.
+
+    Args:
+        kind: "chroma" or "numpy"
+        directory: Base persistence directory
+        collection_name: Collection (Chroma) or sub-directory (NumPy) name
+        collection_metadata: Chroma collection settings; defaults to the collection's
+            HNSW parameters from config. Ignored by NumPy, which takes its storage
+            settings (VECTOR_QUANTIZATION, VECTOR_RESCORE) from config.
+        read_only: Open an existing collection without ever writing to it (NumPy only)
+
+    Returns:
+        A VectorBackend instance
+    """
+    if kind == "numpy":
+        return NumpyBackend(os.path.join(directory, "numpy", collection_name), read_only=read_only,
+                            quantization=VECTOR_QUANTIZATION, rescore=VECTOR_RESCORE,
+                            rescore_factor=VECTOR_RESCORE_FACTOR)
+    if read_only:
+        raise ValueError("Only the numpy backend can be opened read-only")
+    if kind != "chroma":
+        logger.warning("Unknown VECTOR_BACKEND '%s', using chroma", kind)
+    if collection_metadata is None:
+        collection_metadata = hnsw_metadata(index_params_for(collection_name))
+    return ChromaBackend(directory, collection_name, collection_metadata)
+
+
+def list_collections(kind: str, directory: str) -> List[str]:
+    """Names of the collections stored under a persistence directory."""
+    if kind == "numpy":
+        base = os.path.join(directory, "numpy")
+        if not os.path.isdir(base):
+            return []
+        return sorted(name for name in os.listdir(base) if os.path.isdir(os.path.join(base, name)))
+    if not os.path.isdir(directory):
+        return []
+    import chromadb
+
+    # Chroma < 0.6 returns Collection objects, later versions return names
+    return sorted(getattr(c, "name", c) for c in chromadb.PersistentClient(path=directory).list_collections())
+
+
+def drop_collection(kind: str, directory: str, collection_name: str) -> None:
+    """Delete a collection and everything stored in it."""
+    if kind == "numpy":
+        shutil.rmtree(os.path.join(directory, "numpy", collection_name), ignore_errors=True)
+        return
+    import chromadb
+
+    chromadb.PersistentClient(path=directory).delete_collection(collection_name)
@@ -1,70 +1,886 @@
+import fcntl
+import hashlib
+import json
 import os
-import chromadb
-from chromadb.config import Settings
-from typing import List, Dict, Optional
-from langchain_community.vectorstores import Chroma
+import re
+import threading
+from collections import OrderedDict
+from typing import Container, List, Dict, Optional, Tuple
 from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
 from langchain.schema.document import Document
 from logger import logger
-from config import VECTOR_STORE_DIR, EMBEDDING_MODEL
+from config import (
+    VECTOR_STORE_DIR, EMBEDDING_MODEL, EMBEDDING_CACHE_SIZE, EMBEDDING_BATCHING, EMBEDDING_RUNTIME,
+    EMBEDDING_ONNX_DIR, EMBEDDING_ONNX_QUANTIZED, EMBEDDING_THREADS, VECTOR_BACKEND,
+    VECTOR_PARTITION_FIELDS, VECTOR_SNAPSHOT_DIR, VECTOR_SNAPSHOT_VERSION, VECTOR_SNAPSHOT_VERIFY_CHECKSUMS,
+    RETRIEVAL_MODE, LEXICAL_MIN_COVERAGE, RRF_K, SEEN_MAX_CANDIDATES, SEEN_OVERFETCH_FACTOR
+)
+from embedding_batcher import EmbeddingBatcher
+from index_versions import store_directory
+from lazy import Lazy
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from metrics import EMBEDDING_CACHE_REQUESTS, HYBRID_SEARCH_PATHS, SEEN_OVERFETCH_SEARCHES, SEEN_SKIPPED
+from tracing import current_span, span, traced
+from vector_backends import (
+    INDEXED_METADATA_FIELDS, QueryHit, VectorBackend, create_backend, drop_collection, list_collections
+)
 
-# Initialize embedding function
-embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+class TracedEmbeddings(Embeddings):
+    """Embedding function wrapper that records a span around every model call."""
+    
+    def __init__(self, base: Embeddings):
+        self.base = base
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with span("embedding.embed_documents", batch_size=len(texts)):
+            return self.base.embed_documents(texts)
+    
+    def embed_query(self, text: str) -> List[float]:
+        with span("embedding.embed_query"):
+            return self.base.embed_query(text)
+
+def normalize_query(text: str) -> str:
+    """Normalize query text so trivially different spellings share a cache entry."""
+    return " ".join(text.replace("_", " ").lower().split())
+
+class CachedEmbeddings(Embeddings):
+    """
+    LRU cache of query embeddings keyed by normalized text.
+    
+    Queries are embedded in their normalized form, so a cache hit returns exactly
+    the vector a miss would have computed. Document embeddings are passed through
+    uncached since each stored document is only embedded once.
+    """
+    
+    def __init__(self, base: Embeddings, max_size: int = EMBEDDING_CACHE_SIZE):
+        self.base = base
+        self.max_size = max_size
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def _put(self, key: str, vector: List[float]) -> None:
+        with self._lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+    
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if vector is not None:
+            EMBEDDING_CACHE_REQUESTS.labels(result="hit").inc()
+            return vector
+        EMBEDDING_CACHE_REQUESTS.labels(result="miss").inc()
+        vector = self.base.embed_query(key)
+        self._put(key, vector)
+        return vector
+    
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries, computing every cache miss in one batched model call."""
+        keys = [normalize_query(text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for key in keys:
+                vector = self._cache.get(key)
+                if vector is not None:
+                    self._cache.move_to_end(key)
+                    found[key] = vector
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        EMBEDDING_CACHE_REQUESTS.labels(result="hit").inc(hits)
+        EMBEDDING_CACHE_REQUESTS.labels(result="miss").inc(len(keys) - hits)
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+        if missing:
+            # Queries and documents are embedded identically (see precompute)
+            for key, vector in zip(missing, self.base.embed_documents(missing)):
+                self._put(key, vector)
+                found[key] = vector
+        return [found[key] for key in keys]
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+    
+    def precompute(self, texts: List[str]) -> int:
+        """
+        Embed and cache query texts ahead of time in a single batched model call.
+        
+        Args:
+            texts: Query strings expected at runtime, e.g. every known topic
+            
+        Returns:
+            Number of new entries added to the cache
+        """
+        with self._lock:
+            keys = list(dict.fromkeys(k for k in map(normalize_query, texts) if k not in self._cache))
+        if not keys:
+            return 0
+        # HuggingFaceEmbeddings embeds queries and documents identically, so one batch suffices
+        for key, vector in zip(keys, self.base.embed_documents(keys)):
+            self._put(key, vector)
+        logger.info("Precomputed %s query embeddings", len(keys))
+        return len(keys)
+    
+    def preload(self, texts: List[str], vectors: List[List[float]]) -> int:
+        """Cache query embeddings computed elsewhere, e.g. shipped in an index snapshot."""
+        for key, vector in zip(map(normalize_query, texts), vectors):
+            self._put(key, vector)
+        return len(texts)
+    
+    def clear(self) -> None:
+        """Drop every cached embedding."""
+        with self._lock:
+            self._cache.clear()
+    
+    def stats(self) -> Dict:
+        """Return cache size and hit-rate statistics."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._cache),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+def create_embedding_model(threads: int = EMBEDDING_THREADS) -> Embeddings:
+    """Create the embedding model for the configured EMBEDDING_RUNTIME (threads apply to onnx)."""
+    if EMBEDDING_RUNTIME == "onnx":
+        from onnx_embeddings import OnnxEmbeddings
+        return OnnxEmbeddings(EMBEDDING_ONNX_DIR, quantized=EMBEDDING_ONNX_QUANTIZED, threads=threads)
+    if EMBEDDING_RUNTIME != "huggingface":
+        logger.warning("Unknown EMBEDDING_RUNTIME '%s', using huggingface", EMBEDDING_RUNTIME)
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+
+def create_embeddings() -> "CachedEmbeddings":
+    """
+    Build the embedding function: cache hits never reach the (traced) model, and misses from
+    concurrent requests share batched model calls. Spans cover the wait for the batch too.
+    """
+    # The model itself loads on the first cache miss, so a preloaded cache needs no model
+    model = Lazy(create_embedding_model, "embedding_model")
+    return CachedEmbeddings(TracedEmbeddings(EmbeddingBatcher(model) if EMBEDDING_BATCHING else model))
+
+# Loaded on first use (or by warmup.warm_up), so importing this module stays cheap
+embeddings = Lazy(create_embeddings, "embeddings")
+
+def metadata_key(value) -> str:
+    """Normalize a metadata value so "Periodic Table" and "periodic_table" match."""
+    return "_".join(str(value).lower().split())
+
+def document_id(document: Document) -> str:
+    """
+    Deterministic ID from a document's text and metadata.
+    
+    Storing the same document again overwrites it instead of duplicating it, and an
+    edited document gets a new ID, so comparing IDs tells what changed.
+    """
+    payload = json.dumps({"text": document.page_content, "metadata": document.metadata},
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+class MetadataIndex:
+    """
+    In-process inverted index from metadata values to stored documents.
+    
+    Exact-key lookups (e.g. type=question, topic=algebra, difficulty=easy) become
+    a few set intersections instead of an embedding plus an ANN search.
+    """
+    
+    def __init__(self, fields=INDEXED_METADATA_FIELDS):
+        self.fields = fields
+        self.ready = False
+        self._postings: Dict[str, Dict[str, set]] = {field: {} for field in fields}
+        self._documents: Dict[str, Document] = {}
+        self._order: Dict[str, int] = {}
+        self._next_position = 0
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._documents)
+    
+    def add(self, ids: List[str], documents: List[Document]) -> None:
+        """Index documents under their stored IDs, replacing any previous entry."""
+        with self._lock:
+            for doc_id, doc in zip(ids, documents):
+                if doc_id in self._documents:
+                    self._remove(doc_id)
+                if doc.id != doc_id:
+                    doc = Document(page_content=doc.page_content, metadata=doc.metadata, id=doc_id)
+                self._documents[doc_id] = doc
+                self._order[doc_id] = self._next_position
+                self._next_position += 1
+                for field in self.fields:
+                    value = doc.metadata.get(field)
+                    if value is not None:
+                        self._postings[field].setdefault(metadata_key(value), set()).add(doc_id)
+    
+    def remove(self, ids: List[str]) -> None:
+        """Drop documents from the index."""
+        with self._lock:
+            for doc_id in ids:
+                if doc_id in self._documents:
+                    self._remove(doc_id)
+    
+    def _remove(self, doc_id: str) -> None:
+        doc = self._documents.pop(doc_id)
+        self._order.pop(doc_id, None)
+        for field in self.fields:
+            value = doc.metadata.get(field)
+            if value is not None:
+                postings = self._postings[field].get(metadata_key(value))
+                if postings is not None:
+                    postings.discard(doc_id)
+    
+    def lookup_ids(self, filters: Dict[str, str]) -> List[str]:
+        """Return IDs of documents matching every filter, in insertion order."""
+        with self._lock:
+            candidate_sets = []
+            for field, value in filters.items():
+                if field not in self._postings:
+                    raise KeyError(f"Metadata field '{field}' is not indexed")
+                postings = self._postings[field].get(metadata_key(value))
+                if not postings:
+                    return []
+                candidate_sets.append(postings)
+            candidate_sets.sort(key=len)
+            matches = set.intersection(*candidate_sets) if candidate_sets else set(self._documents)
+            return sorted(matches, key=self._order.__getitem__)
+    
+    def posting_sets(self, filters: Dict[str, str]) -> Optional[List[set]]:
+        """
+        The posting set of each filter, smallest first, or None when one matches nothing.
+        
+        Unlike lookup_ids nothing is copied, intersected or sorted; the sets are live and
+        must only be read (e.g. by BM25Index.search).
+        """
+        with self._lock:
+            sets = []
+            for field, value in filters.items():
+                if field not in self._postings:
+                    raise KeyError(f"Metadata field '{field}' is not indexed")
+                postings = self._postings[field].get(metadata_key(value))
+                if not postings:
+                    return None
+                sets.append(postings)
+        return sorted(sets, key=len)
+    
+    def get(self, doc_id: str) -> Optional[Document]:
+        """Return the indexed document with this ID, if any."""
+        return self._documents.get(doc_id)
+    
+    def lookup(self, filters: Dict[str, str], k: Optional[int] = None) -> List[Document]:
+        """Return the first k documents matching every filter, in insertion order."""
+        ids = self.lookup_ids(filters)
+        if k is not None:
+            ids = ids[:k]
+        return [self._documents[doc_id] for doc_id in ids]
+
+# Collection that held every document before partitioning
+LEGACY_COLLECTION = "education_content"
+PARTITION_PREFIX = "education"
+PARTITION_SEPARATOR = "__"
+
+def partition_component(value) -> str:
+    """Turn a metadata value into a component of a collection name."""
+    return re.sub(r"[^a-z0-9_-]", "", metadata_key(value)) or "none"
+
+class PartitionRouter:
+    """
+    Maps documents and query filters to partition (collection) names.
+    
+    Documents are partitioned by type and then by each of `fields`, so with
+    fields=("subject",) the math questions live in "education__question__math".
+    Queries are sent only to the partitions their filters can match.
+    """
+    
+    def __init__(self, fields=VECTOR_PARTITION_FIELDS):
+        self.fields = ("type",) + tuple(f for f in fields if f != "type")
+        self.names = set()
+    
+    def partition_for(self, metadata: Dict) -> str:
+        """Name of the partition a document with this metadata is stored in."""
+        parts = [partition_component(metadata.get(field)) for field in self.fields]
+        return PARTITION_SEPARATOR.join([PARTITION_PREFIX] + parts)
+    
+    def is_partition(self, name: str) -> bool:
+        """Whether a collection name is a partition under the current layout."""
+        parts = name.split(PARTITION_SEPARATOR)
+        return parts[0] == PARTITION_PREFIX and len(parts) == len(self.fields) + 1
+    
+    def _matching(self, names: List[str], values: Dict[str, str]) -> List[str]:
+        wanted = {
+            position: partition_component(values[field])
+            for position, field in enumerate(self.fields, start=1) if field in values
+        }
+        return [
+            name for name in names
+            if all(name.split(PARTITION_SEPARATOR)[position] == part for position, part in wanted.items())
+        ]
+    
+    def route(self, where: Optional[Dict[str, str]] = None,
+              hints: Optional[Dict[str, str]] = None) -> List[str]:
+        """
+        Select the partitions to search.
+        
+        Args:
+            where: Metadata filters the results must match
+            hints: Likely metadata values (e.g. the learner's subject); they narrow the
+                search when a matching partition exists but never exclude everything
+                
+        Returns:
+            Names of the known partitions to query
+        """
+        candidates = self._matching(sorted(self.names), where or {})
+        hints = {field: value for field, value in (hints or {}).items() if value}
+        if hints:
+            narrowed = self._matching(candidates, hints)
+            if narrowed:
+                return narrowed
+        return candidates
 
 class VectorStore:
-    """Vector store implementation using ChromaDB."""
+    """
+    Vector store over a pluggable backend (ChromaDB by default, see vector_backends.py).
     
-    def __init__(self):
-        """Initialize the vector store."""
-        os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
-        self.vector_store = Chroma(
-            collection_name="education_content", 
-            embedding_function=embeddings,
-            persist_directory=VECTOR_STORE_DIR
-        )
-        logger.info(f"Vector store initialized with persistence directory: {VECTOR_STORE_DIR}")
+    Documents are spread over partition collections chosen by PartitionRouter;
+    the metadata index, the BM25 lexical index and the embedding cache are
+    shared by all of them.
+    """
     
-    def add_documents(self, documents: List[Document]) -> None:
+    def __init__(self, backend_kind: str = VECTOR_BACKEND, directory: str = VECTOR_STORE_DIR,
+                 router: Optional[PartitionRouter] = None, load_indexes: bool = True, read_only: bool = False):
+        """
+        Initialize the vector store.
+        
+        Args:
+            backend_kind: Storage backend for every partition ("chroma" or "numpy")
+            directory: Persistence directory
+            router: Partition layout; defaults to one configured by VECTOR_PARTITION_FIELDS
+            load_indexes: Build the in-memory metadata and lexical indexes; write-only
+                users such as bulk ingestion skip them to keep memory flat
+            read_only: Serve existing partitions without migrating or writing anything,
+                e.g. an index snapshot (numpy backend only)
+        """
+        if not read_only:
+            os.makedirs(directory, exist_ok=True)
+        self.backend_kind = backend_kind
+        self.directory = directory
+        self.read_only = read_only
+        # Version information when serving an index snapshot (set by snapshot.load_snapshot)
+        self.snapshot: Optional[Dict] = None
+        self.router = router or PartitionRouter()
+        self.partitions: Dict[str, VectorBackend] = {}
+        self._partitions_lock = threading.Lock()
+        self.metadata_index = MetadataIndex()
+        self.lexical_index = BM25Index()
+        
+        if not read_only:
+            self._migrate_stale_collections()
+        for name in list_collections(backend_kind, directory):
+            if self.router.is_partition(name):
+                self._partition(name)
+        logger.info("Vector store initialized with %s backend and %s partitions, persistence directory: %s",
+                    backend_kind, len(self.partitions), directory)
+        if load_indexes:
+            self._load_metadata_index()
+    
+    def _partition(self, name: str) -> VectorBackend:
+        """Open (creating if needed) the backend for a partition."""
+        with self._partitions_lock:
+            backend = self.partitions.get(name)
+            if backend is None:
+                backend = create_backend(self.backend_kind, self.directory, name, read_only=self.read_only)
+                self.partitions[name] = backend
+                self.router.names.add(name)
+            return backend
+    
+    def close(self) -> None:
+        """Close every partition and drop the in-memory indexes, e.g. once a reloaded index replaced this one."""
+        with self._partitions_lock:
+            backends = list(self.partitions.values())
+        for backend in backends:
+            backend.close()
+        self.metadata_index = MetadataIndex()
+        self.lexical_index = BM25Index()
+        logger.info("Closed vector store %s", self.directory)
+    
+    def _stale_collections(self) -> List[str]:
+        """The pre-partitioning collection and partitions left over from another layout."""
+        return [
+            name for name in list_collections(self.backend_kind, self.directory)
+            if name == LEGACY_COLLECTION
+            or (name.startswith(PARTITION_PREFIX + PARTITION_SEPARATOR) and not self.router.is_partition(name))
+        ]
+    
+    def _migrate_stale_collections(self, page_size: int = 1000) -> int:
+        """
+        Move documents from stale collections into the current partitions.
+        
+        Covers both the single collection used before partitioning and a change of
+        VECTOR_PARTITION_FIELDS. Stored embeddings are copied as they are, so nothing
+        is re-embedded. A file lock keeps concurrently starting workers from
+        migrating twice.
+        
+        Returns:
+            Number of documents migrated
+        """
+        if not self._stale_collections():
+            return 0
+        migrated = 0
+        with open(os.path.join(self.directory, ".migrate.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Another worker may have finished the migration while we waited
+            for name in self._stale_collections():
+                source = create_backend(self.backend_kind, self.directory, name)
+                logger.info("Migrating %s documents from %s into partitioned collections", source.count(), name)
+                offset = 0
+                while True:
+                    page = source.get(limit=page_size, offset=offset, include_embeddings=True)
+                    if not page["ids"]:
+                        break
+                    self._write_partitioned(page["ids"], page["documents"], page["metadatas"], page["embeddings"])
+                    migrated += len(page["ids"])
+                    offset += len(page["ids"])
+                drop_collection(self.backend_kind, self.directory, name)
+        logger.info("Migrated %s documents into %s partitions", migrated, len(self.partitions))
+        return migrated
+    
+    def _write_partitioned(self, ids: List[str], texts: List[str], metadatas: List[Dict],
+                           vectors: List[List[float]], persist: bool = True) -> None:
+        """Write records to their partitions, one add (and one persist, unless deferred) per partition."""
+        groups: Dict[str, List[int]] = {}
+        for position, metadata in enumerate(metadatas):
+            name = self.router.partition_for(metadata)
+            groups.setdefault(name, []).append(position)
+            # A document whose metadata changed partition must not stay behind in the old one
+            previous = self.metadata_index.get(ids[position])
+            if previous is not None:
+                previous_name = self.router.partition_for(previous.metadata)
+                if previous_name != name and previous_name in self.partitions:
+                    self.partitions[previous_name].delete([ids[position]])
+        for name, positions in groups.items():
+            backend = self._partition(name)
+            backend.add([ids[p] for p in positions], [texts[p] for p in positions],
+                        [metadatas[p] for p in positions], [vectors[p] for p in positions])
+            if persist:
+                backend.persist()
+    
+    def persist(self) -> None:
+        """Persist every partition; used by writers that defer persisting to checkpoints."""
+        if self.read_only:
+            return
+        for backend in list(self.partitions.values()):
+            backend.persist()
+    
+    @traced("vector_store.load_metadata_index")
+    def _load_metadata_index(self, page_size: int = 5000) -> None:
+        """Build the in-memory metadata and lexical indexes from everything already stored."""
+        try:
+            for backend in list(self.partitions.values()):
+                offset = 0
+                while True:
+                    page = backend.get(limit=page_size, offset=offset)
+                    if not page["ids"]:
+                        break
+                    documents = [
+                        Document(page_content=text, metadata=metadata, id=doc_id)
+                        for doc_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"])
+                    ]
+                    self.metadata_index.add(page["ids"], documents)
+                    self.lexical_index.add(page["ids"], documents)
+                    offset += len(page["ids"])
+            self.metadata_index.ready = True
+            logger.info("Metadata index built with %s documents", len(self.metadata_index))
+        except Exception as e:
+            logger.error("Error building metadata index, using filtered backend lookups instead: %s", e)
+    
+    @traced("vector_store.add_documents")
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None) -> List[str]:
         """
         Add documents to the vector store.
         
         Args:
             documents: List of Document objects to add
+            ids: Optional document IDs; content-hash IDs (document_id) are used if omitted
+            
+        Returns:
+            The IDs the documents were stored under
         """
-        logger.debug(f"Adding {len(documents)} documents to vector store")
-        self.vector_store.add_documents(documents)
-        self.vector_store.persist()
-        logger.info(f"Added {len(documents)} documents to vector store")
+        logger.debug("Adding %s documents to vector store", len(documents))
+        ids = ids or [document_id(doc) for doc in documents]
+        vectors = embeddings.embed_documents([doc.page_content for doc in documents])
+        self.add_embedded(ids, documents, vectors)
+        logger.info("Added %s documents to vector store", len(documents))
+        return ids
     
-    def search(self, query: str, k: int = 3) -> List[Document]:
+    def add_embedded(self, ids: List[str], documents: List[Document], vectors: List[List[float]],
+                     persist: bool = True) -> None:
+        """
+        Store documents whose embeddings were computed elsewhere (e.g. in ingestion workers).
+        
+        Args:
+            ids: Document IDs
+            documents: The documents
+            vectors: One embedding per document
+            persist: Persist the touched partitions now; pass False and call persist() later to batch
+        """
+        if self.read_only:
+            raise RuntimeError(f"Vector store {self.directory} is read-only")
+        self._write_partitioned(ids, [doc.page_content for doc in documents],
+                                [doc.metadata for doc in documents], vectors, persist=persist)
+        if self.metadata_index.ready:
+            self.metadata_index.add(ids, documents)
+            self.lexical_index.add(ids, documents)
+    
+    @traced("vector_store.delete_documents")
+    def delete_documents(self, ids: List[str]) -> int:
+        """
+        Delete documents by ID from their partitions and the in-memory indexes.
+        
+        Returns:
+            Number of documents deleted
+        """
+        if self.read_only:
+            raise RuntimeError(f"Vector store {self.directory} is read-only")
+        groups: Dict[str, List[str]] = {}
+        for doc_id in ids:
+            doc = self.metadata_index.get(doc_id)
+            if doc is not None:
+                groups.setdefault(self.router.partition_for(doc.metadata), []).append(doc_id)
+        for name, group in groups.items():
+            if name in self.partitions:
+                self.partitions[name].delete(group)
+                self.partitions[name].persist()
+        deleted = [doc_id for group in groups.values() for doc_id in group]
+        self.metadata_index.remove(deleted)
+        self.lexical_index.remove(deleted)
+        logger.info("Deleted %s documents from vector store", len(deleted))
+        return len(deleted)
+    
+    @traced("vector_store.sync_documents")
+    def sync_documents(self, documents: List[Document], sources: Optional[List[str]] = None,
+                       dry_run: bool = False) -> Dict:
+        """
+        Make the stored documents of some sources match `documents` exactly.
+        
+        The manifest of what is stored is the set of content-hash IDs already indexed
+        for those sources (metadata "source"). Documents whose ID is not stored yet are
+        embedded and added; stored documents no longer in `documents` (removed or
+        edited ones, and duplicates or random-ID copies from older ingestions) are
+        deleted. Unchanged documents are not re-embedded.
+        
+        Args:
+            documents: The complete current set of documents for their sources
+            sources: Sources to sync; defaults to those of `documents`. Pass a source
+                explicitly to delete everything it stored when it has no documents left.
+            dry_run: Only compute the diff
+            
+        Returns:
+            The diff: counts of added, removed and unchanged documents, and the sources
+        """
+        if not self.metadata_index.ready:
+            raise RuntimeError("Metadata index is not loaded; cannot diff against stored documents")
+        desired: Dict[str, Document] = {}
+        for doc in documents:
+            desired.setdefault(document_id(doc), doc)
+        sources = sorted(set(sources or []) | {doc.metadata.get("source") for doc in documents} - {None})
+        stored = {doc_id for source in sources for doc_id in self.metadata_index.lookup_ids({"source": source})}
+        
+        added = [doc_id for doc_id in desired if doc_id not in stored]
+        removed = sorted(stored - desired.keys())
+        diff = {"added": len(added), "removed": len(removed), "unchanged": len(desired) - len(added),
+                "sources": sources}
+        if not dry_run:
+            # Add before deleting, so a failed embedding never leaves a source half-empty
+            if added:
+                self.add_documents([desired[doc_id] for doc_id in added], ids=added)
+            if removed:
+                self.delete_documents(removed)
+        logger.info("Vector store sync%s: %s", " (dry run)" if dry_run else "", diff)
+        return diff
+    
+    def _query_partitions(self, vectors: List[List[float]], k: int,
+                          wheres: List[Optional[Dict[str, str]]],
+                          routes: List[Optional[Dict[str, str]]]) -> List[List[QueryHit]]:
+        """
+        Run already-embedded queries against their partitions.
+        
+        Queries bound for the same partition with the same filter share a single
+        backend call; results from several partitions are merged by distance.
+        """
+        groups: Dict[Tuple[str, Tuple], List[int]] = {}
+        fan_out = []
+        for position, (where, route) in enumerate(zip(wheres, routes)):
+            names = self.router.route(where, route)
+            fan_out.append(len(names))
+            for name in names:
+                groups.setdefault((name, tuple(sorted((where or {}).items()))), []).append(position)
+        
+        hits = [[] for _ in vectors]
+        for (name, where_items), positions in groups.items():
+            found = self.partitions[name].query([vectors[p] for p in positions], k=k,
+                                                where=dict(where_items) or None)
+            for position, query_hits in zip(positions, found):
+                hits[position].extend(query_hits)
+        
+        for position, query_hits in enumerate(hits):
+            if fan_out[position] > 1:
+                hits[position] = sorted(query_hits, key=lambda hit: hit[3])[:k]
+        
+        active = current_span()
+        if active is not None:
+            active.set_attribute("partitions", max(fan_out, default=0))
+            active.set_attribute("backend_calls", len(groups))
+        return hits
+    
+    def _query_unseen(self, vectors: List[List[float]], k: int,
+                      wheres: List[Optional[Dict[str, str]]],
+                      routes: List[Optional[Dict[str, str]]],
+                      excludes: List[Optional[Container[str]]]) -> List[List[QueryHit]]:
+        """
+        _query_partitions, dropping hits whose IDs are excluded (e.g. a learner's seen questions).
+        
+        Queries left with fewer than k hits are searched again with SEEN_OVERFETCH_FACTOR
+        times as many candidates, up to SEEN_MAX_CANDIDATES, until they have k or the
+        partition runs out. Most lookups finish in the first round.
+        """
+        results: List[List[QueryHit]] = [[] for _ in vectors]
+        pending = list(range(len(vectors)))
+        fetch = k
+        while pending:
+            found = self._query_partitions([vectors[p] for p in pending], fetch,
+                                           [wheres[p] for p in pending], [routes[p] for p in pending])
+            short = []
+            for position, hits in zip(pending, found):
+                exclude = excludes[position]
+                unseen = [hit for hit in hits if exclude is None or hit[0] not in exclude]
+                SEEN_SKIPPED.inc(len(hits) - len(unseen))
+                results[position] = unseen[:k]
+                if len(unseen) < k and len(hits) >= fetch and fetch < SEEN_MAX_CANDIDATES:
+                    short.append(position)
+            if short:
+                SEEN_OVERFETCH_SEARCHES.inc(len(short))
+            pending = short
+            fetch = min(fetch * SEEN_OVERFETCH_FACTOR, SEEN_MAX_CANDIDATES)
+        return results
+    
+    @traced("vector_store.search")
+    def search(self, query: str, k: int = 3, where: Optional[Dict[str, str]] = None,
+               route: Optional[Dict[str, str]] = None) -> List[Document]:
         """
         Search for documents similar to the query.
         
         Args:
             query: The search query
             k: Number of results to return
+            where: Optional metadata equality filters, e.g. {"type": "question"}
+            route: Optional partition hints, e.g. {"subject": "math"}; unlike `where`
+                they only narrow which partitions are searched
             
         Returns:
             List of similar documents
         """
-        logger.debug(f"Searching vector store for: {query}")
-        results = self.vector_store.similarity_search(query, k=k)
-        logger.debug(f"Found {len(results)} results for query: {query}")
+        logger.debug("Searching vector store for: %s", query)
+        if not self.router.route(where, route):
+            return []
+        hits = self._query_partitions([embeddings.embed_query(query)], k, [where], [route])[0]
+        results = [Document(page_content=text, metadata=metadata, id=doc_id) for doc_id, text, metadata, _ in hits]
+        logger.debug("Found %s results for query: %s", len(results), query)
+        return results
+    
+    @traced("vector_store.search_many")
+    def search_many(self, queries: List[str], k: int = 3,
+                    wheres: Optional[List[Optional[Dict[str, str]]]] = None,
+                    routes: Optional[List[Optional[Dict[str, str]]]] = None) -> List[List[Document]]:
+        """
+        Search for several queries at once.
+        
+        All queries are embedded in one batched model call (cache hits are skipped)
+        and queries sharing a partition and filter go to the backend together.
+        
+        Args:
+            queries: The search queries
+            k: Number of results to return per query
+            wheres: Optional metadata filters, one per query (None for no filter)
+            routes: Optional partition hints, one per query
+            
+        Returns:
+            One list of documents per query, in query order
+        """
+        wheres = wheres if wheres is not None else [None] * len(queries)
+        routes = routes if routes is not None else [None] * len(queries)
+        if not len(queries) == len(wheres) == len(routes):
+            raise ValueError("queries, wheres and routes must have the same length")
+        if not queries:
+            return []
+        logger.debug("Searching vector store for %s queries", len(queries))
+        hits = self._query_partitions(embeddings.embed_queries(queries), k, wheres, routes)
+        return [
+            [Document(page_content=text, metadata=metadata, id=doc_id) for doc_id, text, metadata, _ in query_hits]
+            for query_hits in hits
+        ]
+    
+    @traced("vector_store.search_hybrid_many")
+    def search_hybrid_many(self, queries: List[str], k: int = 3,
+                           wheres: Optional[List[Optional[Dict[str, str]]]] = None,
+                           routes: Optional[List[Optional[Dict[str, str]]]] = None,
+                           mode: str = RETRIEVAL_MODE,
+                           excludes: Optional[List[Optional[Container[str]]]] = None) -> List[List[Document]]:
+        """
+        Keyword and vector search combined.
+        
+        Each query is first run against the BM25 index, restricted to documents
+        matching its filter. When at least k hits contain every query term
+        (LEXICAL_MIN_COVERAGE), they are returned without embedding the query.
+        The remaining queries go through one batched vector search and their
+        two rankings are merged with reciprocal rank fusion.
+        
+        Args:
+            queries: The search queries
+            k: Number of results to return per query
+            wheres: Optional metadata filters, one per query
+            routes: Optional partition hints for the vector search, one per query
+            mode: "hybrid", "lexical" (BM25 only) or "vector" (search_many only)
+            excludes: Optional document IDs to leave out, one container per query;
+                the searches over-fetch until they have k documents outside it
+            
+        Returns:
+            One list of documents per query, in query order
+        """
+        wheres = wheres if wheres is not None else [None] * len(queries)
+        routes = routes if routes is not None else [None] * len(queries)
+        excludes = excludes if excludes is not None else [None] * len(queries)
+        if mode == "vector" or not self.metadata_index.ready:
+            HYBRID_SEARCH_PATHS.labels(path="vector").inc(len(queries))
+            if not any(exclude is not None for exclude in excludes):
+                return self.search_many(queries, k=k, wheres=wheres, routes=routes)
+            hits = self._query_unseen(embeddings.embed_queries(queries), k, wheres, routes, excludes)
+            return [[Document(page_content=text, metadata=metadata, id=doc_id) for doc_id, text, metadata, _ in query_hits]
+                    for query_hits in hits]
+        
+        candidates_k = max(k, 20)
+        results: List[List[Document]] = [[] for _ in queries]
+        lexical_rankings: List[List[str]] = [[] for _ in queries]
+        ambiguous = []
+        for position, (query, where, exclude) in enumerate(zip(queries, wheres, excludes)):
+            # Filtered and excluded documents never enter the BM25 ranking
+            filters = self.metadata_index.posting_sets(where) if where else []
+            hits = self.lexical_index.search(query, candidates_k, filters, exclude) if filters is not None else []
+            lexical_rankings[position] = [doc_id for doc_id, _, _ in hits]
+            confident = [doc_id for doc_id, _, coverage in hits if coverage >= LEXICAL_MIN_COVERAGE]
+            if mode == "lexical" or len(confident) >= k:
+                chosen = confident[:k] if len(confident) >= k else lexical_rankings[position][:k]
+                results[position] = [self.metadata_index.get(doc_id) for doc_id in chosen]
+            else:
+                ambiguous.append(position)
+        HYBRID_SEARCH_PATHS.labels(path="lexical").inc(len(queries) - len(ambiguous))
+        if not ambiguous:
+            return results
+        
+        HYBRID_SEARCH_PATHS.labels(path="fused").inc(len(ambiguous))
+        vector_hits = self._query_unseen(
+            embeddings.embed_queries([queries[p] for p in ambiguous]), candidates_k,
+            [wheres[p] for p in ambiguous], [routes[p] for p in ambiguous], [excludes[p] for p in ambiguous])
+        for position, hits in zip(ambiguous, vector_hits):
+            documents = {doc_id: Document(page_content=text, metadata=metadata, id=doc_id)
+                         for doc_id, text, metadata, _ in hits}
+            fused = reciprocal_rank_fusion([lexical_rankings[position], [hit[0] for hit in hits]], k, RRF_K)
+            results[position] = [documents.get(doc_id) or self.metadata_index.get(doc_id) for doc_id in fused]
         return results
     
+    @traced("vector_store.search_questions_many")
+    def search_questions_many(self, requests: List[Tuple[str, str]], k: int = 3,
+                              routes: Optional[List[Optional[Dict[str, str]]]] = None,
+                              exclude: Optional[Container[str]] = None) -> List[List[Document]]:
+        """
+        Find questions for several (topic, difficulty) pairs at once.
+        
+        Each pair is answered from the metadata index when it has k exact topic
+        and difficulty matches; the rest share one search_hybrid_many call,
+        searching by topic within the requested difficulty, and keep whatever
+        exact matches they had first.
+        
+        Args:
+            requests: (topic, difficulty) pairs
+            k: Number of questions to return per pair
+            routes: Optional partition hints (e.g. the learner's subject and grade), one per pair
+            exclude: Optional question IDs to leave out (e.g. the learner's seen questions); a pair
+                with fewer than k unseen exact matches is topped up by the search
+            
+        Returns:
+            One list of question documents per pair, in request order
+        """
+        routes = routes if routes is not None else [None] * len(requests)
+        results: List[List[Document]] = [[] for _ in requests]
+        misses = []
+        for position, (topic, difficulty) in enumerate(requests):
+            if self.metadata_index.ready:
+                ids = self.metadata_index.lookup_ids({"type": "question", "topic": topic, "difficulty": difficulty})
+                if not ids:
+                    misses.append(position)
+                    continue
+                if exclude is not None:
+                    unseen = [doc_id for doc_id in ids if doc_id not in exclude]
+                    SEEN_SKIPPED.inc(len(ids) - len(unseen))
+                    ids = unseen
+                results[position] = [self.metadata_index.get(doc_id) for doc_id in ids[:k]]
+                if len(ids) < k:
+                    # Too few unseen exact matches: the search fills the rest, after them
+                    misses.append(position)
+            else:
+                misses.append(position)
+        if misses:
+            found = self.search_hybrid_many(
+                [requests[p][0] for p in misses],
+                k=k,
+                wheres=[{"type": "question", "difficulty": requests[p][1].lower()} for p in misses],
+                routes=[routes[p] for p in misses],
+                excludes=[exclude] * len(misses),
+            )
+            for position, documents in zip(misses, found):
+                exact = {doc.id for doc in results[position]}
+                results[position].extend(doc for doc in documents if doc.id not in exact)
+                del results[position][k:]
+        logger.debug("Answered %s question lookups, %s by search", len(requests), len(misses))
+        return results
+    
+    @traced("vector_store.search_by_metadata")
     def search_by_metadata(self, 
                           grade: Optional[str] = None, 
                           subject: Optional[str] = None, 
                           topic: Optional[str] = None,
-                          k: int = 3) -> List[Document]:
+                          k: int = 3,
+                          doc_type: Optional[str] = None,
+                          difficulty: Optional[str] = None) -> List[Document]:
         """
-        Search for documents by metadata filters.
+        Look up documents by exact metadata values, without embedding a query.
+        
+        Values are normalized with metadata_key ("Periodic Table" -> "periodic_table")
+        for both the metadata index and the backend filter used while the index is not
+        loaded. The index matches stored values in any spelling; the backend filter only
+        matches values stored in normalized form, as data.py stores them. Results are
+        the first k matches in insertion order (a document's chunks in sequence), so
+        repeated calls return the same documents.
         
         Args:
             grade: Grade level filter
             subject: Subject filter
             topic: Topic filter
             k: Number of results to return
+            doc_type: Document type filter ("content" or "question")
+            difficulty: Question difficulty filter
             
         Returns:
             List of matching documents
@@ -72,67 +888,83 @@ class VectorStore:
         # Create a dictionary for the filter
         filter_conditions = {}
         
+        if doc_type:
+            filter_conditions["type"] = metadata_key(doc_type)
         if grade:
-            filter_conditions["grade"] = grade.lower()
+            filter_conditions["grade"] = metadata_key(grade)
         if subject:
-            filter_conditions["subject"] = subject.lower()
+            filter_conditions["subject"] = metadata_key(subject)
         if topic:
-            filter_conditions["topic"] = topic.lower()
-        
-        if filter_conditions:
-            # Revert to using $and for multiple equality conditions if needed by the backend
-            # Although Langchain docs often show simple dicts, the error suggests $and might be required.
-            if len(filter_conditions) > 1:
-                final_filter = {"$and": [{k: v} for k, v in filter_conditions.items()]}
-            elif len(filter_conditions) == 1:
-                # If only one condition, use a simple dictionary
-                key, value = list(filter_conditions.items())[0]
-                final_filter = {key: value}
-            else: # Should not happen based on the if condition, but for safety
-                final_filter = None 
-                
-            if final_filter:
-                logger.debug(f"Searching vector store with metadata filter: {final_filter}")
-            else:
-                logger.warning("Filter conditions were present but final filter is None")
-                # Fallback or handle error? For now, proceed to general search
-                metadata_filter = None # Set to None to trigger else block below
-                final_filter = None # Ensure it's None
-        else:
-            final_filter = None
-        
-        if final_filter:
-            
-            try:
-                # Langchain Chroma's similarity_search uses the 'filter' argument
-                results = self.vector_store.similarity_search(
-                    query="",  # Empty query to match based on filters
-                    k=k,
-                    filter=final_filter
-                )
-                logger.debug(f"Found {len(results)} results with metadata filters")
-                return results
-            except Exception as e:
-                logger.error(f"Error searching with metadata filter: {str(e)}")
-                logger.info("Falling back to semantic search")
-                # Fallback to regular search
-                query = f"{grade or ''} {subject or ''} {topic or ''}".strip()
-                return self.search(query, k=k)
-        else:
+            filter_conditions["topic"] = metadata_key(topic)
+        if difficulty:
+            filter_conditions["difficulty"] = metadata_key(difficulty)
+        
+        if not filter_conditions:
             # If no filters, just return top documents
             logger.debug("No metadata filters provided, using general search")
-            results = self.vector_store.similarity_search("education content", k=k)
-            logger.debug(f"Found {len(results)} results with general search")
+            results = self.search("education content", k=k)
+            logger.debug("Found %s results with general search", len(results))
             return results
+        
+        if self.metadata_index.ready:
+            results = self.metadata_index.lookup(filter_conditions, k=k)
+            logger.debug("Found %s results in metadata index for %s", len(results), filter_conditions)
+            return results
+        
+        # Index not loaded: let the backend apply the filter directly, still without embedding a query
+        logger.debug("Looking up documents with metadata filter: %s", filter_conditions)
+        try:
+            results = []
+            for name in self.router.route(filter_conditions):
+                found = self.partitions[name].get(where=filter_conditions, limit=k - len(results))
+                results.extend(
+                    Document(page_content=text, metadata=metadata, id=doc_id)
+                    for doc_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"])
+                )
+                if len(results) >= k:
+                    break
+            logger.debug("Found %s results with metadata filters", len(results))
+            return results
+        except Exception as e:
+            logger.error("Error searching with metadata filter: %s", e)
+            logger.info("Falling back to semantic search")
+            # Fallback to regular search
+            query = f"{grade or ''} {subject or ''} {topic or ''}".strip()
+            return self.search(query, k=k)
+    
+    def precompute_query_embeddings(self, texts: List[str]) -> int:
+        """Warm the query embedding cache with texts expected at runtime."""
+        return embeddings.precompute(texts)
     
+    @traced("vector_store.get_collection_stats")
     def get_collection_stats(self) -> Dict:
         """Get statistics about the collection."""
         try:
-            count = self.vector_store._collection.count()
-            return {"document_count": count}
+            counts = {name: backend.count() for name, backend in sorted(self.partitions.items())}
+            return {
+                "document_count": sum(counts.values()),
+                "partitions": counts,
+                "embedding_cache": embeddings.stats(),
+                "snapshot": self.snapshot,
+            }
         except Exception as e:
-            logger.error(f"Error getting collection stats: {str(e)}")
+            logger.error("Error getting collection stats: %s", e)
             return {"document_count": 0, "error": str(e)}
 
-# Create a singleton instance
-vector_store = VectorStore() 
\ No newline at end of file
+def live_directory() -> str:
+    """Directory of the index to serve: the current snapshot or the current store version."""
+    if VECTOR_SNAPSHOT_DIR:
+        from snapshot import resolve_snapshot
+        return resolve_snapshot(VECTOR_SNAPSHOT_DIR)
+    return store_directory(VECTOR_STORE_DIR)
+
+def open_vector_store() -> VectorStore:
+    """The configured store: a read-only index snapshot if VECTOR_SNAPSHOT_DIR is set, else the live store."""
+    if VECTOR_SNAPSHOT_DIR:
+        from snapshot import load_snapshot
+        return load_snapshot(VECTOR_SNAPSHOT_DIR, expected_version=VECTOR_SNAPSHOT_VERSION or None,
+                             verify_checksums=VECTOR_SNAPSHOT_VERIFY_CHECKSUMS)
+    return VectorStore(directory=live_directory())
+
+# Create the singleton on first use; opening it runs migrations and loads the indexes
+vector_store = Lazy(open_vector_store, "vector_store")
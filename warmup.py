@@ -0,0 +1,78 @@
+"""
+Worker warm-up and readiness.
+
+Importing the app no longer loads the embedding model, opens the vector store
+or builds the LLM chains (see lazy.py), so a worker can answer /healthz right
+after it starts. warm_up() then does that work up front: fill the vector
+store, embed one uncached query end to end (model, batcher, index search) so
+the first learner does not pay for it, and build every chain. /readyz reports
+ready once it has finished.
+
+gunicorn.conf.py starts it in a background thread in each worker; app.py does
+the same for the development server.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict
+
+from config import USE_VECTOR_STORE, WARMUP_QUERY
+from logger import logger
+
+_lock = threading.Lock()
+_state: Dict[str, Any] = {"status": "pending", "error": None, "steps": {}, "pid": None}
+
+
+@contextmanager
+def _step(name: str):
+    start = time.perf_counter()
+    yield
+    _state["steps"][name] = round(time.perf_counter() - start, 3)
+
+
+def warm_up() -> bool:
+    """Initialize everything the first request would otherwise initialize; returns True when ready."""
+    from chains import ALL_CHAINS
+
+    _state.update(status="warming", error=None, steps={})
+    start = time.perf_counter()
+    try:
+        if USE_VECTOR_STORE:
+            from data import ensure_vector_store_initialized
+            from vector_store import vector_store
+
+            with _step("vector_store"):
+                if not ensure_vector_store_initialized():
+                    logger.warning("Vector store data failed to load during warm-up; retrieval will use mock data")
+            with _step("query_embedding"):
+                vector_store.search(WARMUP_QUERY, k=1)
+        with _step("chains"):
+            for chain in ALL_CHAINS:
+                chain.chain.get()
+    except Exception as e:
+        logger.error("Warm-up failed: %s", e, exc_info=True)
+        _state.update(status="failed", error=str(e))
+        return False
+    _state.update(status="ready")
+    logger.info("Warm-up finished in %.2fs: %s", time.perf_counter() - start, _state["steps"])
+    return True
+
+
+def start_warm_up() -> None:
+    """Run warm_up() in a background thread, once per process."""
+    with _lock:
+        if _state["pid"] == os.getpid():
+            return
+        _state["pid"] = os.getpid()
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+
+def is_ready() -> bool:
+    return _state["status"] == "ready"
+
+
+def status() -> Dict[str, Any]:
+    """Warm-up status for the readiness probe."""
+    return {"status": _state["status"], "error": _state["error"], "steps": dict(_state["steps"])}